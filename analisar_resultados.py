@@ -4,229 +4,259 @@ Script para analisar os resultados das comparações entre LLMs
 """
 
 import os
-import json
-import glob
+import re
 from datetime import datetime
+import numpy as np
 import pandas as pd
+from tracing import STAGES
+from results_store import ARMS, ResultsStore
+
+RESULTS_DB = "resultados/resultados.sqlite"
+BRACOS = {"llm_3b_sem_rag": "LLM 3B (sem RAG)", "llm_1b_com_rag": "LLM 1B (com RAG)"}
+SUFIXOS = {"llm_3b_sem_rag": "3b", "llm_1b_com_rag": "1b"}
 
 def carregar_resultados():
-    """Carrega todos os resultados salvos"""
-    resultados = []
-    
+    """Carrega todas as respostas da base de resultados (uma linha por resposta).
+
+    Arquivos resultados/comparacao_*.json de versões anteriores são
+    importados para a base na primeira vez em que aparecem.
+    """
     if not os.path.exists("resultados"):
         print("❌ Pasta 'resultados' não encontrada!")
-        return resultados
-    
-    arquivos = glob.glob("resultados/comparacao_*.json")
-    
-    if not arquivos:
-        print("❌ Nenhum arquivo de resultado encontrado!")
-        return resultados
-    
-    print(f"📁 Encontrados {len(arquivos)} arquivos de resultado")
-    
-    for arquivo in arquivos:
-        try:
-            with open(arquivo, "r", encoding="utf-8") as f:
-                resultado = json.load(f)
-                resultados.append(resultado)
-        except Exception as e:
-            print(f"❌ Erro ao carregar {arquivo}: {str(e)}")
-    
-    return resultados
-
-def analisar_tempos(resultados):
-    """Analisa os tempos de resposta"""
+        return pd.DataFrame()
+
+    store = ResultsStore(RESULTS_DB)
+    try:
+        arquivos, respostas = store.import_json_files()
+        if arquivos:
+            print(f"📥 {arquivos} arquivos JSON antigos importados ({respostas} respostas)")
+        df = store.to_dataframe()
+    finally:
+        store.close()
+
+    if df.empty:
+        print("❌ Nenhum resultado encontrado!")
+        return df
+
+    print(f"📁 {df['resultado'].nunique()} resultados ({len(df)} respostas) "
+          f"de {df['execucao'].nunique()} execuções em {RESULTS_DB}")
+    return df
+
+def resumo_tempos(tempos):
+    """Média, percentis e extremos de uma série de tempos (em segundos)"""
+    return pd.Series({
+        "Média": tempos.mean(),
+        "p50": tempos.quantile(0.50),
+        "p95": tempos.quantile(0.95),
+        "p99": tempos.quantile(0.99),
+        "Mínimo": tempos.min(),
+        "Máximo": tempos.max(),
+    })
+
+def analisar_tempos(df):
+    """Analisa os tempos de resposta ponta a ponta"""
     print("\n⏱️  ANÁLISE DE TEMPOS DE RESPOSTA")
     print("=" * 50)
-    
-    if not resultados:
+
+    if df.empty:
         print("❌ Nenhum resultado para analisar")
         return
-    
-    tempos_3b = []
-    tempos_1b = []
-    
-    for resultado in resultados:
-        tempo_3b = resultado.get("llm_3b_sem_rag", {}).get("tempo", 0)
-        tempo_1b = resultado.get("llm_1b_com_rag", {}).get("tempo", 0)
-        
-        if tempo_3b > 0 and tempo_1b > 0:
-            tempos_3b.append(tempo_3b)
-            tempos_1b.append(tempo_1b)
-    
-    if not tempos_3b:
+
+    # Só comparações em que os dois braços têm tempo válido
+    validos = df[df["tempo_ponta_a_ponta"] > 0]
+    validos = validos[validos.groupby("resultado")["braco"].transform("nunique") == len(ARMS)]
+
+    if validos.empty:
         print("❌ Nenhum dado de tempo válido encontrado")
         return
-    
-    print(f"📊 Total de comparações válidas: {len(tempos_3b)}")
-    print(f"\n🕐 LLM 3B (sem RAG):")
-    print(f"   Média: {sum(tempos_3b)/len(tempos_3b):.2f}s")
-    print(f"   Mínimo: {min(tempos_3b):.2f}s")
-    print(f"   Máximo: {max(tempos_3b):.2f}s")
-    
-    print(f"\n🕐 LLM 1B (com RAG):")
-    print(f"   Média: {sum(tempos_1b)/len(tempos_1b):.2f}s")
-    print(f"   Mínimo: {min(tempos_1b):.2f}s")
-    print(f"   Máximo: {max(tempos_1b):.2f}s")
-    
+
+    print(f"📊 Total de comparações válidas: {validos['resultado'].nunique()} (tempos ponta a ponta)")
+    estatisticas = validos.groupby("braco")["tempo_ponta_a_ponta"].apply(resumo_tempos).unstack()
+    for braco in ARMS:
+        print(f"\n🕐 {BRACOS[braco]}:")
+        for nome, valor in estatisticas.loc[braco].items():
+            print(f"   {nome}: {valor:.2f}s")
+
     # Comparação
-    media_3b = sum(tempos_3b)/len(tempos_3b)
-    media_1b = sum(tempos_1b)/len(tempos_1b)
-    
+    media_3b = estatisticas.loc["llm_3b_sem_rag", "Média"]
+    media_1b = estatisticas.loc["llm_1b_com_rag", "Média"]
+
     print(f"\n⚡ COMPARAÇÃO:")
     print(f"   Diferença média: {abs(media_3b - media_1b):.2f}s")
-    
+
     if media_1b < media_3b:
         print(f"   🏆 LLM 1B com RAG é {((media_3b - media_1b)/media_3b)*100:.1f}% mais rápida!")
     else:
         print(f"   🏆 LLM 3B sem RAG é {((media_1b - media_3b)/media_1b)*100:.1f}% mais rápida!")
 
-def analisar_perguntas(resultados):
+def analisar_execucoes(df):
+    """Compara as execuções (sessões do machado_rag.py e rodadas do avaliador)"""
+    print("\n🗂️  ANÁLISE POR EXECUÇÃO")
+    print("=" * 50)
+
+    if df.empty:
+        print("❌ Nenhum resultado para analisar")
+        return
+
+    por_execucao = df.groupby(["execucao", "braco"]).agg(
+        perguntas=("resultado", "nunique"),
+        inicio=("criado_em", "min"),
+        tempo_medio=("tempo_ponta_a_ponta", "mean"),
+        tempo_p95=("tempo_ponta_a_ponta", lambda t: t.quantile(0.95)),
+        bertscore=("bertscore", "mean"),
+        tokens_prompt=("tokens_prompt", "mean"),
+    ).reset_index()
+    por_execucao["braco"] = por_execucao["braco"].map(SUFIXOS)
+    valores = ["tempo_medio", "tempo_p95", "bertscore", "tokens_prompt"]
+    tabela = por_execucao.pivot(index=["execucao", "inicio", "perguntas"], columns="braco", values=valores)
+    tabela = tabela.reindex(columns=pd.MultiIndex.from_product([valores, [SUFIXOS[b] for b in ARMS]]))
+    tabela.columns = [f"{valor}_{braco}" for valor, braco in tabela.columns]
+    tabela = tabela.reset_index().sort_values("inicio").dropna(axis=1, how="all")
+    print(tabela.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+
+def analisar_etapas(df):
+    """Mostra onde a latência de cada braço é gasta, etapa por etapa"""
+    print("\n🧭 ANÁLISE POR ETAPA")
+    print("=" * 50)
+
+    etapas = [e for e in STAGES if e in df.columns and df[e].notna().any()]
+    if not etapas:
+        print("❌ Nenhum resultado com tempos por etapa")
+        return
+
+    for braco in ARMS:
+        rastreadas = df[(df["braco"] == braco) & df[etapas].notna().any(axis=1)]
+        if rastreadas.empty:
+            continue
+        ms = rastreadas[etapas].fillna(0.0) * 1000
+        ms = ms.loc[:, (ms != 0).any()]
+        resumo = pd.DataFrame({
+            "média": ms.mean(),
+            "p50": ms.median(),
+            "p95": ms.quantile(0.95),
+            "% total": ms.sum() / ms.to_numpy().sum() * 100,
+        })
+
+        print(f"\n🕐 {BRACOS[braco]}: {len(ms)} perguntas, ponta a ponta {ms.sum(axis=1).mean():.0f}ms em média")
+        print(f"   {'etapa':<20} {'média':>9} {'p50':>9} {'p95':>9} {'% total':>8}")
+        for etapa, linha in resumo.iterrows():
+            print(f"   {etapa:<20} {linha['média']:>7.1f}ms {linha['p50']:>7.1f}ms "
+                  f"{linha['p95']:>7.1f}ms {linha['% total']:>7.1f}%")
+
+def analisar_perguntas(df):
     """Analisa as perguntas realizadas"""
     print("\n🤔 ANÁLISE DAS PERGUNTAS")
     print("=" * 50)
-    
-    if not resultados:
+
+    if df.empty:
         print("❌ Nenhum resultado para analisar")
         return
-    
-    perguntas = [r.get("pergunta", "") for r in resultados if r.get("pergunta")]
-    
+
+    perguntas = df.drop_duplicates("resultado")["pergunta"].dropna()
+    perguntas = perguntas[perguntas != ""]
+
     print(f"📝 Total de perguntas: {len(perguntas)}")
-    
-    # Categorizar perguntas
-    categorias = {
-        "personagens": 0,
-        "enredo": 0,
-        "estilo": 0,
-        "contexto": 0,
-        "outros": 0
-    }
-    
+
     palavras_chave = {
         "personagens": ["quem", "personagem", "protagonista", "antagonista", "nome"],
         "enredo": ["história", "enredo", "acontece", "final", "começo", "trama"],
         "estilo": ["estilo", "escreve", "linguagem", "técnica", "literário"],
         "contexto": ["época", "século", "histórico", "social", "brasil", "rio"]
     }
-    
-    for pergunta in perguntas:
-        pergunta_lower = pergunta.lower()
-        categorizada = False
-        
-        for categoria, palavras in palavras_chave.items():
-            if any(palavra in pergunta_lower for palavra in palavras):
-                categorias[categoria] += 1
-                categorizada = True
-                break
-        
-        if not categorizada:
-            categorias["outros"] += 1
-    
+
+    # Cada pergunta fica na primeira categoria cujas palavras-chave contém
+    minusculas = perguntas.str.lower()
+    condicoes = [minusculas.str.contains("|".join(map(re.escape, palavras))) for palavras in palavras_chave.values()]
+    categorias = pd.Series(np.select(condicoes, list(palavras_chave), default="outros"))
+    contagem = categorias.value_counts().reindex(list(palavras_chave) + ["outros"], fill_value=0)
+
     print("\n📊 Categorias de perguntas:")
-    for categoria, count in categorias.items():
-        if count > 0:
-            porcentagem = (count / len(perguntas)) * 100
-            print(f"   {categoria.title()}: {count} ({porcentagem:.1f}%)")
+    for categoria, count in contagem[contagem > 0].items():
+        porcentagem = (count / len(perguntas)) * 100
+        print(f"   {categoria.title()}: {count} ({porcentagem:.1f}%)")
 
-def exportar_para_csv(resultados):
-    """Exporta os resultados para CSV"""
+def exportar_para_csv(df):
+    """Exporta os resultados para CSV (uma linha por pergunta, colunas por braço)"""
     print("\n📊 EXPORTANDO PARA CSV")
     print("=" * 50)
-    
-    if not resultados:
+
+    if df.empty:
         print("❌ Nenhum resultado para exportar")
         return
-    
-    dados = []
-    
-    for resultado in resultados:
-        dados.append({
-            "timestamp": resultado.get("timestamp", ""),
-            "pergunta": resultado.get("pergunta", ""),
-            "modelo_3b": resultado.get("llm_3b_sem_rag", {}).get("modelo", ""),
-            "resposta_3b": resultado.get("llm_3b_sem_rag", {}).get("resposta", ""),
-            "tempo_3b": resultado.get("llm_3b_sem_rag", {}).get("tempo", 0),
-            "modelo_1b": resultado.get("llm_1b_com_rag", {}).get("modelo", ""),
-            "resposta_1b": resultado.get("llm_1b_com_rag", {}).get("resposta", ""),
-            "tempo_1b": resultado.get("llm_1b_com_rag", {}).get("tempo", 0)
-        })
-    
-    df = pd.DataFrame(dados)
-    
+
+    comuns = ["execucao", "origem", "criado_em", "pergunta", "resposta_referencia"]
+    por_braco = [c for c in df.columns if c not in comuns + ["resultado", "braco"]]
+    largo = df.pivot(index="resultado", columns="braco", values=por_braco)
+    largo = largo.reindex(columns=pd.MultiIndex.from_product([por_braco, ARMS]))
+    largo.columns = [f"{coluna}_{SUFIXOS.get(braco, braco)}" for coluna, braco in largo.columns]
+    largo = largo.dropna(axis=1, how="all")
+    dados = df.drop_duplicates("resultado").set_index("resultado")[comuns].join(largo)
+    dados = dados.rename(columns={"criado_em": "timestamp"})
+
     # Criar pasta se não existir
     os.makedirs("analises", exist_ok=True)
-    
+
     # Salvar CSV
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     arquivo_csv = f"analises/resultados_comparacao_{timestamp}.csv"
-    
-    df.to_csv(arquivo_csv, index=False, encoding="utf-8")
+
+    dados.to_csv(arquivo_csv, index=False, encoding="utf-8")
     print(f"✅ Resultados exportados para: {arquivo_csv}")
-    
+
     return arquivo_csv
 
-def mostrar_estatisticas_gerais(resultados):
+def mostrar_estatisticas_gerais(df):
     """Mostra estatísticas gerais dos resultados"""
     print("\n📈 ESTATÍSTICAS GERAIS")
     print("=" * 50)
-    
-    if not resultados:
+
+    if df.empty:
         print("❌ Nenhum resultado para analisar")
         return
-    
+
     print(f"📅 Período de testes:")
-    timestamps = [r.get("timestamp", "") for r in resultados if r.get("timestamp")]
-    
-    if timestamps:
-        timestamps.sort()
-        print(f"   Primeiro teste: {timestamps[0]}")
-        print(f"   Último teste: {timestamps[-1]}")
-    
-    print(f"\n📊 Total de comparações: {len(resultados)}")
-    
-    # Contar modelos usados
-    modelos_3b = set()
-    modelos_1b = set()
-    
-    for resultado in resultados:
-        modelo_3b = resultado.get("llm_3b_sem_rag", {}).get("modelo", "")
-        modelo_1b = resultado.get("llm_1b_com_rag", {}).get("modelo", "")
-        
-        if modelo_3b:
-            modelos_3b.add(modelo_3b)
-        if modelo_1b:
-            modelos_1b.add(modelo_1b)
-    
+    timestamps = df["criado_em"].dropna()
+
+    if not timestamps.empty:
+        print(f"   Primeiro teste: {timestamps.min()}")
+        print(f"   Último teste: {timestamps.max()}")
+
+    print(f"\n📊 Total de comparações: {df['resultado'].nunique()}")
+    print(f"🗂️  Execuções: {df['execucao'].nunique()}")
+
+    # Modelos usados em cada braço
+    modelos = df.dropna(subset=["modelo"]).groupby("braco")["modelo"].unique()
+
     print(f"\n🤖 Modelos utilizados:")
-    print(f"   LLM 3B: {', '.join(modelos_3b) if modelos_3b else 'Nenhum'}")
-    print(f"   LLM 1B: {', '.join(modelos_1b) if modelos_1b else 'Nenhum'}")
+    print(f"   LLM 3B: {', '.join(modelos.get('llm_3b_sem_rag', [])) or 'Nenhum'}")
+    print(f"   LLM 1B: {', '.join(modelos.get('llm_1b_com_rag', [])) or 'Nenhum'}")
 
 def main():
     """Função principal"""
     print("📊 ANALISADOR DE RESULTADOS - TESTE COMPARATIVO LLMs")
     print("=" * 60)
-    
+
     # Carregar resultados
-    resultados = carregar_resultados()
-    
-    if not resultados:
+    df = carregar_resultados()
+
+    if df.empty:
         print("\n❌ Nenhum resultado encontrado para análise.")
         print("💡 Execute primeiro o script machado_rag.py para gerar resultados.")
         return
-    
+
     # Análises
-    mostrar_estatisticas_gerais(resultados)
-    analisar_tempos(resultados)
-    analisar_perguntas(resultados)
-    
+    mostrar_estatisticas_gerais(df)
+    analisar_tempos(df)
+    analisar_execucoes(df)
+    analisar_etapas(df)
+    analisar_perguntas(df)
+
     # Exportar para CSV
-    arquivo_csv = exportar_para_csv(resultados)
-    
+    arquivo_csv = exportar_para_csv(df)
+
     print(f"\n🎉 Análise concluída!")
     if arquivo_csv:
         print(f"📄 Dados detalhados disponíveis em: {arquivo_csv}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
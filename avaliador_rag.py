@@ -1,54 +1,141 @@
 # avaliador_rag.py - Comparação entre LLM 3B vs LLM 1B + RAG
 
 import pandas as pd
-import requests
 import time
 import json
 import os
-from bert_score import score as bertscore
-from sentence_transformers import SentenceTransformer
-import faiss
+import sys
+import hashlib
+import requests
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import numpy as np
 from tqdm import tqdm
-from utils import load_documents, create_embeddings, search_similar_chunks
+from utils import Retriever, run_concurrently
+import vector_index
+from ollama_client import OllamaClient
+from response_cache import ResponseCache
+from bert_scorer import CachedBERTScorer
+from results_store import ResultsStore, new_run_id
+from tracing import Trace
+from context_packing import estimate_tokens, pack_context
+from retrieval_client import RemoteRetriever
+import lexical_index
+import binary_index
 
 # CONFIGURAÇÕES
 DATA_DIR = "/home/umbelito/rag_machado_de_assis/obras/raw/txt"
-CATEGORIAS = ["romance", "cronica"]
+CATEGORIAS = ["romance", "cronica"]  # None = todas as categorias de DATA_DIR
+INGESTION_WORKERS = None  # processos para ler/dividir o corpus (None = todos os núcleos)
+EMBEDDING_WORKERS = 1  # processos que geram embeddings ao construir o índice
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 INDEX_PATH = "index/faiss_index.bin"
-METADATA_PATH = "embeddings/metadata.json"
+CHUNKS_PATH = "embeddings/chunks.bin"
 OLLAMA_URL = "http://localhost:11434/api/generate"
+OLLAMA_STREAM = True  # recebe os tokens à medida que são gerados (mede o primeiro token)
+OLLAMA_CONNECT_TIMEOUT = 5  # segundos
+OLLAMA_READ_TIMEOUT = 120  # segundos sem receber dados do servidor
+OLLAMA_RETRIES = 2  # novas tentativas em falhas de conexão/timeout/5xx
+
+# ÍNDICE FAISS: string do faiss.index_factory ou preset de vector_index.INDEX_PRESETS
+# ("flat", "ivf_flat", "ivf_pq", "hnsw"). nprobe/ef_search valem na consulta.
+INDEX_CONFIG = {"factory": "Flat", "nprobe": 16, "ef_search": 64}
 
 # MODELOS PARA COMPARAÇÃO
 LLM_3B_MODEL = "llama2"  # LLM de 3B parâmetros (sem RAG)
 LLM_1B_MODEL = "tinyllama"  # LLM de 1B parâmetros (com RAG)
 TOP_K = 5
+QUERY_CACHE_SIZE = 1024  # embeddings de perguntas mantidos em cache (LRU)
 
-def load_or_create_index():
-    """Carrega ou cria o índice FAISS para RAG"""
-    if os.path.exists(INDEX_PATH) and os.path.exists(METADATA_PATH):
-        print("\n✅ Índice FAISS encontrado. Carregando...")
-        index = faiss.read_index(INDEX_PATH)
-        with open(METADATA_PATH, "r", encoding="utf-8") as f:
-            metadata = json.load(f)
-        return index, metadata
+# CONTEXTO DO PROMPT RAG: orçamento de tokens (estimados) do prompt inteiro por
+# modelo; trechos quase idênticos (cosseno >= CONTEXT_DEDUP_THRESHOLD) entram
+# uma vez só. CONTEXT_MMR_LAMBDA (ex.: 0.7) reordena os trechos por MMR,
+# trocando relevância por diversidade; None mantém a ordem da busca.
+CONTEXT_TOKEN_BUDGET = {"tinyllama": 1536, "llama2": 3072}
+CONTEXT_DEFAULT_BUDGET = 2048
+CONTEXT_DEDUP_THRESHOLD = 0.95
+CONTEXT_MMR_LAMBDA = None
+
+# SERVIDOR DE RECUPERAÇÃO (servidor_recuperacao.py): com a URL, o índice e o
+# modelo de embeddings já carregados no servidor são usados em vez de carregados
+# aqui. None = índice local (também usado se o servidor não responder).
+RETRIEVAL_SERVICE_URL = None  # ex.: "http://127.0.0.1:8765"
+
+# BUSCA HÍBRIDA: índice BM25 sobre os mesmos trechos, combinado ao FAISS por RRF
+HYBRID_SEARCH = True
+LEXICAL_PATH = "embeddings/bm25.bin"
+HYBRID_CANDIDATES = 20  # candidatos de cada busca (densa e lexical) antes da fusão
+
+# BUSCA EM DOIS ESTÁGIOS: varre uma cópia binária dos vetores (1 bit por dimensão,
+# 32x menor) por distância de Hamming e reordena os RERANK_CANDIDATES mais
+# próximos pela distância exata no índice FAISS. Exige índice sem IVF (ex.: Flat).
+TWO_STAGE_SEARCH = False
+BINARY_INDEX_PATH = "index/faiss_index.binary.bin"
+RERANK_CANDIDATES = 256
+
+# Filtro de busca por shard, ex.: {"categoria": "romance"} ou {"arquivo": "domCasmurro.txt"}
+SEARCH_FILTERS = {}
+
+# Gera as respostas dos dois braços (3B sem RAG e 1B com RAG) ao mesmo tempo;
+# exige que o Ollama mantenha os dois modelos carregados (OLLAMA_MAX_LOADED_MODELS >= 2).
+# Desativado por padrão: os dois modelos disputando a máquina mudam os tempos medidos
+CONCURRENT_ARMS = False
+
+# EXECUÇÃO DA AVALIAÇÃO
+# Perguntas lidas de CSVs com as colunas "pergunta" e "resposta_referencia"
+# (ex.: ["avaliacao.csv"]); arquivos passados na linha de comando têm
+# prioridade. Lista vazia = perguntas de criar_perguntas_teste.
+PERGUNTAS_CSV = []
+EVAL_CONCURRENCY = 2  # perguntas em andamento ao mesmo tempo (cada uma com dois braços)
+QUESTION_TIMEOUT = 300  # segundos máximos por geração
+QUESTION_RETRIES = 1  # novas tentativas de uma geração que falhou
+RETRIEVAL_BATCH = 256  # perguntas recuperadas por chamada a search_batch
+# Cada resultado é acrescentado aqui ao terminar; uma nova execução com a mesma
+# configuração pula as perguntas já respondidas. O arquivo é apagado quando
+# todas as perguntas foram avaliadas e os resultados salvos.
+PROGRESS_PATH = "resultados/avaliacao_progresso.jsonl"
+RESULTS_DB = "resultados/resultados.sqlite"  # resultados de todas as execuções (ver analisar_resultados.py)
 
-    print("\n🔧 Construindo índice FAISS...")
-    docs, metadata = load_documents(DATA_DIR, CATEGORIAS)
-    model = SentenceTransformer(EMBEDDING_MODEL)
-    embeddings = create_embeddings(docs, model)
+# CACHE DE RESPOSTAS: gerações anteriores do mesmo (modelo, prompt, opções) são
+# reaproveitadas entre execuções; --sem-cache na linha de comando gera tudo de novo
+LLM_CACHE_PATH = "resultados/cache_respostas.sqlite"  # None = desativado
+LLM_CACHE_MAX_ENTRIES = 100000
+LLM_CACHE_MAX_AGE_DAYS = 30
+OLLAMA_OPTIONS = {}  # opções de geração do Ollama, ex.: {"temperature": 0}
 
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(embeddings)
+# BERTSCORE: o modelo fica carregado e os embeddings das respostas de referência
+# ficam em disco, reaproveitados entre execuções (None = sem cache em disco)
+BERTSCORE_LANG = "pt"
+BERTSCORE_BATCH_SIZE = 64
+BERTSCORE_CACHE_DIR = "resultados/cache_bertscore"
+# Cliente compartilhado: as conexões com o Ollama são reaproveitadas entre chamadas
+ollama = OllamaClient(OLLAMA_URL, OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT, OLLAMA_RETRIES,
+                      pool_size=2 * EVAL_CONCURRENCY)
+cache_respostas = None  # ResponseCache, aberto em main()
+bert_scorer = None  # CachedBERTScorer, carregado no primeiro uso
 
-    os.makedirs("index", exist_ok=True)
-    os.makedirs("embeddings", exist_ok=True)
-    faiss.write_index(index, INDEX_PATH)
-    with open(METADATA_PATH, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, ensure_ascii=False, indent=2)
+def load_or_create_index():
+    """Carrega ou cria o índice FAISS para RAG"""
+    return vector_index.load_or_create_index(DATA_DIR, CATEGORIAS, EMBEDDING_MODEL,
+                                             INDEX_PATH, CHUNKS_PATH, INDEX_CONFIG,
+                                             INGESTION_WORKERS, EMBEDDING_WORKERS)
 
-    return index, metadata
+def criar_retriever():
+    """Retriever do índice local ou, com RETRIEVAL_SERVICE_URL, cliente do servidor de recuperação"""
+    if RETRIEVAL_SERVICE_URL:
+        try:
+            retriever = RemoteRetriever(RETRIEVAL_SERVICE_URL)
+            print(f"🛰️  Usando o servidor de recuperação em {RETRIEVAL_SERVICE_URL}")
+            return retriever
+        except requests.RequestException as e:
+            print(f"⚠️  Servidor de recuperação indisponível ({e}); carregando o índice localmente")
+    index, chunks = load_or_create_index()
+    lexical = lexical_index.load_or_create_lexical_index(LEXICAL_PATH, chunks) if HYBRID_SEARCH else None
+    binario = (binary_index.load_or_create_binary_index(BINARY_INDEX_PATH, index, INDEX_PATH)
+               if TWO_STAGE_SEARCH else None)
+    return Retriever(index, chunks, EMBEDDING_MODEL, cache_size=QUERY_CACHE_SIZE,
+                     lexical_index=lexical, candidates=HYBRID_CANDIDATES,
+                     shards=vector_index.load_shards(INDEX_PATH), binary_index=binario,
+                     rerank_candidates=RERANK_CANDIDATES)
 
 def montar_prompt_rag(pergunta, trechos):
     """Monta prompt com contexto para RAG"""
@@ -60,6 +147,19 @@ Pergunta: {pergunta}
 
 Responda baseado no contexto fornecido:"""
 
+def empacotar_contexto(pergunta, resultado, model):
+    """Escolhe os trechos de um resultado de Retriever.search_batch(..., with_embeddings=True)
+    que cabem no orçamento de tokens do modelo, sem repetições.
+    Retorna os trechos e o resumo de context_packing.pack_context.
+    """
+    orcamento = CONTEXT_TOKEN_BUDGET.get(model.split(":")[0], CONTEXT_DEFAULT_BUDGET)
+    orcamento -= estimate_tokens(montar_prompt_rag(pergunta, []))
+    _, trechos, info = pack_context(resultado["trechos"], resultado["embeddings"], orcamento,
+                                    query_embedding=resultado["embedding_pergunta"],
+                                    dedup_threshold=CONTEXT_DEDUP_THRESHOLD,
+                                    mmr_lambda=CONTEXT_MMR_LAMBDA)
+    return trechos, info
+
 def montar_prompt_simples(pergunta):
     """Monta prompt simples sem contexto para geração pura"""
     return f"""Você é um especialista em literatura brasileira, especialmente na obra de Machado de Assis.
@@ -68,85 +168,258 @@ Pergunta: {pergunta}
 
 Responda com base no seu conhecimento sobre Machado de Assis:"""
 
-def gerar_resposta(prompt, model):
-    """Gera resposta usando a LLM especificada"""
+def gerar_resposta(prompt, model, mostrar=False):
+    """Gera resposta usando a LLM especificada.
+
+    Retorna o texto e as métricas da geração (tempo até o primeiro token,
+    tokens/s, eval_count/eval_duration do Ollama). Com mostrar=True os
+    tokens são impressos à medida que chegam. Respostas vindas do cache
+    trazem as métricas da geração original e "cache": True.
+    """
+    if cache_respostas is not None:
+        em_cache = cache_respostas.get(model, prompt, OLLAMA_OPTIONS)
+        if em_cache is not None:
+            resposta, metricas = em_cache
+            return resposta, dict(metricas, cache=True)
+    on_token = (lambda fragmento: print(fragmento, end="", flush=True)) if mostrar else None
     try:
-        response = requests.post(OLLAMA_URL, json={
-            "model": model,
-            "prompt": prompt,
-            "stream": False
-        })
-        return response.json().get("response", "[Erro ao gerar resposta]")
+        metricas = ollama.generate(prompt, model, stream=OLLAMA_STREAM, on_token=on_token,
+                                   options=OLLAMA_OPTIONS, max_time=QUESTION_TIMEOUT)
+        resposta = metricas.pop("resposta")
+        if not resposta:
+            return "[Erro ao gerar resposta]", metricas
+        if cache_respostas is not None:
+            cache_respostas.put(model, prompt, OLLAMA_OPTIONS, resposta, metricas)
+        return resposta, metricas
     except Exception as e:
-        return f"[Erro na comunicação com o modelo {model}: {str(e)}]"
+        mensagem = f"[Erro na comunicação com o modelo {model}: {str(e)}]"
+        if mostrar:
+            print(mensagem)
+        return mensagem, {"erro": str(e)}
+
+def gerar_resposta_cronometrada(prompt, model):
+    """gerar_resposta com o tempo de geração medido e novas tentativas em caso de falha"""
+    for tentativa in range(QUESTION_RETRIES + 1):
+        start_time = time.time()
+        resposta, metricas = gerar_resposta(prompt, model)
+        if "erro" not in metricas:
+            break
+    # Do cache: vale o tempo da geração original
+    tempo = metricas["tempo_total"] if metricas.get("cache") else time.time() - start_time
+    return resposta, metricas, tempo
+
+def configuracao_avaliacao():
+    """Parâmetros que afetam o resultado de uma pergunta"""
+    return {
+        "modelos": [LLM_3B_MODEL, LLM_1B_MODEL],
+        "ollama_options": OLLAMA_OPTIONS,
+        "top_k": TOP_K,
+        "corpus": {"data_dir": DATA_DIR, "categorias": CATEGORIAS},
+        "embeddings": EMBEDDING_MODEL,
+        "indice": INDEX_CONFIG,
+        "servidor_recuperacao": RETRIEVAL_SERVICE_URL,
+        "busca_hibrida": [HYBRID_SEARCH, HYBRID_CANDIDATES],
+        "busca_dois_estagios": [TWO_STAGE_SEARCH, RERANK_CANDIDATES],
+        "filtros": SEARCH_FILTERS,
+        "contexto": {"orcamento": CONTEXT_TOKEN_BUDGET, "orcamento_padrao": CONTEXT_DEFAULT_BUDGET,
+                     "dedup": CONTEXT_DEDUP_THRESHOLD, "mmr": CONTEXT_MMR_LAMBDA},
+    }
+
+def chave_pergunta(pergunta):
+    """Identifica uma pergunta já avaliada com a configuração atual"""
+    configuracao = json.dumps(configuracao_avaliacao(), sort_keys=True, ensure_ascii=False)
+    return f"{hashlib.sha256(configuracao.encode('utf-8')).hexdigest()[:16]}|{pergunta}"
+
+def carregar_progresso(caminho=PROGRESS_PATH):
+    """Resultados já gravados por execuções anteriores, por chave da pergunta"""
+    concluidos = {}
+    if not os.path.exists(caminho):
+        return concluidos
+    with open(caminho, "r", encoding="utf-8") as f:
+        for linha in f:
+            try:
+                resultado = json.loads(linha)
+            except json.JSONDecodeError:
+                continue  # linha incompleta de uma execução interrompida
+            concluidos[resultado["chave"]] = resultado
+    return concluidos
+
+def carregar_perguntas(arquivos_csv):
+    """Perguntas e respostas de referência de um ou mais CSVs, sem repetições"""
+    perguntas, referencias, vistas = [], [], set()
+    for arquivo in arquivos_csv:
+        df = pd.read_csv(arquivo)
+        faltando = {"pergunta", "resposta_referencia"} - set(df.columns)
+        if faltando:
+            raise ValueError(f"{arquivo} não tem as colunas {sorted(faltando)}")
+        for pergunta, referencia in zip(df["pergunta"], df["resposta_referencia"]):
+            if isinstance(pergunta, str) and pergunta.strip() and pergunta not in vistas:
+                vistas.add(pergunta)
+                perguntas.append(pergunta)
+                referencias.append(referencia)
+        print(f"📄 {arquivo}: {len(df)} perguntas")
+    return perguntas, referencias
 
-def calcular_bertscore(respostas_geradas, referencias):
-    """Calcula BERTScore entre respostas geradas e referências"""
+def avaliar_pergunta(pergunta, referencia, contexto, trace_recuperacao=None):
+    """Gera as respostas dos dois braços para uma pergunta e monta o resultado.
+
+    contexto é o resultado da busca (Retriever.search_batch com
+    with_embeddings=True); só os trechos escolhidos por empacotar_contexto
+    entram no prompt. trace_recuperacao traz os tempos das etapas de
+    recuperação desta pergunta, que entram nas etapas e no tempo ponta a
+    ponta do braço com RAG.
+    """
+    trace_3b = Trace()
+    trace_1b = Trace().merge(trace_recuperacao or Trace())
+    with trace_3b.stage("montagem_prompt"):
+        prompt_3b = montar_prompt_simples(pergunta)
+    with trace_1b.stage("montagem_prompt"):
+        trechos, empacotamento = empacotar_contexto(pergunta, contexto, LLM_1B_MODEL)
+        prompt_1b = montar_prompt_rag(pergunta, trechos)
+    start_time = time.time()
+    (resposta_3b, metricas_3b, tempo_3b), (resposta_1b, metricas_1b, tempo_1b) = run_concurrently([
+        lambda: gerar_resposta_cronometrada(prompt_3b, LLM_3B_MODEL),
+        lambda: gerar_resposta_cronometrada(prompt_1b, LLM_1B_MODEL),
+    ], CONCURRENT_ARMS)
+    trace_3b.add_generation(metricas_3b)
+    trace_1b.add_generation(metricas_1b)
+    return {
+        "chave": chave_pergunta(pergunta),
+        "pergunta": pergunta,
+        "resposta_referencia": referencia,
+        "tempo_pergunta": time.time() - start_time,
+        "llm_3b_sem_rag": {
+            "modelo": LLM_3B_MODEL,
+            "resposta": resposta_3b,
+            "tempo": tempo_3b,
+            "tempo_ponta_a_ponta": trace_3b.total,
+            "etapas": trace_3b.to_dict(),
+            "metricas": metricas_3b,
+            "prompt": prompt_3b,
+            "tokens_prompt": estimate_tokens(prompt_3b)
+        },
+        "llm_1b_com_rag": {
+            "modelo": LLM_1B_MODEL,
+            "resposta": resposta_1b,
+            "tempo": tempo_1b,
+            "tempo_ponta_a_ponta": trace_1b.total,
+            "etapas": trace_1b.to_dict(),
+            "metricas": metricas_1b,
+            "prompt": prompt_1b,
+            "tokens_prompt": estimate_tokens(prompt_1b),
+            "trechos_encontrados": len(contexto["trechos"]),
+            "trechos": trechos,
+            "contexto": empacotamento,
+            "distancias": contexto["distancias"],
+            "fontes": [m["arquivo"] for m in contexto["metadados"]]
+        }
+    }
+
+def calcular_bertscore(respostas_por_braco, referencias):
+    """Calcula o BERTScore (F1) das respostas de cada braço contra as referências.
+
+    Todos os braços são pontuados numa única passada do modelo, e as
+    referências já vistas em execuções anteriores vêm do cache em disco.
+    """
+    global bert_scorer
     try:
-        P, R, F1 = bertscore(respostas_geradas, referencias, lang="pt")
-        return F1.tolist()
+        if bert_scorer is None:
+            bert_scorer = CachedBERTScorer(BERTSCORE_LANG, BERTSCORE_CACHE_DIR, BERTSCORE_BATCH_SIZE)
+        start_time = time.time()
+        pontuacoes = bert_scorer.score_many(respostas_por_braco, referencias)
+        stats = bert_scorer.cache_stats()
+        print(f"   {sum(map(len, respostas_por_braco))} respostas em {time.time() - start_time:.1f}s "
+              f"(referências: {stats['hits']} do cache, {stats['misses']} calculadas)")
+        return [F1 for _, _, F1 in pontuacoes]
     except Exception as e:
         print(f"⚠️  Erro ao calcular BERTScore: {e}")
-        return [0.0] * len(respostas_geradas)
+        return [[0.0] * len(respostas) for respostas in respostas_por_braco]
 
 def comparar_llms(perguntas, respostas_referencia):
-    """Compara LLM de 3B sem RAG vs LLM de 1B com RAG"""
+    """Compara LLM de 3B sem RAG vs LLM de 1B com RAG.
+
+    Até EVAL_CONCURRENCY perguntas são avaliadas ao mesmo tempo. Cada
+    resultado é acrescentado a PROGRESS_PATH assim que termina, e as
+    perguntas já presentes nesse arquivo são puladas. Retorna os resultados
+    de todas as perguntas pedidas, na ordem recebida.
+    """
     
     print("🔬 INICIANDO COMPARAÇÃO: LLM 3B vs LLM 1B + RAG")
     print("=" * 60)
     
-    # Carregar índice FAISS
-    index, metadata = load_or_create_index()
-    
-    resultados = []
+    concluidos = carregar_progresso()
+    pendentes = [(pergunta, referencia) for pergunta, referencia in zip(perguntas, respostas_referencia)
+                 if chave_pergunta(pergunta) not in concluidos]
+    print(f"📝 {len(perguntas) - len(pendentes)} perguntas já avaliadas em {PROGRESS_PATH}; "
+          f"{len(pendentes)} pendentes")
     
-    for i, (pergunta, referencia) in enumerate(tqdm(zip(perguntas, respostas_referencia), 
-                                                   total=len(perguntas), 
-                                                   desc="Comparando LLMs")):
-        
-        print(f"\n📝 Pergunta {i+1}/{len(perguntas)}: {pergunta[:100]}...")
-        
-        # 1. LLM de 3B sem RAG (geração pura)
-        prompt_3b = montar_prompt_simples(pergunta)
-        start_time = time.time()
-        resposta_3b = gerar_resposta(prompt_3b, LLM_3B_MODEL)
-        tempo_3b = time.time() - start_time
+    if pendentes:
+        # Carregar índice FAISS (ou conectar ao servidor de recuperação)
+        retriever = criar_retriever()
         
-        # 2. LLM de 1B com RAG
-        trechos = search_similar_chunks(pergunta, index, metadata, EMBEDDING_MODEL, TOP_K)
-        prompt_1b = montar_prompt_rag(pergunta, trechos)
+        os.makedirs(os.path.dirname(PROGRESS_PATH), exist_ok=True)
+        falhas = 0
+        tempo_recuperacao = 0.0
         start_time = time.time()
-        resposta_1b = gerar_resposta(prompt_1b, LLM_1B_MODEL)
-        tempo_1b = time.time() - start_time
+        barra = tqdm(total=len(pendentes), desc="Comparando LLMs")
+        with open(PROGRESS_PATH, "a", encoding="utf-8") as progresso, \
+                ThreadPoolExecutor(max_workers=EVAL_CONCURRENCY) as pool:
+            em_andamento = set()
+            
+            def registrar(concluidas):
+                nonlocal falhas
+                for future in concluidas:
+                    resultado = future.result()
+                    erros = [resultado[braco]["metricas"]["erro"] for braco in ("llm_3b_sem_rag", "llm_1b_com_rag")
+                             if "erro" in resultado[braco]["metricas"]]
+                    if erros:
+                        # Não é gravado: a próxima execução tenta de novo
+                        falhas += 1
+                        tqdm.write(f"❌ {resultado['pergunta'][:80]}: {erros[0]}")
+                    else:
+                        progresso.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+                        progresso.flush()
+                        concluidos[resultado["chave"]] = resultado
+                        tqdm.write(f"✅ {resultado['pergunta'][:60]} | 3B {resultado['llm_3b_sem_rag']['tempo']:.1f}s "
+                                   f"| 1B {resultado['llm_1b_com_rag']['tempo']:.1f}s")
+                    barra.update(1)
+            
+            for inicio in range(0, len(pendentes), RETRIEVAL_BATCH):
+                lote = pendentes[inicio:inicio + RETRIEVAL_BATCH]
+                # Contextos do lote recuperados de uma vez, antes da geração; o
+                # tempo de cada etapa da busca é rateado entre as perguntas do lote
+                inicio_busca = time.time()
+                trace_lote = Trace()
+                contextos = retriever.search_batch([p for p, _ in lote], TOP_K, **SEARCH_FILTERS,
+                                                   trace=trace_lote, with_embeddings=True)
+                tempo_recuperacao += time.time() - inicio_busca
+                trace_pergunta = trace_lote.scaled(1 / len(lote))
+                for (pergunta, referencia), contexto in zip(lote, contextos):
+                    # Janela limitada: no máximo 2x EVAL_CONCURRENCY perguntas na fila
+                    if len(em_andamento) >= 2 * EVAL_CONCURRENCY:
+                        concluidas, em_andamento = wait(em_andamento, return_when=FIRST_COMPLETED)
+                        registrar(concluidas)
+                    em_andamento.add(pool.submit(avaliar_pergunta, pergunta, referencia, contexto,
+                                                 trace_pergunta))
+            registrar(wait(em_andamento).done)
+        barra.close()
         
-        # Salvar resultado
-        resultado = {
-            "pergunta": pergunta,
-            "resposta_referencia": referencia,
-            "llm_3b_sem_rag": {
-                "modelo": LLM_3B_MODEL,
-                "resposta": resposta_3b,
-                "tempo": tempo_3b,
-                "prompt": prompt_3b
-            },
-            "llm_1b_com_rag": {
-                "modelo": LLM_1B_MODEL,
-                "resposta": resposta_1b,
-                "tempo": tempo_1b,
-                "prompt": prompt_1b,
-                "trechos_encontrados": len(trechos),
-                "trechos": trechos
-            }
-        }
-        
-        resultados.append(resultado)
+        tempo_total = time.time() - start_time
+        avaliadas = len(pendentes) - falhas
+        print(f"\n⏱️  {avaliadas} perguntas em {tempo_total:.1f}s "
+              f"({avaliadas / tempo_total * 60:.1f} perguntas/min, recuperação: {tempo_recuperacao:.2f}s)")
+        if falhas:
+            print(f"⚠️  {falhas} perguntas falharam e serão refeitas na próxima execução")
         
-        # Mostrar progresso
-        print(f"   ⏱️  3B (sem RAG): {tempo_3b:.2f}s")
-        print(f"   ⏱️  1B (com RAG): {tempo_1b:.2f}s")
-        print(f"   📊 Diferença: {abs(tempo_3b - tempo_1b):.2f}s")
+        stats = retriever.cache_stats()
+        print(f"\n🧠 Cache de embeddings: {stats['hits']} acertos, {stats['misses']} falhas "
+              f"({stats['taxa_acerto']*100:.1f}%)")
+        if cache_respostas is not None:
+            stats = cache_respostas.stats()
+            print(f"💾 Cache de respostas: {stats['hits']} acertos, {stats['misses']} falhas "
+                  f"({stats['taxa_acerto']*100:.1f}%), {stats['entradas']} entradas")
     
-    return resultados
+    return [concluidos[chave_pergunta(p)] for p in perguntas if chave_pergunta(p) in concluidos]
 
 def avaliar_resultados(resultados):
     """Avalia os resultados usando BERTScore e outras métricas"""
@@ -159,13 +432,18 @@ def avaliar_resultados(resultados):
     referencias = [r["resposta_referencia"] for r in resultados]
     respostas_3b = [r["llm_3b_sem_rag"]["resposta"] for r in resultados]
     respostas_1b = [r["llm_1b_com_rag"]["resposta"] for r in resultados]
-    tempos_3b = [r["llm_3b_sem_rag"]["tempo"] for r in resultados]
-    tempos_1b = [r["llm_1b_com_rag"]["tempo"] for r in resultados]
+    # Tempo ponta a ponta (recuperação e montagem do prompt incluídas); resultados
+    # antigos, sem etapas, só têm o tempo de geração
+    tempos_3b = [r["llm_3b_sem_rag"].get("tempo_ponta_a_ponta", r["llm_3b_sem_rag"]["tempo"]) for r in resultados]
+    tempos_1b = [r["llm_1b_com_rag"].get("tempo_ponta_a_ponta", r["llm_1b_com_rag"]["tempo"]) for r in resultados]
+    # Resultados do progresso gravados antes do orçamento de contexto não têm tokens_prompt
+    tokens_3b = [r["llm_3b_sem_rag"]["tokens_prompt"] for r in resultados if "tokens_prompt" in r["llm_3b_sem_rag"]]
+    tokens_1b = [r["llm_1b_com_rag"]["tokens_prompt"] for r in resultados if "tokens_prompt" in r["llm_1b_com_rag"]]
+    contextos = [r["llm_1b_com_rag"]["contexto"] for r in resultados if "contexto" in r["llm_1b_com_rag"]]
     
     # Calcular BERTScore
     print("🔍 Calculando BERTScore...")
-    bertscore_3b = calcular_bertscore(respostas_3b, referencias)
-    bertscore_1b = calcular_bertscore(respostas_1b, referencias)
+    bertscore_3b, bertscore_1b = calcular_bertscore([respostas_3b, respostas_1b], referencias)
     
     # Estatísticas de tempo
     media_tempo_3b = np.mean(tempos_3b)
@@ -190,13 +468,20 @@ def avaliar_resultados(resultados):
     
     print(f"\n🤖 LLM de 3B parâmetros (SEM RAG):")
     print(f"   Modelo: {LLM_3B_MODEL}")
-    print(f"   Tempo médio: {media_tempo_3b:.2f}s ± {std_tempo_3b:.2f}s")
+    print(f"   Tempo médio (ponta a ponta): {media_tempo_3b:.2f}s ± {std_tempo_3b:.2f}s")
     print(f"   BERTScore médio: {media_bertscore_3b:.4f} ± {std_bertscore_3b:.4f}")
+    if tokens_3b:
+        print(f"   Tokens do prompt (estimados): {np.mean(tokens_3b):.0f} em média, máximo {max(tokens_3b)}")
     
     print(f"\n🔍 LLM de 1B parâmetros (COM RAG):")
     print(f"   Modelo: {LLM_1B_MODEL}")
-    print(f"   Tempo médio: {media_tempo_1b:.2f}s ± {std_tempo_1b:.2f}s")
+    print(f"   Tempo médio (ponta a ponta): {media_tempo_1b:.2f}s ± {std_tempo_1b:.2f}s")
     print(f"   BERTScore médio: {media_bertscore_1b:.4f} ± {std_bertscore_1b:.4f}")
+    if tokens_1b:
+        print(f"   Tokens do prompt (estimados): {np.mean(tokens_1b):.0f} em média, máximo {max(tokens_1b)}")
+    if contextos:
+        print(f"   Trechos descartados do contexto: {sum(c['trechos_duplicados'] for c in contextos)} repetidos, "
+              f"{sum(c['trechos_fora_do_orcamento'] for c in contextos)} fora do orçamento")
     
     print(f"\n⚡ COMPARAÇÃO:")
     print(f"   Diferença de tempo: {abs(media_tempo_3b - media_tempo_1b):.2f}s")
@@ -215,12 +500,21 @@ def avaliar_resultados(resultados):
     return resultados
 
 def salvar_resultados(resultados):
-    """Salva os resultados em formato JSON e CSV"""
+    """Acrescenta os resultados a RESULTS_DB e os salva em JSON (com prompts e trechos) e CSV"""
+    
+    # Base de resultados usada por analisar_resultados.py
+    execucao = new_run_id("avaliador_rag")
+    agora = time.strftime("%Y-%m-%d %H:%M:%S")
+    store = ResultsStore(RESULTS_DB)
+    try:
+        store.append([{"timestamp": agora, **r} for r in resultados], execucao, "avaliador_rag")
+    finally:
+        store.close()
     
     # Salvar JSON completo
     os.makedirs("resultados", exist_ok=True)
     timestamp = int(time.time())
-    arquivo_json = f"resultados/comparacao_completa_{timestamp}.json"
+    arquivo_json = f"resultados/avaliacao_completa_{timestamp}.json"
     
     with open(arquivo_json, "w", encoding="utf-8") as f:
         json.dump(resultados, f, ensure_ascii=False, indent=2)
@@ -234,11 +528,15 @@ def salvar_resultados(resultados):
             "modelo_3b": resultado["llm_3b_sem_rag"]["modelo"],
             "resposta_3b": resultado["llm_3b_sem_rag"]["resposta"],
             "tempo_3b": resultado["llm_3b_sem_rag"]["tempo"],
+            "tempo_ponta_a_ponta_3b": resultado["llm_3b_sem_rag"].get("tempo_ponta_a_ponta"),
             "bertscore_3b": resultado["llm_3b_sem_rag"]["bertscore"],
+            "tokens_prompt_3b": resultado["llm_3b_sem_rag"].get("tokens_prompt"),
             "modelo_1b": resultado["llm_1b_com_rag"]["modelo"],
             "resposta_1b": resultado["llm_1b_com_rag"]["resposta"],
             "tempo_1b": resultado["llm_1b_com_rag"]["tempo"],
+            "tempo_ponta_a_ponta_1b": resultado["llm_1b_com_rag"].get("tempo_ponta_a_ponta"),
             "bertscore_1b": resultado["llm_1b_com_rag"]["bertscore"],
+            "tokens_prompt_1b": resultado["llm_1b_com_rag"].get("tokens_prompt"),
             "trechos_encontrados": resultado["llm_1b_com_rag"]["trechos_encontrados"]
         })
     
@@ -247,6 +545,7 @@ def salvar_resultados(resultados):
     df.to_csv(arquivo_csv, index=False, encoding="utf-8")
     
     print(f"\n💾 Resultados salvos:")
+    print(f"   Base de resultados: {RESULTS_DB} (execução {execucao})")
     print(f"   JSON completo: {arquivo_json}")
     print(f"   CSV resumido: {arquivo_csv}")
 
@@ -285,19 +584,41 @@ def main():
     print("🔬 AVALIADOR COMPARATIVO: LLM 3B vs LLM 1B + RAG")
     print("=" * 60)
     
-    # Criar perguntas de teste
-    perguntas, respostas_referencia = criar_perguntas_teste()
+    global cache_respostas
+    if LLM_CACHE_PATH:
+        cache_respostas = ResponseCache(LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_AGE_DAYS,
+                                        bypass="--sem-cache" in sys.argv)
+    
+    # Perguntas dos CSVs (linha de comando ou PERGUNTAS_CSV) ou de teste
+    arquivos_csv = [arg for arg in sys.argv[1:] if not arg.startswith("--")] or PERGUNTAS_CSV
+    if arquivos_csv:
+        perguntas, respostas_referencia = carregar_perguntas(arquivos_csv)
+    else:
+        perguntas, respostas_referencia = criar_perguntas_teste()
     
     print(f"📝 Total de perguntas de teste: {len(perguntas)}")
     
     # Executar comparação
     resultados = comparar_llms(perguntas, respostas_referencia)
+    if not resultados:
+        print("❌ Nenhuma pergunta foi avaliada com sucesso.")
+        return
     
     # Avaliar resultados
     resultados_avaliados = avaliar_resultados(resultados)
     
+    # Execução incompleta: os resultados só vão para a base quando todas as
+    # perguntas tiverem sido avaliadas, senão a próxima execução os gravaria de novo
+    if len(resultados) < len(perguntas):
+        print(f"\n⏸️  {len(perguntas) - len(resultados)} perguntas pendentes: rode de novo para "
+              f"completar a avaliação (o progresso está em {PROGRESS_PATH})")
+        return
+    
     # Salvar resultados
     salvar_resultados(resultados_avaliados)
+    # Concluída e salva: a próxima execução mede tudo de novo
+    if os.path.exists(PROGRESS_PATH):
+        os.remove(PROGRESS_PATH)
     
     print("\n🎉 Avaliação comparativa concluída!")
 
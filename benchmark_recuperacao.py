@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Benchmark da recuperação: tempo e memória de cada etapa da construção do
+índice, latência das consultas (p50/p95/p99), vazão em lote e tempo de carga,
+em corpora sintéticos de tamanho crescente montados a partir das obras
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import threading
+from datetime import datetime
+from itertools import chain, zip_longest
+import faiss
+import numpy as np
+import pandas as pd
+from chunk_store import ChunkStore, write_chunk_store
+from utils import EmbeddingEncoder, get_embedding_model, list_corpus_files, peak_rss_mb, split_text
+from vector_index import (apply_search_params, create_index, index_memory_bytes, load_index,
+                          make_index_config, prepare_vectors, save_index, train_index)
+
+# CONFIGURAÇÕES
+# Obras do repositório, independente do diretório de onde o script é executado
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "obras", "raw", "txt")
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_WORKERS = 1
+TAMANHOS_CORPUS = [100_000, 300_000, 1_000_000]  # palavras de cada corpus sintético
+INDEX_CONFIGS = ["flat", "sq8", "ivf_flat", "hnsw"]  # presets de vector_index.INDEX_PRESETS
+TOP_K = 5
+N_CONSULTAS = 200
+LOTES = [1, 8, 32, 128]  # tamanhos de lote da busca em lote
+
+
+class MemorySampler:
+    """Pico de memória residente durante um bloco de código.
+
+    Lê /proc/self/statm numa thread a cada intervalo; onde não existe,
+    usa o pico do processo (ru_maxrss), que só cresce.
+    """
+
+    def __init__(self, intervalo=0.01):
+        self.intervalo = intervalo
+        self.inicio_mb = None
+        self.pico_mb = None
+        self._parar = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def rss_mb():
+        try:
+            with open("/proc/self/statm") as f:
+                paginas = int(f.read().split()[1])
+            return paginas * os.sysconf("SC_PAGE_SIZE") / 1024**2
+        except (OSError, ValueError, AttributeError):
+            return peak_rss_mb()
+
+    def _amostrar(self):
+        while not self._parar.wait(self.intervalo):
+            self.pico_mb = max(self.pico_mb, self.rss_mb())
+
+    def __enter__(self):
+        self.inicio_mb = self.pico_mb = self.rss_mb()
+        if self.inicio_mb is not None:
+            self._thread = threading.Thread(target=self._amostrar, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._thread is not None:
+            self._parar.set()
+            self._thread.join()
+            self.pico_mb = max(self.pico_mb, self.rss_mb())
+
+
+def medir_etapa(funcao):
+    """Executa funcao() e retorna o resultado e {segundos, pico_rss_mb, acrescimo_rss_mb}"""
+    with MemorySampler() as memoria:
+        start_time = time.perf_counter()
+        resultado = funcao()
+        segundos = time.perf_counter() - start_time
+    medida = {"segundos": segundos, "pico_rss_mb": memoria.pico_mb,
+              "acrescimo_rss_mb": (memoria.pico_mb - memoria.inicio_mb) if memoria.pico_mb is not None else None}
+    return resultado, medida
+
+
+def percentis(valores_ms):
+    """p50/p95/p99 e média, em milissegundos"""
+    valores_ms = np.asarray(valores_ms)
+    return {"p50": float(np.percentile(valores_ms, 50)), "p95": float(np.percentile(valores_ms, 95)),
+            "p99": float(np.percentile(valores_ms, 99)), "media": float(valores_ms.mean())}
+
+
+def gerar_corpus_sintetico(base_dir, destino, palavras_alvo, seed=0):
+    """Copia obras de base_dir para destino até somar palavras_alvo palavras.
+
+    As obras são intercaladas entre categorias, para que corpora pequenos
+    também sejam variados. Se o corpus real acabar, ele é repetido com os
+    parágrafos embaralhados, para que os trechos não se repitam.
+    """
+    por_categoria = {}
+    for categoria, path in list_corpus_files(base_dir):
+        por_categoria.setdefault(categoria, []).append((categoria, path))
+    ordem = [item for item in chain.from_iterable(zip_longest(*por_categoria.values())) if item]
+    if not ordem:
+        raise FileNotFoundError(f"Nenhuma obra (.txt) encontrada em {base_dir}")
+
+    rng = random.Random(seed)
+    total = arquivos = rodada = 0
+    while total < palavras_alvo:
+        for categoria, path in ordem:
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                texto = f.read()
+            if rodada:
+                paragrafos = texto.split("\n\n")
+                rng.shuffle(paragrafos)
+                texto = "\n\n".join(paragrafos)
+            palavras = texto.split()
+            restante = palavras_alvo - total
+            if len(palavras) > restante:
+                texto = " ".join(palavras[:restante])
+            os.makedirs(os.path.join(destino, categoria), exist_ok=True)
+            nome = f"{path.stem}_{rodada}.txt" if rodada else path.name
+            with open(os.path.join(destino, categoria, nome), "w", encoding="utf-8") as f:
+                f.write(texto)
+            total += min(len(palavras), restante)
+            arquivos += 1
+            if total >= palavras_alvo:
+                break
+        if total == 0:
+            raise ValueError(f"As obras de {base_dir} não têm texto para montar o corpus")
+        rodada += 1
+    return arquivos, total
+
+
+def extrair_consultas(docs, n_consultas, seed=42):
+    """Consultas curtas (início de trechos sorteados), parecidas com perguntas"""
+    rng = random.Random(seed)
+    return [" ".join(docs[i].split()[:12]) for i in rng.sample(range(len(docs)), min(n_consultas, len(docs)))]
+
+
+def medir_consultas(model, index, config, chunks, consultas, k):
+    """Latência de consultas isoladas: encode, busca no FAISS e leitura dos trechos"""
+    encode_ms, busca_ms, leitura_ms = [], [], []
+    threads = faiss.omp_get_max_threads()
+    faiss.omp_set_num_threads(1)  # latência de consulta única, sem paralelismo interno
+    for consulta in consultas:
+        start_time = time.perf_counter()
+        vetor = prepare_vectors(model.encode([consulta], convert_to_numpy=True), config)
+        meio = time.perf_counter()
+        _, ids = index.search(vetor, k)
+        fim_busca = time.perf_counter()
+        [chunks.text(idx) for idx in ids[0] if idx >= 0]
+        fim = time.perf_counter()
+        encode_ms.append((meio - start_time) * 1000)
+        busca_ms.append((fim_busca - meio) * 1000)
+        leitura_ms.append((fim - fim_busca) * 1000)
+    faiss.omp_set_num_threads(threads)
+    total_ms = np.array(encode_ms) + np.array(busca_ms) + np.array(leitura_ms)
+    return {"encode_ms": percentis(encode_ms), "busca_ms": percentis(busca_ms),
+            "leitura_trechos_ms": percentis(leitura_ms), "total_ms": percentis(total_ms)}
+
+
+def medir_lotes(model, index, config, consultas, k):
+    """Vazão (consultas/s) de encode + busca para cada tamanho de lote"""
+    vazoes = []
+    for tamanho in LOTES:
+        start_time = time.perf_counter()
+        for inicio in range(0, len(consultas), tamanho):
+            lote = consultas[inicio:inicio + tamanho]
+            vetores = prepare_vectors(model.encode(lote, convert_to_numpy=True), config)
+            index.search(vetores, k)
+        segundos = time.perf_counter() - start_time
+        vazoes.append({"tamanho_lote": tamanho, "consultas_por_segundo": len(consultas) / segundos})
+    return vazoes
+
+
+def benchmark_corpus(model, palavras_alvo, pasta):
+    """Executa todos os casos num corpus sintético de palavras_alvo palavras"""
+    corpus_dir = os.path.join(pasta, "corpus")
+    n_arquivos, n_palavras = gerar_corpus_sintetico(DATA_DIR, corpus_dir, palavras_alvo)
+    print(f"\n📚 Corpus sintético: {n_palavras} palavras em {n_arquivos} arquivos")
+    etapas = {}
+
+    def ler():
+        textos = []
+        for categoria, path in list_corpus_files(corpus_dir):
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                textos.append((categoria, path.name, f.read()))
+        return textos
+    textos, etapas["leitura"] = medir_etapa(ler)
+
+    def dividir():
+        docs, metadata = [], {}
+        for categoria, arquivo, texto in textos:
+            for trecho in split_text(texto):
+                metadata[len(docs)] = {"arquivo": arquivo, "categoria": categoria}
+                docs.append(trecho)
+        return docs, metadata
+    (docs, metadata), etapas["divisao"] = medir_etapa(dividir)
+    print(f"   ✂️  {len(docs)} trechos")
+
+    with EmbeddingEncoder(model, workers=EMBEDDING_WORKERS) as encoder:
+        embeddings, etapas["embeddings"] = medir_etapa(lambda: encoder.encode(docs))
+    etapas["embeddings"]["trechos_por_segundo"] = len(docs) / etapas["embeddings"]["segundos"]
+    print(f"   🔍 Embeddings: {etapas['embeddings']['segundos']:.1f}s "
+          f"({etapas['embeddings']['trechos_por_segundo']:.0f} trechos/s)")
+
+    chunks_path = os.path.join(pasta, "chunks.bin")
+    write_chunk_store(chunks_path, docs, metadata).close()
+    chunks = ChunkStore(chunks_path)
+    consultas = extrair_consultas(docs, N_CONSULTAS)
+
+    indices = []
+    for nome in INDEX_CONFIGS:
+        config = make_index_config(nome)
+        vetores = prepare_vectors(embeddings, config)
+        index, factory = create_index(config, vetores.shape[1], len(vetores))
+        _, treino = medir_etapa(lambda: train_index(index, vetores, config))
+        _, adicao = medir_etapa(lambda: index.add_with_ids(vetores, np.arange(len(vetores), dtype=np.int64)))
+        config.update(factory_resolvida=factory)
+        apply_search_params(index, config)
+
+        index_path = os.path.join(pasta, f"{nome}.bin")
+        save_index(index, config, index_path)
+        del index
+
+        def carregar():
+            carregado, _ = load_index(index_path)
+            return carregado, ChunkStore(chunks_path)
+        (index, chunks_carregados), carga = medir_etapa(carregar)
+        chunks_carregados.close()
+        apply_search_params(index, config)
+
+        resultado = {
+            "config": nome,
+            "factory_resolvida": factory,
+            "treino": treino,
+            "adicao": adicao,
+            "carga": carga,
+            "memoria_indice_mb": index_memory_bytes(index) / 1024**2,
+            "consultas": medir_consultas(model, index, config, chunks, consultas, TOP_K),
+            "lotes": medir_lotes(model, index, config, consultas, TOP_K),
+        }
+        indices.append(resultado)
+        print(f"   🔧 {nome}: adição {adicao['segundos']:.2f}s, carga {carga['segundos']*1000:.1f}ms, "
+              f"busca p50/p99 {resultado['consultas']['busca_ms']['p50']:.3f}/"
+              f"{resultado['consultas']['busca_ms']['p99']:.3f}ms")
+    chunks.close()
+
+    return {"palavras": n_palavras, "arquivos": n_arquivos, "trechos": len(docs),
+            "etapas": etapas, "indices": indices}
+
+
+def resumo_tabular(corpora):
+    """Uma linha por (corpus, configuração), para comparar execuções"""
+    linhas = []
+    for corpus in corpora:
+        etapas = corpus["etapas"]
+        for indice in corpus["indices"]:
+            linha = {
+                "palavras": corpus["palavras"],
+                "trechos": corpus["trechos"],
+                "config": indice["config"],
+                "factory": indice["factory_resolvida"],
+                "leitura_s": etapas["leitura"]["segundos"],
+                "divisao_s": etapas["divisao"]["segundos"],
+                "embeddings_s": etapas["embeddings"]["segundos"],
+                "embeddings_pico_rss_mb": etapas["embeddings"]["pico_rss_mb"],
+                "treino_s": indice["treino"]["segundos"],
+                "adicao_s": indice["adicao"]["segundos"],
+                "adicao_pico_rss_mb": indice["adicao"]["pico_rss_mb"],
+                "carga_ms": indice["carga"]["segundos"] * 1000,
+                "memoria_indice_mb": indice["memoria_indice_mb"],
+            }
+            for etapa in ("encode_ms", "busca_ms", "total_ms"):
+                for p in ("p50", "p95", "p99"):
+                    linha[f"{etapa[:-3]}_{p}_ms"] = indice["consultas"][etapa][p]
+            for lote in indice["lotes"]:
+                linha[f"vazao_lote_{lote['tamanho_lote']}"] = lote["consultas_por_segundo"]
+            linhas.append(linha)
+    return pd.DataFrame(linhas)
+
+
+def main():
+    """Função principal"""
+    print("⏱️  BENCHMARK DA RECUPERAÇÃO")
+    print("=" * 60)
+
+    start_time = time.perf_counter()
+    model = get_embedding_model(EMBEDDING_MODEL)
+    carga_modelo = time.perf_counter() - start_time
+
+    corpora = []
+    for palavras in TAMANHOS_CORPUS:
+        pasta = tempfile.mkdtemp(prefix="benchmark_rag_")
+        try:
+            corpora.append(benchmark_corpus(model, palavras, pasta))
+        finally:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+    relatorio = {
+        "criado_em": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "ambiente": {"python": sys.version.split()[0], "plataforma": platform.platform(),
+                     "cpus": os.cpu_count(), "faiss": faiss.__version__, "numpy": np.__version__},
+        "parametros": {"modelo": EMBEDDING_MODEL, "carga_modelo_s": carga_modelo, "top_k": TOP_K,
+                       "n_consultas": N_CONSULTAS, "lotes": LOTES, "embedding_workers": EMBEDDING_WORKERS},
+        "corpora": corpora,
+    }
+
+    df = resumo_tabular(corpora)
+    print("\n📈 RESULTADOS")
+    print("=" * 60)
+    colunas = ["palavras", "config", "adicao_s", "carga_ms", "busca_p50_ms", "busca_p99_ms",
+               "total_p95_ms", f"vazao_lote_{LOTES[-1]}"]
+    print(df[colunas].to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+
+    os.makedirs("analises", exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    arquivo_json = f"analises/benchmark_recuperacao_{timestamp}.json"
+    with open(arquivo_json, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2, sort_keys=True)
+    arquivo_csv = f"analises/benchmark_recuperacao_{timestamp}.csv"
+    df.to_csv(arquivo_csv, index=False, encoding="utf-8")
+    print(f"\n✅ Relatório exportado para: {arquivo_json} e {arquivo_csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import os
+import re
+import hashlib
+from collections import defaultdict
+import numpy as np
+import torch
+from torch.nn.utils.rnn import pad_sequence
+from bert_score import BERTScorer
+from bert_score.utils import get_bert_embedding, greedy_cos_idf
+
+
+def text_hash(text):
+    """Hash do texto como o BERTScore o vê (sem espaços nas pontas)"""
+    return hashlib.sha256(text.strip().encode("utf-8")).hexdigest()
+
+
+class CachedBERTScorer:
+    """BERTScore com o modelo residente e embeddings das referências em disco.
+
+    Equivale a bert_score.score(..., lang=lang) sem idf nem baseline, mas o
+    modelo é carregado uma única vez, cada texto distinto é codificado uma
+    única vez por chamada (mesmo que apareça em vários braços) e os embeddings
+    por token das referências ficam em cache_dir, um arquivo por hash do
+    texto, reaproveitados entre execuções.
+    """
+
+    def __init__(self, lang="pt", cache_dir="resultados/cache_bertscore", batch_size=64,
+                 model_type=None, num_layers=None, device=None):
+        self.scorer = BERTScorer(lang=lang, model_type=model_type, num_layers=num_layers,
+                                 batch_size=batch_size, device=device)
+        self.batch_size = batch_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Embeddings dependem do modelo e da camada: um subdiretório para cada
+        modelo = re.sub(r"[^\w.-]+", "_", self.scorer.model_type)
+        self.cache_dir = os.path.join(cache_dir, f"{modelo}_L{self.scorer.num_layers}") if cache_dir else None
+        # Mesmos pesos do bert_score sem idf: 1 por token, 0 para [CLS] e [SEP]
+        tokenizer = self.scorer._tokenizer
+        self._idf_dict = defaultdict(lambda: 1.0)
+        self._idf_dict[tokenizer.sep_token_id] = 0
+        self._idf_dict[tokenizer.cls_token_id] = 0
+
+    def _cache_path(self, text):
+        return os.path.join(self.cache_dir, text_hash(text) + ".npz")
+
+    def _load(self, text):
+        try:
+            with np.load(self._cache_path(text)) as dados:
+                return torch.from_numpy(dados["emb"]), torch.from_numpy(dados["idf"])
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def _save(self, text, emb, idf):
+        path = self._cache_path(text)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, emb=emb.numpy(), idf=idf.numpy())
+        os.replace(tmp_path, path)
+
+    def embed(self, texts, persist=False):
+        """Embeddings por token e pesos de cada texto distinto ({texto: (emb, idf)}).
+
+        Com persist=True (referências) os embeddings são lidos e gravados
+        no cache em disco.
+        """
+        stats = {}
+        if persist and self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for text in set(texts):
+                cached = self._load(text)
+                if cached is not None:
+                    stats[text] = cached
+            self.cache_hits += len(stats)
+
+        # Textos de tamanho parecido no mesmo lote: menos padding
+        faltantes = sorted(set(texts) - set(stats), key=lambda t: len(t.split()), reverse=True)
+        if persist and self.cache_dir:
+            self.cache_misses += len(faltantes)
+        model, tokenizer, device = self.scorer._model, self.scorer._tokenizer, self.scorer.device
+        for inicio in range(0, len(faltantes), self.batch_size):
+            lote = faltantes[inicio:inicio + self.batch_size]
+            embs, masks, padded_idf = get_bert_embedding(lote, model, tokenizer, self._idf_dict, device=device)
+            embs, masks, padded_idf = embs.cpu(), masks.cpu(), padded_idf.cpu()
+            for i, text in enumerate(lote):
+                n_tokens = int(masks[i].sum())
+                stats[text] = (embs[i, :n_tokens].clone(), padded_idf[i, :n_tokens].clone())
+                if persist and self.cache_dir:
+                    self._save(text, *stats[text])
+        return stats
+
+    def _pad(self, items):
+        embs = [emb for emb, _ in items]
+        lens = torch.tensor([emb.size(0) for emb in embs])
+        emb_pad = pad_sequence(embs, batch_first=True, padding_value=2.0)
+        idf_pad = pad_sequence([idf for _, idf in items], batch_first=True)
+        mask = torch.arange(int(lens.max())).expand(len(lens), -1) < lens.unsqueeze(1)
+        return emb_pad, mask, idf_pad
+
+    def score(self, candidates, references):
+        """(P, R, F1) de cada candidato contra a referência na mesma posição"""
+        return self.score_many([candidates], references)[0]
+
+    def score_many(self, candidate_sets, references):
+        """Pontua várias listas de candidatos (ex.: um braço cada) contra as mesmas referências.
+
+        Todos os textos são codificados numa única passada. Retorna uma
+        tupla (P, R, F1) de listas para cada lista de candidatos.
+        """
+        references = [str(r) for r in references]
+        candidate_sets = [[str(c) for c in candidatos] for candidatos in candidate_sets]
+        ref_stats = self.embed(references, persist=True)
+        cand_stats = self.embed([c for candidatos in candidate_sets for c in candidatos])
+
+        resultados = []
+        with torch.no_grad():
+            for candidatos in candidate_sets:
+                P, R, F = [], [], []
+                for inicio in range(0, len(candidatos), self.batch_size):
+                    refs = [ref_stats[r] for r in references[inicio:inicio + self.batch_size]]
+                    cands = [cand_stats[c] for c in candidatos[inicio:inicio + self.batch_size]]
+                    p, r, f = greedy_cos_idf(*self._pad(refs), *self._pad(cands))
+                    P.extend(p.tolist())
+                    R.extend(r.tolist())
+                    F.extend(f.tolist())
+                resultados.append((P, R, F))
+        return resultados
+
+    def cache_stats(self):
+        """Referências lidas do cache em disco e calculadas"""
+        total = self.cache_hits + self.cache_misses
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "taxa_acerto": self.cache_hits / total if total else 0.0
+        }
@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import faiss
+import numpy as np
+from utils import reconstruct_vectors
+
+# Vetores reconstruídos do índice float por vez ao construir a cópia binária
+RECONSTRUCT_BATCH = 65536
+
+
+def binarize(vectors):
+    """Código binário dos vetores: um bit por dimensão, com o sinal do componente"""
+    return np.packbits(np.asarray(vectors, dtype=np.float32) > 0, axis=1)
+
+
+def _source_stamp(index_path):
+    stat = os.stat(index_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _stamp_path_for(path):
+    return os.path.splitext(path)[0] + ".json"
+
+
+def _iter_vectors(index):
+    """(ids, vetores) de todos os vetores de um índice float, em lotes"""
+    if faiss.try_extract_index_ivf(index) is not None:
+        raise ValueError("A busca em dois estágios exige um índice sem IVF (ex.: Flat)")
+    if isinstance(index, faiss.IndexIDMap2):
+        ids, inner = faiss.vector_to_array(index.id_map), index.index
+    else:
+        ids, inner = np.arange(index.ntotal, dtype=np.int64), index
+    for inicio in range(0, index.ntotal, RECONSTRUCT_BATCH):
+        fim = min(inicio + RECONSTRUCT_BATCH, index.ntotal)
+        yield ids[inicio:fim], inner.reconstruct_n(inicio, fim - inicio)
+
+
+class BinaryIndex:
+    """Busca em dois estágios: varredura binária seguida de reordenação exata.
+
+    Guarda uma cópia binária (sinal de cada componente) dos vetores do índice
+    float num IndexBinaryFlat, 32x menor que os vetores float32. A busca
+    compara os códigos por distância de Hamming, separa os `candidates`
+    mais próximos e os reordena pela distância exata (na métrica do índice
+    float) calculada sobre os vetores guardados nele. Com índice Flat, a
+    reordenação usa os vetores em precisão total.
+    """
+
+    def __init__(self, binary, source_stamp=None):
+        self.binary = binary
+        self.source_stamp = source_stamp
+
+    @classmethod
+    def build(cls, index, source_stamp=None):
+        """Constrói a cópia binária dos vetores (e ids) de um índice float"""
+        binary = faiss.IndexBinaryIDMap(faiss.IndexBinaryFlat(index.d))
+        for ids, vetores in _iter_vectors(index):
+            binary.add_with_ids(binarize(vetores), ids)
+        return cls(binary, source_stamp)
+
+    @classmethod
+    def load(cls, path):
+        with open(_stamp_path_for(path), "r", encoding="utf-8") as f:
+            source_stamp = json.load(f)["source_stamp"]
+        return cls(faiss.read_index_binary(path), source_stamp)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        faiss.write_index_binary(self.binary, path)
+        with open(_stamp_path_for(path), "w", encoding="utf-8") as f:
+            json.dump({"source_stamp": self.source_stamp, "total_vetores": int(self.binary.ntotal)}, f)
+
+    @property
+    def memory_bytes(self):
+        return int(faiss.serialize_index_binary(self.binary).size)
+
+    def search(self, index, queries, k, candidates=256, params=None):
+        """Mesmo retorno de index.search (distâncias e ids, -1 onde faltam resultados).
+
+        queries já devem estar preparadas para o índice float
+        (utils.prepare_query_embeddings); params (ex.: o seletor de um shard)
+        restringe a varredura binária.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, index.d)
+        _, candidatos = self.binary.search(binarize(queries), max(candidates, k), params=params)
+        produto_interno = index.metric_type == faiss.METRIC_INNER_PRODUCT
+        distances = np.full((len(queries), k), -np.inf if produto_interno else np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, (query, ids) in enumerate(zip(queries, candidatos)):
+            ids = ids[ids >= 0]
+            if len(ids) == 0:
+                continue
+            vetores = reconstruct_vectors(index, ids)
+            if produto_interno:
+                pontuacoes = vetores @ query
+                ordem = np.argsort(-pontuacoes)[:k]
+            else:
+                pontuacoes = ((vetores - query) ** 2).sum(axis=1)
+                ordem = np.argsort(pontuacoes)[:k]
+            distances[i, :len(ordem)] = pontuacoes[ordem]
+            indices[i, :len(ordem)] = ids[ordem]
+        return distances, indices
+
+
+def load_or_create_binary_index(path, index, index_path):
+    """Carrega a cópia binária do índice ou a reconstrói se o índice float mudou"""
+    stamp = _source_stamp(index_path)
+    if os.path.exists(path) and os.path.exists(_stamp_path_for(path)):
+        binary = BinaryIndex.load(path)
+        if binary.source_stamp == stamp and binary.binary.ntotal == index.ntotal:
+            print(f"✅ Índice binário carregado de {path}")
+            return binary
+        print("🔄 Índice FAISS alterado desde a construção do índice binário")
+
+    print("\n🔢 Construindo índice binário (busca em dois estágios)...")
+    start_time = time.time()
+    binary = BinaryIndex.build(index, stamp)
+    binary.save(path)
+    print(f"✅ Índice binário com {binary.binary.ntotal} vetores em {time.time() - start_time:.2f}s "
+          f"({binary.memory_bytes / 1024**2:.1f} MB)")
+    return binary
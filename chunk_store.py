@@ -0,0 +1,160 @@
+import os
+import json
+import mmap
+import shutil
+import struct
+from array import array
+from collections.abc import Mapping
+
+# Layout do arquivo (inteiros little-endian):
+#   cabeçalho: MAGIC, n_trechos, offset e tamanho da tabela de arquivos, offset do blob
+#   offsets:   (n_trechos + 1) x uint64, posição de cada trecho dentro do blob
+#   arquivos:  n_trechos x uint32, índice do arquivo de origem de cada trecho
+#   tabela:    JSON com a lista de [arquivo, categoria] e o total de ids removidos
+#   blob:      texto UTF-8 de todos os trechos, concatenado
+# Ids removidos (atualizações incrementais) têm arquivo REMOVED e texto vazio.
+MAGIC = b"MACHCHK2"
+HEADER = struct.Struct("<8sQQQQ")
+REMOVED = 0xFFFFFFFF
+
+
+class ChunkStoreWriter:
+    """Grava trechos em disco de forma incremental, sem mantê-los em memória"""
+
+    def __init__(self, path):
+        self.path = path
+        self._blob_path = path + ".blob.tmp"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._blob = open(self._blob_path, "wb")
+        self._offsets = array("Q", [0])
+        self._file_ids = array("I")
+        self._files = []
+        self._file_index = {}
+        self._removed = 0
+
+    def add(self, trecho, arquivo, categoria):
+        """Acrescenta um trecho e retorna seu id (posição no store)"""
+        chave = (arquivo, categoria)
+        file_id = self._file_index.get(chave)
+        if file_id is None:
+            file_id = self._file_index[chave] = len(self._files)
+            self._files.append([arquivo, categoria])
+
+        dados = trecho.encode("utf-8")
+        self._blob.write(dados)
+        self._offsets.append(self._offsets[-1] + len(dados))
+        self._file_ids.append(file_id)
+        return len(self._file_ids) - 1
+
+    def add_removed(self):
+        """Reserva um id sem trecho (vetor removido do índice)"""
+        self._offsets.append(self._offsets[-1])
+        self._file_ids.append(REMOVED)
+        self._removed += 1
+        return len(self._file_ids) - 1
+
+    def __len__(self):
+        return len(self._file_ids)
+
+    def close(self):
+        """Monta o arquivo final (tabelas + blob) e o instala atomicamente"""
+        self._blob.close()
+        tabela = json.dumps({"arquivos": self._files, "removidos": self._removed},
+                            ensure_ascii=False).encode("utf-8")
+        n = len(self._file_ids)
+        offset_tabela = HEADER.size + 8 * (n + 1) + 4 * n
+        offset_blob = offset_tabela + len(tabela)
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, n, offset_tabela, len(tabela), offset_blob))
+            f.write(self._offsets.tobytes())
+            f.write(self._file_ids.tobytes())
+            f.write(tabela)
+            with open(self._blob_path, "rb") as blob:
+                shutil.copyfileobj(blob, f)
+        os.replace(tmp_path, self.path)
+        os.remove(self._blob_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._blob.close()
+            os.remove(self._blob_path)
+
+
+class ChunkStore(Mapping):
+    """Trechos mapeados em memória, acessados em O(1) pelo id do FAISS.
+
+    Se comporta como o antigo dicionário de metadados: store[id] retorna
+    {"arquivo", "categoria", "trecho"}, com o texto completo do trecho lido
+    do disco apenas quando solicitado.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, offset_tabela, tamanho_tabela, offset_blob = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} não é um chunk store válido")
+        self._n = n
+        self._offsets_pos = HEADER.size
+        self._file_ids_pos = HEADER.size + 8 * (n + 1)
+        self._blob_pos = offset_blob
+        tabela = json.loads(self._mm[offset_tabela:offset_tabela + tamanho_tabela].decode("utf-8"))
+        self._files = tabela["arquivos"]
+        self._removed = tabela["removidos"]
+
+    def _file_id(self, idx):
+        if not 0 <= idx < self._n:
+            raise KeyError(idx)
+        (file_id,) = struct.unpack_from("<I", self._mm, self._file_ids_pos + 4 * idx)
+        if file_id == REMOVED:
+            raise KeyError(idx)
+        return file_id
+
+    @property
+    def id_limit(self):
+        """Primeiro id ainda não usado (ids removidos incluídos)"""
+        return self._n
+
+    def text(self, idx):
+        """Texto completo do trecho"""
+        idx = int(idx)
+        self._file_id(idx)
+        inicio, fim = struct.unpack_from("<QQ", self._mm, self._offsets_pos + 8 * idx)
+        return self._mm[self._blob_pos + inicio:self._blob_pos + fim].decode("utf-8")
+
+    def source(self, idx):
+        """(arquivo, categoria) de origem do trecho"""
+        return tuple(self._files[self._file_id(int(idx))])
+
+    def __getitem__(self, idx):
+        arquivo, categoria = self.source(idx)
+        return {"arquivo": arquivo, "categoria": categoria, "trecho": self.text(idx)}
+
+    def __len__(self):
+        return self._n - self._removed
+
+    def __iter__(self):
+        file_ids = self._mm[self._file_ids_pos:self._file_ids_pos + 4 * self._n]
+        for idx, (file_id,) in enumerate(struct.iter_unpack("<I", file_ids)):
+            if file_id != REMOVED:
+                yield idx
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+def write_chunk_store(path, docs, metadata):
+    """Grava os trechos produzidos por load_documents num chunk store"""
+    with ChunkStoreWriter(path) as writer:
+        for idx, trecho in enumerate(docs):
+            writer.add(trecho, metadata[idx]["arquivo"], metadata[idx]["categoria"])
+    return ChunkStore(path)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Script para comparar configurações de índice FAISS (recall@k, latência e
+memória) contra o índice exato IndexFlatL2 em float32, incluindo a busca em
+dois estágios (varredura binária + reordenação exata)
+"""
+
+import os
+import time
+from datetime import datetime
+import faiss
+import numpy as np
+import pandas as pd
+from utils import load_documents, create_embeddings, get_embedding_model
+from utils import prepare_query_embeddings
+from vector_index import build_index, apply_search_params, load_index
+from binary_index import BinaryIndex
+
+# CONFIGURAÇÕES
+DATA_DIR = "/home/umbelito/rag_machado_de_assis/obras/raw/txt"
+CATEGORIAS = ["romance", "cronica"]
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+INDEX_PATH = "index/faiss_index.bin"
+TOP_K = 5
+N_CONSULTAS = 200  # vetores do corpus separados para servir de consulta
+
+# Configurações avaliadas e parâmetros de busca varridos
+CONFIGS_AVALIADAS = [
+    ("ivf_flat", {"factory": "IVF{nlist},Flat"}, "nprobe", [1, 4, 16, 64]),
+    ("ivf_pq", {"factory": "IVF{nlist},PQ48"}, "nprobe", [1, 4, 16, 64]),
+    ("hnsw", {"factory": "HNSW32,Flat"}, "ef_search", [16, 32, 64, 128]),
+    ("sq_fp16", {"factory": "SQfp16", "metric": "ip"}, None, [None]),
+    ("sq8", {"factory": "SQ8", "metric": "ip"}, None, [None]),
+]
+# Candidatos da varredura binária reordenados pela distância exata no índice plano
+CANDIDATOS_REORDENACAO = [32, 64, 128, 256, 512]
+
+
+def carregar_embeddings():
+    """Obtém os embeddings do corpus, reaproveitando o índice plano se existir"""
+    if os.path.exists(INDEX_PATH):
+        index, config = load_index(INDEX_PATH)
+        if config.get("factory_resolvida") == "Flat":
+            print(f"✅ Reaproveitando vetores de {INDEX_PATH}")
+            # Após atualizações incrementais os ids têm lacunas: lê os vetores
+            # pela posição no índice interno, não por id
+            interno = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+            return interno.reconstruct_n(0, interno.ntotal)
+
+    docs, _ = load_documents(DATA_DIR, CATEGORIAS)
+    return create_embeddings(docs, get_embedding_model(EMBEDDING_MODEL))
+
+
+def separar_consultas(embeddings, n_consultas):
+    """Separa vetores do corpus para usar como consultas (fora da base)"""
+    rng = np.random.default_rng(42)
+    ids_consulta = rng.choice(len(embeddings), n_consultas, replace=False)
+    mascara = np.ones(len(embeddings), dtype=bool)
+    mascara[ids_consulta] = False
+    return embeddings[mascara], embeddings[ids_consulta]
+
+
+def medir_busca(index, consultas, k, binario=None, candidatos=None):
+    """Executa as consultas uma a uma (como no uso interativo) e mede a latência.
+
+    Com binario (BinaryIndex), usa a busca em dois estágios sobre index.
+    """
+    latencias = []
+    resultados = []
+    consultas = prepare_query_embeddings(index, consultas)
+    threads = faiss.omp_get_max_threads()
+    faiss.omp_set_num_threads(1)  # latência de consulta única, sem paralelismo interno
+    for consulta in consultas:
+        start_time = time.perf_counter()
+        if binario is None:
+            _, ids = index.search(consulta.reshape(1, -1), k)
+        else:
+            _, ids = binario.search(index, consulta.reshape(1, -1), k, candidatos)
+        latencias.append(time.perf_counter() - start_time)
+        resultados.append(ids[0])
+    faiss.omp_set_num_threads(threads)
+    return np.array(resultados), np.array(latencias) * 1000
+
+
+def calcular_recall(resultados, verdade, k):
+    """Recall@k médio em relação aos vizinhos exatos"""
+    acertos = [len(set(r[:k]) & set(v[:k])) for r, v in zip(resultados, verdade)]
+    return float(np.mean(acertos)) / k
+
+
+def comparar_indices(embeddings, consultas, k):
+    """Mede recall@k, latência e aceleração de cada configuração contra o índice plano"""
+    linhas = []
+
+    index_exato, config_exata = build_index(embeddings, {"factory": "Flat"})
+    verdade, latencias = medir_busca(index_exato, consultas, k)
+    linhas.append({
+        "config": "flat",
+        "factory": config_exata["factory_resolvida"],
+        "parametro": "",
+        "valor": "",
+        "recall": 1.0,
+        "latencia_media_ms": latencias.mean(),
+        "latencia_p95_ms": np.percentile(latencias, 95),
+        "tempo_construcao_s": config_exata["tempo_construcao"],
+        "memoria_mb": config_exata["memoria_bytes"] / 1024**2,
+        "bytes_por_vetor": config_exata["memoria_bytes"] / len(embeddings),
+    })
+
+    for nome, config, parametro, valores in CONFIGS_AVALIADAS:
+        print(f"\n🔧 Construindo {nome}...")
+        index, config = build_index(embeddings, config)
+        for valor in valores:
+            if parametro:
+                config[parametro] = valor
+                apply_search_params(index, config)
+            resultados, latencias = medir_busca(index, consultas, k)
+            linhas.append({
+                "config": nome,
+                "factory": config["factory_resolvida"],
+                "parametro": parametro or "",
+                "valor": valor if valor is not None else "",
+                "recall": calcular_recall(resultados, verdade, k),
+                "latencia_media_ms": latencias.mean(),
+                "latencia_p95_ms": np.percentile(latencias, 95),
+                "tempo_construcao_s": config["tempo_construcao"],
+                "memoria_mb": config["memoria_bytes"] / 1024**2,
+                "bytes_por_vetor": config["memoria_bytes"] / len(embeddings),
+            })
+
+    print("\n🔧 Construindo índice binário (dois estágios)...")
+    start_time = time.time()
+    binario = BinaryIndex.build(index_exato)
+    tempo_construcao = time.time() - start_time
+    # A reordenação lê os vetores float do índice plano: os dois ficam em memória
+    memoria = binario.memory_bytes + config_exata["memoria_bytes"]
+    for candidatos in CANDIDATOS_REORDENACAO:
+        resultados, latencias = medir_busca(index_exato, consultas, k, binario, candidatos)
+        linhas.append({
+            "config": "binario_reordenado",
+            "factory": f"BinaryFlat{index_exato.d} + {config_exata['factory_resolvida']}",
+            "parametro": "candidatos",
+            "valor": candidatos,
+            "recall": calcular_recall(resultados, verdade, k),
+            "latencia_media_ms": latencias.mean(),
+            "latencia_p95_ms": np.percentile(latencias, 95),
+            "tempo_construcao_s": tempo_construcao,
+            "memoria_mb": memoria / 1024**2,
+            "bytes_por_vetor": memoria / len(embeddings),
+        })
+
+    df = pd.DataFrame(linhas)
+    df["aceleracao"] = df["latencia_media_ms"].iloc[0] / df["latencia_media_ms"]
+    return df
+
+
+def main():
+    """Função principal"""
+    print("📏 COMPARAÇÃO DE ÍNDICES FAISS: RECALL@K vs LATÊNCIA")
+    print("=" * 60)
+
+    embeddings = np.ascontiguousarray(carregar_embeddings(), dtype=np.float32)
+    base, consultas = separar_consultas(embeddings, min(N_CONSULTAS, len(embeddings) // 10))
+    print(f"📊 Base: {len(base)} vetores | Consultas: {len(consultas)} | k={TOP_K}")
+
+    df = comparar_indices(base, consultas, TOP_K)
+
+    print("\n📈 RESULTADOS")
+    print("=" * 60)
+    print(df.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+
+    os.makedirs("analises", exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    arquivo_csv = f"analises/comparacao_indices_{timestamp}.csv"
+    df.to_csv(arquivo_csv, index=False, encoding="utf-8")
+    print(f"\n✅ Relatório exportado para: {arquivo_csv}")
+
+
+if __name__ == "__main__":
+    main()
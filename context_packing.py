@@ -0,0 +1,85 @@
+import math
+import numpy as np
+
+CHARS_PER_TOKEN = 3.0  # estimativa conservadora para português nos tokenizadores do Llama
+
+
+def estimate_tokens(text, chars_per_token=CHARS_PER_TOKEN):
+    """Estimativa do número de tokens de um texto (sem depender do tokenizador do modelo)"""
+    return math.ceil(len(text) / chars_per_token) if text else 0
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def pack_context(chunks, embeddings, budget, query_embedding=None, dedup_threshold=0.95,
+                 mmr_lambda=None, count_tokens=estimate_tokens):
+    """Escolhe os trechos do contexto respeitando um orçamento de tokens.
+
+    chunks vêm em ordem de relevância, com seus embeddings na mesma ordem.
+    Trechos com similaridade de cosseno >= dedup_threshold a um trecho já
+    escolhido são descartados (repetições, comuns nas crônicas publicadas
+    em série). Com mmr_lambda, a ordem é a do maximal marginal relevance:
+    lambda * relevância - (1 - lambda) * similaridade com os já escolhidos,
+    com a relevância medida contra query_embedding (ou pela posição na
+    busca, sem ele). Trechos que não cabem no que resta do orçamento são
+    pulados; se nem o primeiro couber, ele entra truncado.
+
+    Retorna as posições escolhidas (na ordem de escolha), os textos
+    correspondentes e um resumo com os tokens do contexto, o número de
+    trechos usados e o de descartados por motivo.
+    """
+    info = {"tokens_contexto": 0, "trechos_usados": 0, "trechos_duplicados": 0, "trechos_fora_do_orcamento": 0}
+    n = len(chunks)
+    if n == 0:
+        return [], [], info
+
+    vectors = _normalize(embeddings)
+    similaridades = vectors @ vectors.T
+    if query_embedding is not None:
+        relevancia = vectors @ _normalize(query_embedding).reshape(-1)
+    else:
+        relevancia = 1.0 - np.arange(n) / n
+
+    escolhidos = []
+    restantes = list(range(n))
+    max_sim = np.full(n, -np.inf, dtype=np.float32)  # similaridade com os já escolhidos
+    while restantes:
+        if mmr_lambda is None or not escolhidos:
+            i = restantes[0]
+        else:
+            pontuacoes = [mmr_lambda * relevancia[j] - (1 - mmr_lambda) * max_sim[j] for j in restantes]
+            i = restantes[int(np.argmax(pontuacoes))]
+        restantes.remove(i)
+
+        if max_sim[i] >= dedup_threshold:
+            info["trechos_duplicados"] += 1
+            continue
+        custo = count_tokens(chunks[i]) + 1  # + quebra de linha
+        if info["tokens_contexto"] + custo > budget:
+            info["trechos_fora_do_orcamento"] += 1
+            continue
+        escolhidos.append(i)
+        info["tokens_contexto"] += custo
+        max_sim = np.maximum(max_sim, similaridades[i])
+
+    trechos = [chunks[i] for i in escolhidos]
+    if not escolhidos and budget > 1:
+        # Nenhum trecho inteiro coube: o mais relevante entra cortado
+        escolhidos, trechos = [0], [truncate_to_budget(chunks[0], budget - 1)]
+        info["trechos_fora_do_orcamento"] -= 1
+        info["tokens_contexto"] = count_tokens(trechos[0]) + 1
+    info["trechos_usados"] = len(escolhidos)
+    return escolhidos, trechos, info
+
+
+def truncate_to_budget(text, budget, chars_per_token=CHARS_PER_TOKEN):
+    """Corta o texto no último espaço antes de budget tokens (estimados)"""
+    limite = int(budget * chars_per_token)
+    if len(text) <= limite:
+        return text
+    corte = text.rfind(" ", 0, limite)
+    return text[:corte if corte > 0 else limite]
@@ -0,0 +1,193 @@
+import os
+import re
+import json
+import mmap
+import time
+import struct
+import unicodedata
+from array import array
+from collections import Counter
+import numpy as np
+
+# Layout do arquivo (inteiros little-endian):
+#   cabeçalho: MAGIC, n_docs, n_termos, n_postings, offset e tamanho do vocabulário,
+#              tamanho e mtime do chunk store de origem, comprimento médio dos docs
+#   doc_len:   n_docs x uint32, número de tokens de cada trecho (0 = removido)
+#   termos:    (n_termos + 1) x uint64, início das postings de cada termo
+#   doc_ids:   n_postings x uint32, ids dos trechos (crescentes dentro do termo)
+#   tfs:       n_postings x uint16, frequência do termo no trecho
+#   vocab:     JSON com a lista de termos, na ordem da tabela de termos
+# Os ids são os mesmos do FAISS e do chunk store.
+MAGIC = b"MACHBM25"
+HEADER = struct.Struct("<8sQQQQQQqd")
+
+# Parâmetros usuais do BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Palavras funcionais do português, já sem acentos
+STOPWORDS = frozenset("""
+a ao aos as ate com como da das de dela dele delas deles depois do dos e ela elas ele eles
+em entre era eram essa esse esta este eu foi for ha isso isto ja lhe lhes mais mas me mesmo
+meu minha muito na nas nao nem no nos num numa o os ou para pela pelas pelo pelos por qual
+quando que quem se sem ser seu seus sua suas so tambem te tem tinha tu um uma umas uns vos
+""".split())
+
+
+def fold_accents(text):
+    """Remove acentos e cedilhas ("Rubião" -> "Rubiao")"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    """Tokens em minúsculas, sem acentos e sem palavras funcionais.
+
+    Formas com pronome enclítico ("disse-lhe") são separadas no hífen.
+    """
+    return [t for t in _TOKEN_RE.findall(fold_accents(text.casefold()))
+            if len(t) > 1 and t not in STOPWORDS]
+
+
+def _source_stamp(chunks_path):
+    stat = os.stat(chunks_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def build_lexical_index(path, chunks):
+    """Constrói o índice BM25 a partir de um ChunkStore e o grava em path"""
+    print("\n🔤 Construindo índice lexical (BM25)...")
+    start_time = time.time()
+    n_docs = chunks.id_limit
+    doc_len = array("I", bytes(4 * n_docs))
+    postings = {}
+    for idx in chunks:
+        tokens = tokenize(chunks.text(idx))
+        doc_len[idx] = len(tokens)
+        for termo, tf in Counter(tokens).items():
+            lista = postings.get(termo)
+            if lista is None:
+                lista = postings[termo] = (array("I"), array("H"))
+            lista[0].append(idx)
+            lista[1].append(min(tf, 0xFFFF))
+
+    vocab = sorted(postings)
+    offsets = array("Q", [0])
+    for termo in vocab:
+        offsets.append(offsets[-1] + len(postings[termo][0]))
+    n_postings = offsets[-1]
+    validos = sum(1 for n in doc_len if n)
+    avgdl = sum(doc_len) / validos if validos else 0.0
+    tamanho, mtime = _source_stamp(chunks.path)
+
+    vocab_bytes = json.dumps(vocab, ensure_ascii=False).encode("utf-8")
+    offset_vocab = HEADER.size + 4 * n_docs + 8 * (len(vocab) + 1) + 6 * n_postings
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, n_docs, len(vocab), n_postings, offset_vocab, len(vocab_bytes),
+                            tamanho, mtime, avgdl))
+        f.write(doc_len.tobytes())
+        f.write(offsets.tobytes())
+        for termo in vocab:
+            f.write(postings[termo][0].tobytes())
+        for termo in vocab:
+            f.write(postings[termo][1].tobytes())
+        f.write(vocab_bytes)
+    os.replace(tmp_path, path)
+
+    tamanho_mb = os.path.getsize(path) / 1024**2
+    print(f"✅ BM25 com {len(vocab)} termos e {n_postings} postings ({tamanho_mb:.1f} MB) "
+          f"construído em {time.time() - start_time:.1f}s")
+    return LexicalIndex(path)
+
+
+class LexicalIndex:
+    """Índice invertido BM25 mapeado em memória"""
+
+    def __init__(self, path, k1=BM25_K1, b=BM25_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, n_docs, n_termos, n_postings, offset_vocab, tamanho_vocab,
+         tamanho, mtime, avgdl) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} não é um índice BM25 válido")
+        self.n_docs = n_docs
+        self.source_stamp = (tamanho, mtime)
+        self.avgdl = avgdl or 1.0
+
+        pos = HEADER.size
+        self._doc_len = np.frombuffer(self._mm, dtype="<u4", count=n_docs, offset=pos)
+        pos += 4 * n_docs
+        self._offsets = np.frombuffer(self._mm, dtype="<u8", count=n_termos + 1, offset=pos)
+        pos += 8 * (n_termos + 1)
+        self._doc_ids = np.frombuffer(self._mm, dtype="<u4", count=n_postings, offset=pos)
+        pos += 4 * n_postings
+        self._tfs = np.frombuffer(self._mm, dtype="<u2", count=n_postings, offset=pos)
+        vocab = json.loads(self._mm[offset_vocab:offset_vocab + tamanho_vocab].decode("utf-8"))
+        self._termos = {termo: i for i, termo in enumerate(vocab)}
+        self._n_validos = int(np.count_nonzero(self._doc_len))
+        # Normalização por comprimento do BM25, pré-calculada por trecho
+        self._norm = (self.k1 * (1 - self.b + self.b * self._doc_len / self.avgdl)).astype(np.float32)
+
+    def search(self, query, top_k, mask=None):
+        """Retorna (ids, pontuações) dos top_k trechos com maior BM25.
+
+        mask (booleana, indexada pelo id) restringe a busca a um shard.
+        """
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for termo, qtf in Counter(tokenize(query)).items():
+            t = self._termos.get(termo)
+            if t is None:
+                continue
+            inicio, fim = int(self._offsets[t]), int(self._offsets[t + 1])
+            ids = self._doc_ids[inicio:fim]
+            tf = self._tfs[inicio:fim].astype(np.float32)
+            df = fim - inicio
+            idf = np.log(1 + (self._n_validos - df + 0.5) / (df + 0.5))
+            scores[ids] += qtf * idf * tf * (self.k1 + 1) / (tf + self._norm[ids])
+
+        if mask is not None:
+            scores *= mask
+        candidatos = np.flatnonzero(scores)
+        if len(candidatos) > top_k:
+            candidatos = candidatos[np.argpartition(-scores[candidatos], top_k - 1)[:top_k]]
+        ordem = candidatos[np.argsort(-scores[candidatos], kind="stable")]
+        return [int(i) for i in ordem], [float(scores[i]) for i in ordem]
+
+    def close(self):
+        del self._doc_len, self._offsets, self._doc_ids, self._tfs
+        self._mm.close()
+        self._file.close()
+
+
+def load_or_create_lexical_index(path, chunks):
+    """Carrega o índice BM25 ou o reconstrói se o chunk store mudou desde a construção"""
+    if os.path.exists(path):
+        try:
+            lexical = LexicalIndex(path)
+        except (ValueError, struct.error):
+            lexical = None
+        if lexical is not None:
+            if lexical.source_stamp == _source_stamp(chunks.path):
+                print(f"✅ Índice lexical carregado de {path}")
+                return lexical
+            lexical.close()
+            print("🔄 Trechos alterados desde a construção do índice lexical")
+    return build_lexical_index(path, chunks)
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=60):
+    """Combina listas de ids ordenadas por relevância (RRF: soma de 1 / (k + posição))"""
+    scores = {}
+    for ranking in rankings:
+        for posicao, idx in enumerate(ranking, 1):
+            scores[idx] = scores.get(idx, 0.0) + 1.0 / (k + posicao)
+    ordem = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return ordem, [scores[idx] for idx in ordem]
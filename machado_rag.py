@@ -1,52 +1,192 @@
 # machado_rag.py - Teste Comparativo de LLMs
 
-import os
-import json
-import faiss
-import numpy as np
-import requests
 import time
-from utils import load_documents, create_embeddings, search_similar_chunks
-from sentence_transformers import SentenceTransformer
+inicio_script = time.perf_counter()
+import re
+import requests
+# utils não importa sentence_transformers/torch até o modelo ser carregado,
+# o que acontece em segundo plano (ver carregar_recursos)
+from utils import Retriever, run_concurrently, run_in_background
+import vector_index
+from ollama_client import OllamaClient, describe_metrics
+from tracing import Trace, describe_trace
+from results_store import ResultsStore, new_run_id
+from context_packing import estimate_tokens, pack_context
+from semantic_cache import SemanticCache
+from retrieval_client import RemoteRetriever
+import lexical_index
+import binary_index
+tempo_importacao = time.perf_counter() - inicio_script
 
 # CONFIGURACOES
 DATA_DIR = "/home/umbelito/rag_machado_de_assis/obras/raw/txt"
-CATEGORIAS = ["romance", "cronica"]
+CATEGORIAS = ["romance", "cronica"]  # None = todas as categorias de DATA_DIR
+INGESTION_WORKERS = None  # processos para ler/dividir o corpus (None = todos os núcleos)
+EMBEDDING_WORKERS = 1  # processos que geram embeddings ao construir o índice
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 INDEX_PATH = "index/faiss_index.bin"
-METADATA_PATH = "embeddings/metadata.json"
+CHUNKS_PATH = "embeddings/chunks.bin"
 OLLAMA_URL = "http://localhost:11434/api/generate"
+OLLAMA_STREAM = True  # recebe os tokens à medida que são gerados (mede o primeiro token)
+OLLAMA_CONNECT_TIMEOUT = 5  # segundos
+OLLAMA_READ_TIMEOUT = 120  # segundos sem receber dados do servidor
+OLLAMA_RETRIES = 2  # novas tentativas em falhas de conexão/timeout/5xx
+RESULTS_DB = "resultados/resultados.sqlite"  # resultados de todas as execuções (ver analisar_resultados.py)
+
+# ÍNDICE FAISS: string do faiss.index_factory ou preset de vector_index.INDEX_PRESETS
+# ("flat", "ivf_flat", "ivf_pq", "hnsw"). nprobe/ef_search valem na consulta.
+INDEX_CONFIG = {"factory": "Flat", "nprobe": 16, "ef_search": 64}
 
 # MODELOS PARA COMPARAÇÃO
 LLM_3B_MODEL = "llama2"  # LLM de 3B parâmetros (sem RAG)
 LLM_1B_MODEL = "tinyllama"  # LLM de 1B parâmetros (com RAG)
 TOP_K = 5
+QUERY_CACHE_SIZE = 1024  # embeddings de perguntas mantidos em cache (LRU)
+
+# CONTEXTO DO PROMPT RAG: orçamento de tokens (estimados) do prompt inteiro por
+# modelo; trechos quase idênticos (cosseno >= CONTEXT_DEDUP_THRESHOLD) entram
+# uma vez só. CONTEXT_MMR_LAMBDA (ex.: 0.7) reordena os trechos por MMR,
+# trocando relevância por diversidade; None mantém a ordem da busca.
+CONTEXT_TOKEN_BUDGET = {"tinyllama": 1536, "llama2": 3072}
+CONTEXT_DEFAULT_BUDGET = 2048
+CONTEXT_DEDUP_THRESHOLD = 0.95
+CONTEXT_MMR_LAMBDA = None
+
+# SERVIDOR DE RECUPERAÇÃO (servidor_recuperacao.py): com a URL, o índice e o
+# modelo de embeddings já carregados no servidor são usados em vez de carregados
+# aqui. None = índice local (também usado se o servidor não responder).
+RETRIEVAL_SERVICE_URL = None  # ex.: "http://127.0.0.1:8765"
+
+# BUSCA HÍBRIDA: índice BM25 sobre os mesmos trechos, combinado ao FAISS por RRF
+HYBRID_SEARCH = True
+LEXICAL_PATH = "embeddings/bm25.bin"
+HYBRID_CANDIDATES = 20  # candidatos de cada busca (densa e lexical) antes da fusão
+
+# BUSCA EM DOIS ESTÁGIOS: varre uma cópia binária dos vetores (1 bit por dimensão,
+# 32x menor) por distância de Hamming e reordena os RERANK_CANDIDATES mais
+# próximos pela distância exata no índice FAISS. Exige índice sem IVF (ex.: Flat).
+TWO_STAGE_SEARCH = False
+BINARY_INDEX_PATH = "index/faiss_index.binary.bin"
+RERANK_CANDIDATES = 256
+
+# CACHE SEMÂNTICO: perguntas com similaridade de cosseno >= SEMANTIC_CACHE_THRESHOLD
+# a uma já respondida (com os mesmos filtros e a mesma configuração, ver
+# configuracao_respostas) reaproveitam os trechos e as respostas dela, sem
+# recuperação nem geração. None em SEMANTIC_CACHE_PATH mantém o cache só em
+# memória, durante a sessão.
+SEMANTIC_CACHE = True
+SEMANTIC_CACHE_PATH = "resultados/cache_semantico.sqlite"
+SEMANTIC_CACHE_THRESHOLD = 0.9
+SEMANTIC_CACHE_MAX_ENTRIES = 1000
+SEMANTIC_CACHE_TTL = 7 * 86400  # segundos
+
+# Executa os dois braços (3B sem RAG e 1B com RAG) ao mesmo tempo; a latência
+# por pergunta passa a ser a do braço mais lento. O Ollama precisa manter os dois
+# modelos carregados (OLLAMA_MAX_LOADED_MODELS >= 2) e as respostas só aparecem
+# no final. Com False (padrão), as respostas são exibidas em streaming, uma após
+# a outra.
+CONCURRENT_ARMS = False
+
+# Cliente compartilhado: as conexões com o Ollama são reaproveitadas entre chamadas
+ollama = OllamaClient(OLLAMA_URL, OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT, OLLAMA_RETRIES)
+# Perguntas salvas nesta sessão ficam agrupadas sob o mesmo identificador
+execucao = new_run_id("machado_rag")
 
 
 def load_or_create_index():
     """Carrega ou cria o índice FAISS para RAG"""
-    if os.path.exists(INDEX_PATH) and os.path.exists(METADATA_PATH):
-        print("\n✅ Índice FAISS encontrado. Carregando...")
-        index = faiss.read_index(INDEX_PATH)
-        with open(METADATA_PATH, "r", encoding="utf-8") as f:
-            metadata = json.load(f)
-        return index, metadata
+    return vector_index.load_or_create_index(DATA_DIR, CATEGORIAS, EMBEDDING_MODEL,
+                                             INDEX_PATH, CHUNKS_PATH, INDEX_CONFIG,
+                                             INGESTION_WORKERS, EMBEDDING_WORKERS)
+
 
-    print("\n🔧 Construindo índice FAISS...")
-    docs, metadata = load_documents(DATA_DIR, CATEGORIAS)
-    model = SentenceTransformer(EMBEDDING_MODEL)
-    embeddings = create_embeddings(docs, model)
+def criar_retriever():
+    """Retriever do índice local ou, com RETRIEVAL_SERVICE_URL, cliente do servidor de recuperação"""
+    if RETRIEVAL_SERVICE_URL:
+        try:
+            retriever = RemoteRetriever(RETRIEVAL_SERVICE_URL)
+            print(f"🛰️  Usando o servidor de recuperação em {RETRIEVAL_SERVICE_URL}")
+            return retriever
+        except requests.RequestException as e:
+            print(f"⚠️  Servidor de recuperação indisponível ({e}); carregando o índice localmente")
+    index, chunks = load_or_create_index()
+    lexical = lexical_index.load_or_create_lexical_index(LEXICAL_PATH, chunks) if HYBRID_SEARCH else None
+    binario = (binary_index.load_or_create_binary_index(BINARY_INDEX_PATH, index, INDEX_PATH)
+               if TWO_STAGE_SEARCH else None)
+    return Retriever(index, chunks, EMBEDDING_MODEL, cache_size=QUERY_CACHE_SIZE,
+                     lexical_index=lexical, candidates=HYBRID_CANDIDATES,
+                     shards=vector_index.load_shards(INDEX_PATH), binary_index=binario,
+                     rerank_candidates=RERANK_CANDIDATES)
 
-    index = faiss.IndexFlatL2(embeddings.shape[1])
-    index.add(embeddings)
 
-    os.makedirs("index", exist_ok=True)
-    os.makedirs("embeddings", exist_ok=True)
-    faiss.write_index(index, INDEX_PATH)
-    with open(METADATA_PATH, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, ensure_ascii=False, indent=2)
+def configuracao_respostas(retriever):
+    """Tudo o que determina os trechos e as respostas de uma pergunta.
 
-    return index, metadata
+    Entradas do cache semântico gravadas com outra configuração, ou antes da
+    última construção/atualização do índice, são descartadas.
+    """
+    if isinstance(retriever, RemoteRetriever):
+        info = retriever.info()
+        busca = {"indice": info.get("indice"), "busca_hibrida": info.get("busca_hibrida"),
+                 "busca_dois_estagios": info.get("busca_dois_estagios")}
+    else:
+        busca = {"indice": INDEX_CONFIG, "busca_hibrida": HYBRID_SEARCH, "busca_dois_estagios": TWO_STAGE_SEARCH}
+    return {
+        "modelos": [LLM_3B_MODEL, LLM_1B_MODEL],
+        "top_k": TOP_K,
+        **busca,
+        "contexto": {"orcamento": CONTEXT_TOKEN_BUDGET, "orcamento_padrao": CONTEXT_DEFAULT_BUDGET,
+                     "dedup": CONTEXT_DEDUP_THRESHOLD, "mmr": CONTEXT_MMR_LAMBDA},
+        "next_id": retriever.shards.id_limit,
+        "indice_atualizado_em": retriever.shards.updated_at,
+    }
+
+
+def carregar_recursos():
+    """Carrega o índice, os trechos, o modelo de embeddings e o cache semântico.
+
+    Roda em segundo plano enquanto a primeira pergunta é digitada; retorna
+    o retriever, o cache semântico (ou None) e o tempo gasto.
+    """
+    start_time = time.perf_counter()
+    retriever = criar_retriever()
+    retriever.warm_up()
+    cache_semantico = None
+    if SEMANTIC_CACHE:
+        cache_semantico = SemanticCache(retriever.dimension, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES,
+                                        SEMANTIC_CACHE_TTL, SEMANTIC_CACHE_PATH,
+                                        config=configuracao_respostas(retriever))
+    return retriever, cache_semantico, time.perf_counter() - start_time
+
+
+def aguardar_recursos(carregamento):
+    """Espera o carregamento iniciado em segundo plano (só o que ainda falta)"""
+    start_time = time.perf_counter()
+    if not carregamento.done():
+        print("⏳ Aguardando o carregamento do índice e do modelo de embeddings...")
+    retriever, cache_semantico, tempo_carregamento = carregamento.result()
+    espera = time.perf_counter() - start_time
+    print(f"✅ Índice e modelo carregados em {tempo_carregamento:.2f}s (espera da primeira pergunta: {espera:.2f}s)")
+    print("🗂️  Categorias indexadas: " + ", ".join(f"{c} ({n} trechos)"
+                                                  for c, n in retriever.shards.categorias().items()))
+    if cache_semantico is not None:
+        print(f"⚡ Cache semântico: {len(cache_semantico)} perguntas já respondidas")
+        if cache_semantico.discarded:
+            print(f"🧹 {cache_semantico.discarded} respostas do cache descartadas "
+                  f"(modelos, parâmetros ou índice mudaram)")
+    return retriever, cache_semantico
+
+
+def extrair_filtros(pergunta):
+    """Separa filtros de busca da pergunta ("categoria:teatro", "obra:domCasmurro")"""
+    filtros = {}
+    for campo, valor in re.findall(r"\b(categoria|obra):(\S+)", pergunta):
+        if campo == "obra":
+            filtros["arquivo"] = valor if valor.endswith(".txt") else valor + ".txt"
+        else:
+            filtros["categoria"] = valor
+    pergunta = re.sub(r"\b(categoria|obra):\S+", "", pergunta)
+    return " ".join(pergunta.split()), filtros
 
 
 def montar_prompt_rag(pergunta, trechos):
@@ -60,6 +200,20 @@ Pergunta: {pergunta}
 Responda baseado no contexto fornecido:"""
 
 
+def empacotar_contexto(pergunta, resultado, model):
+    """Escolhe os trechos de um resultado de Retriever.search_batch(..., with_embeddings=True)
+    que cabem no orçamento de tokens do modelo, sem repetições.
+    Retorna os trechos e o resumo de context_packing.pack_context.
+    """
+    orcamento = CONTEXT_TOKEN_BUDGET.get(model.split(":")[0], CONTEXT_DEFAULT_BUDGET)
+    orcamento -= estimate_tokens(montar_prompt_rag(pergunta, []))
+    _, trechos, info = pack_context(resultado["trechos"], resultado["embeddings"], orcamento,
+                                    query_embedding=resultado["embedding_pergunta"],
+                                    dedup_threshold=CONTEXT_DEDUP_THRESHOLD,
+                                    mmr_lambda=CONTEXT_MMR_LAMBDA)
+    return trechos, info
+
+
 def montar_prompt_simples(pergunta):
     """Monta prompt simples sem contexto para geração pura"""
     return f"""Você é um especialista em literatura brasileira, especialmente na obra de Machado de Assis.
@@ -69,43 +223,129 @@ Pergunta: {pergunta}
 Responda com base no seu conhecimento sobre Machado de Assis:"""
 
 
-def gerar_resposta(prompt, model):
-    """Gera resposta usando a LLM especificada"""
+def gerar_resposta(prompt, model, mostrar=False):
+    """Gera resposta usando a LLM especificada.
+
+    Retorna o texto e as métricas da geração (tempo até o primeiro token,
+    tokens/s, eval_count/eval_duration do Ollama). Com mostrar=True os
+    tokens são impressos à medida que chegam.
+    """
+    on_token = (lambda fragmento: print(fragmento, end="", flush=True)) if mostrar else None
     try:
-        response = requests.post(OLLAMA_URL, json={
-            "model": model,
-            "prompt": prompt,
-            "stream": False
-        })
-        return response.json().get("response", "[Erro ao gerar resposta]")
+        metricas = ollama.generate(prompt, model, stream=OLLAMA_STREAM, on_token=on_token)
+        return metricas.pop("resposta") or "[Erro ao gerar resposta]", metricas
     except Exception as e:
-        return f"[Erro na comunicação com o modelo {model}: {str(e)}]"
+        mensagem = f"[Erro na comunicação com o modelo {model}: {str(e)}]"
+        if mostrar:
+            print(mensagem)
+        return mensagem, {"erro": str(e)}
 
 
-def salvar_resultados(pergunta, resposta_3b, resposta_1b, tempo_3b, tempo_1b):
-    """Salva os resultados da comparação em arquivo JSON"""
+def braco_sem_rag(pergunta, mostrar=False):
+    """LLM de 3B sem RAG (geração pura); retorna resposta, métricas, tempos e etapas"""
+    trace = Trace()
+    with trace.stage("montagem_prompt"):
+        prompt = montar_prompt_simples(pergunta)
+    if mostrar:
+        print("\n📚 LLM de 3B parâmetros (SEM RAG):")
+        print("-" * 50)
+        print("💬 Resposta:")
+    start_time = time.time()
+    resposta, metricas = gerar_resposta(prompt, LLM_3B_MODEL, mostrar)
+    tempo = time.time() - start_time
+    trace.add_generation(metricas)
+    return {"resposta": resposta, "metricas": metricas, "tempo": tempo,
+            "tempo_ponta_a_ponta": trace.total, "etapas": trace.to_dict(),
+            "tokens_prompt": estimate_tokens(prompt)}
+
+
+def braco_com_rag(pergunta, retriever, filtros=None, mostrar=False):
+    """LLM de 1B com RAG: recupera os trechos e gera a resposta.
+
+    "tempo" mede só a geração, como no braço sem RAG; a recuperação fica
+    em "tempo_recuperacao" e "tempo_ponta_a_ponta" soma todas as etapas.
+    """
+    trace = Trace()
+    start_time = time.time()
+    resultado = retriever.search_batch([pergunta], TOP_K, **(filtros or {}), trace=trace,
+                                       with_embeddings=True)[0]
+    tempo_recuperacao = time.time() - start_time
+    with trace.stage("montagem_prompt"):
+        trechos, contexto = empacotar_contexto(pergunta, resultado, LLM_1B_MODEL)
+        prompt = montar_prompt_rag(pergunta, trechos)
+    if mostrar:
+        print("\n🔍 LLM de 1B parâmetros (COM RAG):")
+        print("-" * 50)
+        print(f"📖 Trechos relevantes encontrados: {len(resultado['trechos'])} "
+              f"({len(trechos)} no contexto, {contexto['tokens_contexto']} tokens)")
+        print("💬 Resposta:")
+    start_time = time.time()
+    resposta, metricas = gerar_resposta(prompt, LLM_1B_MODEL, mostrar)
+    tempo = time.time() - start_time
+    trace.add_generation(metricas)
+    return {"resposta": resposta, "metricas": metricas, "tempo": tempo,
+            "tempo_recuperacao": tempo_recuperacao, "tempo_ponta_a_ponta": trace.total,
+            "etapas": trace.to_dict(), "trechos": trechos,
+            "trechos_encontrados": len(resultado["trechos"]), "contexto": contexto,
+            "tokens_prompt": estimate_tokens(prompt)}
+
+
+def mostrar_resposta_em_cache(valor, similaridade, pergunta_original, tempo):
+    """Exibe as respostas guardadas no cache semântico para uma pergunta parecida"""
+    braco_3b, braco_1b = valor["llm_3b_sem_rag"], valor["llm_1b_com_rag"]
+    print(f"\n⚡ Resposta do cache semântico em {tempo*1000:.1f}ms "
+          f"(similaridade {similaridade:.3f} com \"{pergunta_original}\")")
+    print("\n📚 LLM de 3B parâmetros (SEM RAG):")
+    print("-" * 50)
+    print(f"💬 Resposta:\n{braco_3b['resposta']}")
+    print("\n🔍 LLM de 1B parâmetros (COM RAG):")
+    print("-" * 50)
+    print(f"📖 Trechos no contexto: {len(braco_1b['trechos'])}")
+    print(f"💬 Resposta:\n{braco_1b['resposta']}")
+    print(f"\n🕐 Tempos da resposta original (ponta a ponta): 3B {braco_3b['tempo_ponta_a_ponta']:.2f}s, "
+          f"1B + RAG {braco_1b['tempo_ponta_a_ponta']:.2f}s")
+    print("\n" + "=" * 80)
+
+
+def salvar_resultados(pergunta, resposta_3b, resposta_1b, tempo_3b, tempo_1b,
+                      metricas_3b=None, metricas_1b=None, braco_3b=None, braco_1b=None):
+    """Acrescenta os resultados da comparação a RESULTS_DB.
+
+    braco_3b/braco_1b (retornos de braco_sem_rag/braco_com_rag) acrescentam
+    o tempo ponta a ponta e os tempos de cada etapa.
+    """
     resultado = {
         "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
         "pergunta": pergunta,
         "llm_3b_sem_rag": {
             "modelo": LLM_3B_MODEL,
             "resposta": resposta_3b,
-            "tempo": tempo_3b
+            "tempo": tempo_3b,
+            "metricas": metricas_3b or {}
         },
         "llm_1b_com_rag": {
             "modelo": LLM_1B_MODEL,
             "resposta": resposta_1b,
-            "tempo": tempo_1b
+            "tempo": tempo_1b,
+            "metricas": metricas_1b or {}
         }
     }
+    for chave, braco in (("llm_3b_sem_rag", braco_3b), ("llm_1b_com_rag", braco_1b)):
+        if braco is not None:
+            resultado[chave]["tempo_ponta_a_ponta"] = braco["tempo_ponta_a_ponta"]
+            resultado[chave]["etapas"] = braco["etapas"]
+            resultado[chave]["tokens_prompt"] = braco["tokens_prompt"]
+    if braco_1b is not None:
+        resultado["llm_1b_com_rag"]["trechos_encontrados"] = braco_1b["trechos_encontrados"]
+        resultado["llm_1b_com_rag"]["contexto"] = braco_1b["contexto"]
     
-    os.makedirs("resultados", exist_ok=True)
-    arquivo_resultado = f"resultados/comparacao_{int(time.time())}.json"
-    
-    with open(arquivo_resultado, "w", encoding="utf-8") as f:
-        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    store = ResultsStore(RESULTS_DB)
+    try:
+        store.append([resultado], execucao, "machado_rag")
+    finally:
+        store.close()
     
-    print(f"\n💾 Resultados salvos em: {arquivo_resultado}")
+    print(f"\n💾 Resultados salvos em: {RESULTS_DB} (execução {execucao})")
 
 
 if __name__ == "__main__":
@@ -115,60 +355,113 @@ if __name__ == "__main__":
     print(f"🔍 LLM de 1B parâmetros: {LLM_1B_MODEL} (COM RAG)")
     print("=" * 60)
     
-    # Carrega o índice FAISS para RAG
-    index, metadata = load_or_create_index()
+    # Índice FAISS, trechos e modelo de embeddings (ou a conexão ao servidor de
+    # recuperação) carregam em segundo plano enquanto a primeira pergunta é digitada
+    carregamento = run_in_background(carregar_recursos)
+    retriever = cache_semantico = None
+    print("   Para restringir a busca, inclua categoria:<nome> ou obra:<arquivo> na pergunta")
+    print(f"🚀 Pronto em {time.perf_counter() - inicio_script:.2f}s (importações: {tempo_importacao:.2f}s); "
+          f"índice e modelo carregando em segundo plano")
     
     while True:
         pergunta = input("\nDigite sua pergunta sobre Machado de Assis (ou 'sair'): ")
         if pergunta.lower() in ["sair", "exit", "quit"]:
             break
         
+        if retriever is None:
+            retriever, cache_semantico = aguardar_recursos(carregamento)
+            shards = retriever.shards
+        
+        pergunta, filtros = extrair_filtros(pergunta)
         if not pergunta.strip():
             print("❌ Por favor, digite uma pergunta válida.")
             continue
+        try:
+            shards.mask(**filtros)
+        except ValueError as e:
+            print(f"❌ {e}")
+            continue
         
         # Executar comparação e capturar tempos
         print(f"\n🤔 Pergunta: {pergunta}")
+        if filtros:
+            print(f"🗂️  Filtro: {filtros}")
         print("=" * 80)
         
-        # 1. LLM de 3B sem RAG (geração pura)
-        print("\n📚 LLM de 3B parâmetros (SEM RAG):")
-        print("-" * 50)
-        prompt_3b = montar_prompt_simples(pergunta)
-        start_time = time.time()
-        resposta_3b = gerar_resposta(prompt_3b, LLM_3B_MODEL)
-        tempo_3b = time.time() - start_time
-        print(f"⏱️  Tempo de resposta: {tempo_3b:.2f}s")
-        print(f"💬 Resposta:\n{resposta_3b}")
+        # Pergunta parecida com uma já respondida: trechos e respostas do cache.
+        # Não são oferecidas para salvar, pois não são uma nova medição.
+        if cache_semantico is not None:
+            start_time = time.time()
+            embedding_pergunta = retriever.embed_query(pergunta)
+            acerto = cache_semantico.lookup(embedding_pergunta, filtros)
+            if acerto is not None:
+                mostrar_resposta_em_cache(*acerto, time.time() - start_time)
+                continue
         
-        # 2. LLM de 1B com RAG
-        print("\n🔍 LLM de 1B parâmetros (COM RAG):")
-        print("-" * 50)
-        trechos = search_similar_chunks(pergunta, index, metadata, EMBEDDING_MODEL, TOP_K)
-        prompt_1b = montar_prompt_rag(pergunta, trechos)
+        # 1. LLM de 3B sem RAG e 2. LLM de 1B com RAG (a recuperação do braço
+        # com RAG se sobrepõe à geração do 3B quando CONCURRENT_ARMS)
+        if CONCURRENT_ARMS:
+            print("\n⏳ Gerando as duas respostas em paralelo...")
         start_time = time.time()
-        resposta_1b = gerar_resposta(prompt_1b, LLM_1B_MODEL)
-        tempo_1b = time.time() - start_time
-        print(f"⏱️  Tempo de resposta: {tempo_1b:.2f}s")
-        print(f"📖 Trechos relevantes encontrados: {len(trechos)}")
-        print(f"💬 Resposta:\n{resposta_1b}")
+        braco_3b, braco_1b = run_concurrently([
+            lambda: braco_sem_rag(pergunta, mostrar=not CONCURRENT_ARMS),
+            lambda: braco_com_rag(pergunta, retriever, filtros, mostrar=not CONCURRENT_ARMS),
+        ], CONCURRENT_ARMS)
+        tempo_pergunta = time.time() - start_time
+        resposta_3b, metricas_3b, tempo_3b = braco_3b["resposta"], braco_3b["metricas"], braco_3b["tempo"]
+        resposta_1b, metricas_1b, tempo_1b = braco_1b["resposta"], braco_1b["metricas"], braco_1b["tempo"]
+        
+        if CONCURRENT_ARMS:
+            print("\n📚 LLM de 3B parâmetros (SEM RAG):")
+            print("-" * 50)
+            print(f"💬 Resposta:\n{resposta_3b}")
+            print("\n🔍 LLM de 1B parâmetros (COM RAG):")
+            print("-" * 50)
+            print(f"📖 Trechos relevantes encontrados: {braco_1b['trechos_encontrados']} "
+                  f"({len(braco_1b['trechos'])} no contexto, {braco_1b['contexto']['tokens_contexto']} tokens)")
+            print(f"💬 Resposta:\n{resposta_1b}")
         
         # 3. Comparação
-        print("\n📊 COMPARAÇÃO:")
+        print("\n\n📊 COMPARAÇÃO:")
         print("-" * 50)
-        print(f"🕐 Tempo 3B (sem RAG): {tempo_3b:.2f}s")
-        print(f"🕐 Tempo 1B (com RAG): {tempo_1b:.2f}s")
-        print(f"⚡ Diferença: {abs(tempo_3b - tempo_1b):.2f}s")
+        print(f"🕐 Tempo 3B (sem RAG): {tempo_3b:.2f}s ({describe_metrics(metricas_3b)})")
+        print(f"🕐 Tempo 1B (com RAG): {tempo_1b:.2f}s ({describe_metrics(metricas_1b)})")
+        print(f"🔍 Recuperação: {braco_1b['tempo_recuperacao']*1000:.0f}ms")
+        print(f"📝 Tokens do prompt (estimados): 3B {braco_3b['tokens_prompt']}, 1B {braco_1b['tokens_prompt']} "
+              f"({braco_1b['contexto']['trechos_duplicados']} trechos repetidos e "
+              f"{braco_1b['contexto']['trechos_fora_do_orcamento']} fora do orçamento descartados)")
+        print(f"🧭 Etapas 3B: {describe_trace(braco_3b['etapas'])}")
+        print(f"🧭 Etapas 1B: {describe_trace(braco_1b['etapas'])}")
+        # O veredito compara o caminho completo de cada braço, recuperação incluída
+        ponta_3b, ponta_1b = braco_3b["tempo_ponta_a_ponta"], braco_1b["tempo_ponta_a_ponta"]
+        print(f"⚡ Diferença ponta a ponta: {abs(ponta_3b - ponta_1b):.2f}s "
+              f"(3B {ponta_3b:.2f}s, 1B + RAG {ponta_1b:.2f}s)")
+        print(f"⏱️  Tempo total da pergunta: {tempo_pergunta:.2f}s "
+              f"({'em paralelo' if CONCURRENT_ARMS else 'em sequência'})")
         
-        if tempo_1b < tempo_3b:
+        if ponta_1b < ponta_3b:
             print("🏆 LLM de 1B com RAG foi mais rápida!")
         else:
             print("🏆 LLM de 3B sem RAG foi mais rápida!")
         
         print("\n" + "=" * 80)
         
+        if cache_semantico is not None and "erro" not in metricas_3b and "erro" not in metricas_1b:
+            cache_semantico.put(pergunta, embedding_pergunta,
+                                {"llm_3b_sem_rag": braco_3b, "llm_1b_com_rag": braco_1b}, filtros)
+        
         salvar = input("\n💾 Deseja salvar os resultados? (s/n): ")
         if salvar.lower() in ["s", "sim", "y", "yes"]:
-            salvar_resultados(pergunta, resposta_3b, resposta_1b, tempo_3b, tempo_1b)
+            salvar_resultados(pergunta, resposta_3b, resposta_1b, tempo_3b, tempo_1b,
+                              metricas_3b, metricas_1b, braco_3b, braco_1b)
     
+    if retriever is not None:
+        stats = retriever.cache_stats()
+        print(f"\n🧠 Cache de embeddings: {stats['hits']} acertos, {stats['misses']} falhas "
+              f"({stats['taxa_acerto']*100:.1f}%)")
+    if cache_semantico is not None:
+        stats = cache_semantico.stats()
+        print(f"⚡ Cache semântico: {stats['hits']} acertos, {stats['misses']} falhas "
+              f"({stats['taxa_acerto']*100:.1f}%), {stats['entradas']} perguntas guardadas")
+        cache_semantico.close()
     print("\n👋 Teste finalizado!")
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Mede a inicialização do machado_rag.py: tempo de importação (e os módulos
+que mais pesam nele), tempo até o prompt aparecer e tempo até a primeira
+pergunta poder ser respondida (índice e modelo de embeddings carregados)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shlex
+import argparse
+import platform
+import statistics
+import subprocess
+import threading
+
+# CONFIGURAÇÕES
+SCRIPT = "machado_rag.py"
+REPETICOES = 5
+TOP_MODULOS = 10
+PERGUNTA = "Quem é Capitu?"  # digitada assim que o prompt aparece (pior caso de espera)
+PROMPT = "Digite sua pergunta"
+PRONTO = "Índice e modelo carregados"
+TIMEOUT = 600  # segundos por execução
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def medir_importacao(modulo):
+    """Tempo de importação do módulo num processo novo e de cada importação direta dele"""
+    saida = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+                           capture_output=True, text=True, check=True).stderr
+    total, diretas = None, []
+    for linha in saida.splitlines():
+        m = _IMPORTTIME_RE.match(linha)
+        if not m:
+            continue
+        nome, segundos, nivel = m.group(4), int(m.group(2)) / 1e6, (len(m.group(3)) - 1) // 2
+        if nome == modulo and nivel == 0:
+            total = segundos
+        elif nivel == 1:
+            diretas.append((nome, segundos))
+    return total, sorted(diretas, key=lambda item: -item[1])
+
+
+class Saida:
+    """Lê a saída do processo em segundo plano e marca quando cada texto aparece"""
+
+    def __init__(self, processo):
+        self.texto = ""
+        self._condicao = threading.Condition()
+        threading.Thread(target=self._ler, args=(processo.stdout.fileno(),), daemon=True).start()
+
+    def _ler(self, fd):
+        while True:
+            dados = os.read(fd, 4096)
+            if not dados:
+                break
+            with self._condicao:
+                self.texto += dados.decode("utf-8", errors="replace")
+                self._condicao.notify_all()
+
+    def esperar(self, trecho, timeout):
+        with self._condicao:
+            if not self._condicao.wait_for(lambda: trecho in self.texto, timeout):
+                raise TimeoutError(f"'{trecho}' não apareceu em {timeout}s")
+
+
+def medir_execucao(comando):
+    """Tempos até o prompt e até a primeira pergunta ser atendida, numa execução"""
+    start_time = time.perf_counter()
+    processo = subprocess.Popen(comando, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT)
+    try:
+        saida = Saida(processo)
+        saida.esperar(PROMPT, TIMEOUT)
+        ate_prompt = time.perf_counter() - start_time
+        processo.stdin.write((PERGUNTA + "\n").encode("utf-8"))
+        processo.stdin.flush()
+        saida.esperar(PRONTO, TIMEOUT)
+        ate_pronto = time.perf_counter() - start_time
+        m = re.search(r"espera da primeira pergunta: ([\d.]+)s", saida.texto)
+        return {"ate_prompt": ate_prompt, "ate_primeira_busca": ate_pronto,
+                "espera_primeira_pergunta": float(m.group(1)) if m else None}
+    finally:
+        processo.kill()
+        processo.wait()
+
+
+def resumo(valores):
+    valores = [v for v in valores if v is not None]
+    if not valores:
+        return None
+    return {"mediana": statistics.median(valores), "minimo": min(valores), "maximo": max(valores)}
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--repeticoes", type=int, default=REPETICOES)
+    parser.add_argument("--comando", default=f"{sys.executable} -u {SCRIPT}",
+                        help="comando que inicia o script interativo")
+    args = parser.parse_args()
+    comando = shlex.split(args.comando)
+
+    print("⏱️  MEDIÇÃO DA INICIALIZAÇÃO")
+    print("=" * 60)
+
+    modulo = os.path.splitext(SCRIPT)[0]
+    total, diretas = medir_importacao(modulo)
+    print(f"📦 import {modulo}: {total:.2f}s")
+    for nome, segundos in diretas[:TOP_MODULOS]:
+        print(f"   {nome:<25} {segundos:>6.3f}s")
+    carregados = subprocess.run([sys.executable, "-c", f"import sys, {modulo}; "
+                                 "print(' '.join(m for m in ('torch', 'sentence_transformers', 'pandas') "
+                                 "if m in sys.modules))"], capture_output=True, text=True).stdout.strip()
+    print(f"   Módulos pesados importados no início: {carregados or 'nenhum'}")
+
+    execucoes = []
+    for i in range(args.repeticoes):
+        execucao = medir_execucao(comando)
+        execucoes.append(execucao)
+        print(f"🚀 Execução {i + 1}: prompt em {execucao['ate_prompt']:.2f}s, primeira busca possível em "
+              f"{execucao['ate_primeira_busca']:.2f}s (espera após a pergunta: "
+              f"{execucao['espera_primeira_pergunta'] or 0:.2f}s)")
+
+    resultado = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "ambiente": {"python": platform.python_version(), "plataforma": platform.platform(),
+                     "cpus": os.cpu_count()},
+        "comando": comando,
+        "importacao": {"total": total, "modulos": dict(diretas), "pesados_no_inicio": carregados.split()},
+        "execucoes": execucoes,
+        "resumo": {chave: resumo([e[chave] for e in execucoes]) for chave in execucoes[0]} if execucoes else {},
+    }
+    for chave, valores in resultado["resumo"].items():
+        if valores is None:
+            continue
+        print(f"📊 {chave}: mediana {valores['mediana']:.2f}s (mín. {valores['minimo']:.2f}s, "
+              f"máx. {valores['maximo']:.2f}s)")
+
+    os.makedirs("analises", exist_ok=True)
+    arquivo = f"analises/inicializacao_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    with open(arquivo, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Medições salvas em: {arquivo}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import json
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+# Campos de desempenho devolvidos pelo Ollama na última mensagem (durações em ns)
+OLLAMA_STATS = ["total_duration", "load_duration", "prompt_eval_count",
+                "prompt_eval_duration", "eval_count", "eval_duration"]
+
+
+class OllamaError(Exception):
+    """Falha na geração depois de esgotadas as tentativas"""
+
+
+class OllamaClient:
+    """Cliente do /api/generate do Ollama com conexões reaproveitadas.
+
+    Uma única requests.Session mantém as conexões TCP abertas entre
+    chamadas. Em modo streaming os tokens chegam à medida que são gerados,
+    o que permite medir o tempo até o primeiro token (prefill) separado do
+    tempo de decodificação. Falhas de conexão, timeouts e erros 5xx são
+    repetidos com espera exponencial, desde que nenhum token tenha sido
+    entregue ainda.
+    """
+
+    def __init__(self, url, connect_timeout=5, read_timeout=120, retries=2, backoff=1.0,
+                 pool_size=4):
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def generate(self, prompt, model, stream=True, on_token=None, options=None, max_time=None):
+        """Gera a resposta e retorna um dicionário com o texto e as métricas.
+
+        on_token(texto) é chamado a cada fragmento recebido em streaming.
+        max_time limita a duração total de cada tentativa, em segundos (o
+        read timeout só limita o intervalo entre dados recebidos).
+        Métricas: tempo total, tempo até o primeiro token, tokens/s e os
+        campos de OLLAMA_STATS. Levanta OllamaError se todas as tentativas falharem.
+        """
+        payload = {"model": model, "prompt": prompt, "stream": stream}
+        if options:
+            payload["options"] = options
+
+        for tentativa in range(1, self.retries + 2):
+            start_time = time.perf_counter()
+            estado = {"tokens_entregues": False}
+            try:
+                if stream:
+                    resultado = self._generate_stream(payload, start_time, on_token, estado, max_time)
+                else:
+                    resultado = self._generate_once(payload, start_time, max_time)
+                resultado["tentativas"] = tentativa
+                return resultado
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                resposta = getattr(e, "response", None)
+                repetivel = resposta is None or resposta.status_code >= 500
+                if estado["tokens_entregues"] or not repetivel or tentativa > self.retries:
+                    raise OllamaError(f"{type(e).__name__}: {e}") from e
+                espera = self.backoff * 2 ** (tentativa - 1)
+                print(f"⚠️  Falha ao chamar {model} ({type(e).__name__}); "
+                      f"nova tentativa em {espera:.1f}s")
+                time.sleep(espera)
+
+    def _generate_once(self, payload, start_time, max_time):
+        timeout = self.timeout
+        if max_time is not None:
+            timeout = (self.timeout[0], min(self.timeout[1], max_time))
+        response = self.session.post(self.url, json=payload, timeout=timeout)
+        response.raise_for_status()
+        dados = response.json()
+        tempo = time.perf_counter() - start_time
+        return self._metrics(dados.get("response", ""), dados, tempo, None)
+
+    def _generate_stream(self, payload, start_time, on_token, estado, max_time):
+        partes = []
+        ttft = None
+        final = {}
+        with self.session.post(self.url, json=payload, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            for linha in response.iter_lines():
+                if not linha:
+                    continue
+                dados = json.loads(linha)
+                if "error" in dados:
+                    raise OllamaError(dados["error"])
+                fragmento = dados.get("response", "")
+                if fragmento:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start_time
+                    partes.append(fragmento)
+                    estado["tokens_entregues"] = True
+                    if on_token:
+                        on_token(fragmento)
+                if dados.get("done"):
+                    final = dados
+                    break
+                if max_time is not None and time.perf_counter() - start_time > max_time:
+                    raise requests.Timeout(f"geração excedeu {max_time}s")
+        tempo = time.perf_counter() - start_time
+        return self._metrics("".join(partes), final, tempo, ttft)
+
+    @staticmethod
+    def _metrics(texto, dados, tempo, ttft):
+        metricas = {"resposta": texto, "tempo_total": tempo, "ttft": ttft}
+        metricas.update({campo: dados.get(campo) for campo in OLLAMA_STATS})
+        if dados.get("eval_count") and dados.get("eval_duration"):
+            metricas["tokens_por_segundo"] = dados["eval_count"] / (dados["eval_duration"] / 1e9)
+        elif dados.get("eval_count") and ttft is not None and tempo > ttft:
+            # Sem eval_duration: estimativa pelo relógio do cliente
+            metricas["tokens_por_segundo"] = dados["eval_count"] / (tempo - ttft)
+        else:
+            metricas["tokens_por_segundo"] = None
+        return metricas
+
+    def close(self):
+        self.session.close()
+
+
+def describe_metrics(metricas):
+    """Resumo de uma linha das métricas de geração"""
+    partes = []
+    if metricas.get("ttft") is not None:
+        partes.append(f"primeiro token em {metricas['ttft']:.2f}s")
+    if metricas.get("tokens_por_segundo"):
+        partes.append(f"{metricas['tokens_por_segundo']:.1f} tokens/s")
+    if metricas.get("eval_count"):
+        partes.append(f"{metricas['eval_count']} tokens gerados")
+    if metricas.get("prompt_eval_count"):
+        partes.append(f"{metricas['prompt_eval_count']} tokens de prompt")
+    return " | ".join(partes) or "sem métricas"
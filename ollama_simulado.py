@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Servidor que imita a API do Ollama (/api/generate e /api/tags) com um modelo
+de latência configurável, para medir o desempenho do pipeline sem LLMs reais
+(ex.: em máquinas de CI)
+"""
+
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# CONFIGURAÇÕES
+HOST = "127.0.0.1"
+PORTA = 11434  # mesma porta do Ollama: os scripts funcionam sem alterações
+
+# Perfil de latência de cada modelo:
+#   prefill_ms_por_token: tempo de processamento do prompt, por token
+#   tokens_por_segundo:   velocidade de decodificação de uma requisição isolada
+#   carga_s:              tempo para carregar o modelo na primeira requisição
+#   paralelo:             requisições atendidas ao mesmo tempo (OLLAMA_NUM_PARALLEL);
+#                         as demais esperam na fila
+#   degradacao:           perda de velocidade de cada requisição por requisição
+#                         simultânea adicional (0.3 = 30% mais lenta com duas)
+PERFIS = {
+    "llama2": {"prefill_ms_por_token": 0.8, "tokens_por_segundo": 20, "carga_s": 2.0,
+               "paralelo": 1, "degradacao": 0.3, "tamanho": 3_800_000_000},
+    "tinyllama": {"prefill_ms_por_token": 0.25, "tokens_por_segundo": 60, "carga_s": 0.5,
+                  "paralelo": 1, "degradacao": 0.3, "tamanho": 640_000_000},
+}
+PERFIL_PADRAO = {"prefill_ms_por_token": 0.5, "tokens_por_segundo": 30, "carga_s": 1.0,
+                 "paralelo": 1, "degradacao": 0.3, "tamanho": 1_000_000_000}
+TOKENS_RESPOSTA = 80  # tamanho médio das respostas (varia ±25%, ou options.num_predict)
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def contar_tokens(texto):
+    """Aproximação do número de tokens do prompt (palavras e pontuação)"""
+    return len(_TOKEN_RE.findall(texto))
+
+
+class ModeloSimulado:
+    """Estado de um modelo: carregado ou não, fila e requisições ativas"""
+
+    def __init__(self, nome, perfil, escala):
+        self.nome = nome
+        self.perfil = perfil
+        self.escala = escala
+        self.vagas = threading.Semaphore(perfil["paralelo"])
+        self.ativos = 0
+        self.carregado = False
+        self._lock = threading.Lock()
+
+    def _dormir(self, segundos):
+        if segundos > 0 and self.escala > 0:
+            time.sleep(segundos * self.escala)
+
+    def gerar(self, prompt, opcoes):
+        """Gera os fragmentos da resposta com as pausas do modelo de latência.
+
+        Produz (fragmento, None) para cada token e, ao final, ("", estatísticas)
+        com os mesmos campos de duração (em ns) que o Ollama devolve.
+        """
+        inicio = time.perf_counter()
+        with self.vagas:
+            with self._lock:
+                carga = 0.0 if self.carregado else self.perfil["carga_s"]
+                self.carregado = True
+                self.ativos += 1
+            try:
+                self._dormir(carga)
+                n_prompt = contar_tokens(prompt)
+                inicio_prompt = time.perf_counter()
+                self._dormir(n_prompt * self.perfil["prefill_ms_por_token"] / 1000)
+                duracao_prompt = time.perf_counter() - inicio_prompt
+
+                rng = random.Random(hashlib.md5(prompt.encode("utf-8")).hexdigest())
+                palavras = re.findall(r"\w+", prompt) or ["resposta"]
+                n_tokens = int(opcoes.get("num_predict") or rng.randint(int(TOKENS_RESPOSTA * 0.75),
+                                                                        int(TOKENS_RESPOSTA * 1.25)))
+                inicio_decod = time.perf_counter()
+                for i in range(n_tokens):
+                    velocidade = self.perfil["tokens_por_segundo"] / (
+                        1 + self.perfil["degradacao"] * (self.ativos - 1))
+                    self._dormir(1 / velocidade)
+                    yield (" " if i else "") + rng.choice(palavras), None
+                duracao_decod = time.perf_counter() - inicio_decod
+            finally:
+                with self._lock:
+                    self.ativos -= 1
+
+        yield "", {
+            "total_duration": int((time.perf_counter() - inicio) * 1e9),
+            "load_duration": int(carga * self.escala * 1e9),
+            "prompt_eval_count": n_prompt,
+            "prompt_eval_duration": int(duracao_prompt * 1e9),
+            "eval_count": n_tokens,
+            "eval_duration": int(duracao_decod * 1e9),
+        }
+
+
+class OllamaSimulado(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    modelos = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status, dados):
+        corpo = json.dumps(dados, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _chunk(self, dados):
+        linha = (json.dumps(dados, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(linha):x}\r\n".encode() + linha + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path != "/api/tags":
+            return self._json(404, {"error": "not found"})
+        self._json(200, {"models": [
+            {"name": f"{nome}:latest", "model": f"{nome}:latest", "size": modelo.perfil["tamanho"],
+             "details": {"family": "simulado", "format": "gguf"}}
+            for nome, modelo in self.modelos.items()
+        ]})
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            return self._json(404, {"error": "not found"})
+        try:
+            corpo = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except json.JSONDecodeError:
+            return self._json(400, {"error": "invalid JSON"})
+        nome = corpo.get("model", "").split(":")[0]
+        modelo = self.modelos.get(nome)
+        if modelo is None:
+            return self._json(404, {"error": f"model '{corpo.get('model')}' not found"})
+
+        criado = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        geracao = modelo.gerar(corpo.get("prompt", ""), corpo.get("options") or {})
+        if not corpo.get("stream", True):
+            partes = []
+            for fragmento, estatisticas in geracao:
+                partes.append(fragmento)
+            return self._json(200, {"model": corpo["model"], "created_at": criado,
+                                    "response": "".join(partes), "done": True, **estatisticas})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for fragmento, estatisticas in geracao:
+            mensagem = {"model": corpo["model"], "created_at": criado, "response": fragmento,
+                        "done": estatisticas is not None}
+            self._chunk({**mensagem, **(estatisticas or {})})
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--porta", type=int, default=PORTA)
+    parser.add_argument("--modelos", nargs="+", default=list(PERFIS),
+                        help="modelos servidos (perfis de PERFIS ou o perfil padrão)")
+    parser.add_argument("--tokens-por-segundo", type=float, help="substitui a velocidade de todos os perfis")
+    parser.add_argument("--prefill-ms", type=float, help="substitui o prefill por token de todos os perfis")
+    parser.add_argument("--paralelo", type=int, help="substitui as requisições simultâneas por modelo")
+    parser.add_argument("--sem-carga", action="store_true", help="modelos já carregados")
+    parser.add_argument("--escala", type=float, default=1.0,
+                        help="multiplica todas as pausas (0 = sem espera, só a sobrecarga do pipeline)")
+    args = parser.parse_args()
+
+    for nome in args.modelos:
+        perfil = dict(PERFIS.get(nome, PERFIL_PADRAO))
+        if args.tokens_por_segundo:
+            perfil["tokens_por_segundo"] = args.tokens_por_segundo
+        if args.prefill_ms is not None:
+            perfil["prefill_ms_por_token"] = args.prefill_ms
+        if args.paralelo:
+            perfil["paralelo"] = args.paralelo
+        if args.sem_carga:
+            perfil["carga_s"] = 0.0
+        OllamaSimulado.modelos[nome] = ModeloSimulado(nome, perfil, args.escala)
+
+    servidor = ThreadingHTTPServer((HOST, args.porta), OllamaSimulado)
+    servidor.daemon_threads = True
+    print(f"🧪 Ollama simulado em http://{HOST}:{args.porta}")
+    for nome, modelo in OllamaSimulado.modelos.items():
+        p = modelo.perfil
+        print(f"   {nome}: prefill {p['prefill_ms_por_token']}ms/token, {p['tokens_por_segundo']} tokens/s, "
+              f"carga {p['carga_s']}s, {p['paralelo']} simultânea(s)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Servidor finalizado")
+
+
+if __name__ == "__main__":
+    main()
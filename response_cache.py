@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS respostas (
+    chave TEXT PRIMARY KEY,
+    modelo TEXT NOT NULL,
+    resposta TEXT NOT NULL,
+    metricas TEXT NOT NULL,
+    criado_em REAL NOT NULL,
+    acessado_em REAL NOT NULL
+)
+"""
+
+
+def cache_key(model, prompt, options=None):
+    """Hash de (modelo, prompt completo, opções de geração)"""
+    dados = json.dumps({"model": model, "prompt": prompt, "options": options or {}},
+                       sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(dados.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Cache em disco (SQLite) das respostas das LLMs.
+
+    As entradas expiram após max_age_days e, acima de max_entries, as menos
+    usadas recentemente são descartadas. Com bypass=True as leituras são
+    ignoradas (tudo é gerado de novo), mas as respostas novas continuam
+    sendo gravadas. Pode ser usado por várias threads.
+    """
+
+    def __init__(self, path, max_entries=100000, max_age_days=30, bypass=False):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._gravacoes = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(SCHEMA)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_acessado ON respostas (acessado_em)")
+        self.evict()
+
+    def get(self, model, prompt, options=None):
+        """Retorna (resposta, métricas) gravadas, ou None"""
+        if self.bypass:
+            self.misses += 1
+            return None
+        chave = cache_key(model, prompt, options)
+        agora = time.time()
+        with self._lock:
+            linha = self._conn.execute("SELECT resposta, metricas, criado_em FROM respostas WHERE chave = ?",
+                                       (chave,)).fetchone()
+            if linha is None or (self.max_age and agora - linha[2] > self.max_age):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE respostas SET acessado_em = ? WHERE chave = ?", (agora, chave))
+            self._conn.commit()
+            self.hits += 1
+        return linha[0], json.loads(linha[1])
+
+    def put(self, model, prompt, options, resposta, metricas):
+        """Grava uma resposta gerada"""
+        agora = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO respostas VALUES (?, ?, ?, ?, ?, ?)",
+                               (cache_key(model, prompt, options), model, resposta,
+                                json.dumps(metricas, ensure_ascii=False), agora, agora))
+            self._conn.commit()
+            self._gravacoes += 1
+        if self._gravacoes % 1000 == 0:
+            self.evict()
+
+    def evict(self):
+        """Remove entradas expiradas e as menos usadas além de max_entries"""
+        with self._lock:
+            if self.max_age:
+                self._conn.execute("DELETE FROM respostas WHERE criado_em < ?", (time.time() - self.max_age,))
+            if self.max_entries:
+                self._conn.execute("""DELETE FROM respostas WHERE chave IN (
+                    SELECT chave FROM respostas ORDER BY acessado_em DESC LIMIT -1 OFFSET ?)""",
+                                   (self.max_entries,))
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM respostas").fetchone()[0]
+
+    def stats(self):
+        """Estatísticas de uso do cache nesta execução"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entradas": len(self),
+            "taxa_acerto": self.hits / total if total else 0.0
+        }
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,183 @@
+import os
+import glob
+import json
+import time
+import sqlite3
+import threading
+from tracing import STAGES
+
+# Braços de cada resultado, na ordem em que aparecem nas tabelas
+ARMS = ["llm_3b_sem_rag", "llm_1b_com_rag"]
+
+# Colunas de cada resposta: uma linha por (resultado, braço); as etapas de
+# tracing.STAGES viram colunas com o mesmo nome, em segundos
+COLUMNS = [
+    ("resultado", "INTEGER NOT NULL"),  # mesmo valor para os dois braços de uma pergunta
+    ("execucao", "TEXT NOT NULL"),
+    ("origem", "TEXT NOT NULL"),
+    ("criado_em", "TEXT"),
+    ("pergunta", "TEXT"),
+    ("resposta_referencia", "TEXT"),
+    ("braco", "TEXT NOT NULL"),
+    ("modelo", "TEXT"),
+    ("resposta", "TEXT"),
+    ("tempo", "REAL"),
+    ("tempo_ponta_a_ponta", "REAL"),
+    ("bertscore", "REAL"),
+    ("ttft", "REAL"),
+    ("tokens_por_segundo", "REAL"),
+    ("prompt_eval_count", "INTEGER"),
+    ("eval_count", "INTEGER"),
+    ("tokens_prompt", "INTEGER"),  # estimativa de context_packing.estimate_tokens
+    ("trechos_encontrados", "INTEGER"),
+    ("trechos_usados", "INTEGER"),  # trechos que couberam no contexto, sem repetições
+    ("cache", "INTEGER"),
+    ("erro", "TEXT"),
+] + [(etapa, "REAL") for etapa in STAGES]
+
+
+def new_run_id(origem):
+    """Identificador de uma execução (ex.: "avaliador_rag_20250101_120000_4242")"""
+    return f"{origem}_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+
+
+def result_rows(resultado, id_resultado, execucao, origem):
+    """Linhas (uma por braço) de um resultado no formato salvo pelos scripts"""
+    linhas = []
+    for braco in ARMS:
+        dados = resultado.get(braco)
+        if not dados:
+            continue
+        metricas = dados.get("metricas") or {}
+        etapas = dados.get("etapas") or {}
+        contexto = dados.get("contexto") or {}
+        linha = {
+            "resultado": id_resultado,
+            "execucao": execucao,
+            "origem": origem,
+            "criado_em": resultado.get("timestamp"),
+            "pergunta": resultado.get("pergunta"),
+            "resposta_referencia": resultado.get("resposta_referencia"),
+            "braco": braco,
+            "modelo": dados.get("modelo"),
+            "resposta": dados.get("resposta"),
+            "tempo": dados.get("tempo"),
+            # Resultados sem etapas só têm o tempo de geração
+            "tempo_ponta_a_ponta": dados.get("tempo_ponta_a_ponta", dados.get("tempo")),
+            "bertscore": dados.get("bertscore"),
+            "ttft": metricas.get("ttft"),
+            "tokens_por_segundo": metricas.get("tokens_por_segundo"),
+            "prompt_eval_count": metricas.get("prompt_eval_count"),
+            "eval_count": metricas.get("eval_count"),
+            "tokens_prompt": dados.get("tokens_prompt"),
+            "trechos_encontrados": dados.get("trechos_encontrados"),
+            "trechos_usados": contexto.get("trechos_usados"),
+            "cache": int(bool(metricas.get("cache"))),
+            "erro": metricas.get("erro"),
+        }
+        linha.update({etapa: etapas.get(etapa) for etapa in STAGES})
+        linhas.append(linha)
+    return linhas
+
+
+class ResultsStore:
+    """Resultados de todas as execuções numa tabela SQLite (uma linha por resposta).
+
+    Os scripts acrescentam linhas ao final de cada comparação; a análise lê
+    tudo com uma única consulta, em vez de abrir um arquivo por pergunta.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        colunas = ",\n    ".join(f"{nome} {tipo}" for nome, tipo in COLUMNS)
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS respostas (\n    {colunas}\n)")
+        # Colunas (e etapas de tracing.STAGES) acrescentadas depois da criação da tabela
+        existentes = {linha[1] for linha in self._conn.execute("PRAGMA table_info(respostas)")}
+        for nome, tipo in COLUMNS:
+            if nome not in existentes:
+                self._conn.execute(f"ALTER TABLE respostas ADD COLUMN {nome} {tipo}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_execucao ON respostas (execucao)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_resultado ON respostas (resultado)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS importados (arquivo TEXT PRIMARY KEY)")
+        self._conn.commit()
+
+    def _insert(self, grupos):
+        """Grava [(resultados, execucao, origem), ...] numa única transação (com o lock).
+
+        A transação começa com BEGIN IMMEDIATE, antes de ler o último id de
+        resultado: outro processo gravando na mesma base (ex.: machado_rag.py
+        e avaliador_rag.py) espera o commit e não reaproveita os mesmos ids.
+        Quem chama faz o commit.
+        """
+        nomes = [nome for nome, _ in COLUMNS]
+        sql = f"INSERT INTO respostas ({', '.join(nomes)}) VALUES ({', '.join('?' * len(nomes))})"
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            proximo = self._conn.execute("SELECT COALESCE(MAX(resultado), 0) + 1 FROM respostas").fetchone()[0]
+            linhas = []
+            for resultados, execucao, origem in grupos:
+                for resultado in resultados:
+                    linhas.extend(result_rows(resultado, proximo, execucao, origem))
+                    proximo += 1
+            self._conn.executemany(sql, [[linha[nome] for nome in nomes] for linha in linhas])
+        except BaseException:
+            self._conn.rollback()
+            raise
+        return len(linhas)
+
+    def append(self, resultados, execucao, origem):
+        """Acrescenta resultados (dicionários no formato dos scripts) de uma execução"""
+        with self._lock:
+            total = self._insert([(resultados, execucao, origem)])
+            self._conn.commit()
+        return total
+
+    def import_json_files(self, pattern="resultados/comparacao_*.json"):
+        """Importa, uma única vez, os arquivos JSON salvos por versões anteriores.
+
+        comparacao_<ts>.json (machado_rag.py) traz um resultado; os de
+        avaliador_rag.py trazem uma lista e viram uma execução cada.
+        Retorna o número de arquivos e de respostas importados.
+        """
+        with self._lock:
+            importados = {linha[0] for linha in self._conn.execute("SELECT arquivo FROM importados")}
+        grupos, arquivos = [], []
+        for arquivo in sorted(set(glob.glob(pattern)) - importados):
+            try:
+                with open(arquivo, "r", encoding="utf-8") as f:
+                    resultado = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"❌ Erro ao importar {arquivo}: {e}")
+                continue
+            if isinstance(resultado, list):
+                execucao = os.path.splitext(os.path.basename(arquivo))[0]
+                quando = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(os.path.getmtime(arquivo)))
+                grupos.append(([{"timestamp": quando, **r} for r in resultado], execucao, "avaliador_rag"))
+            else:
+                grupos.append(([resultado], "machado_rag_legado", "machado_rag"))
+            arquivos.append(arquivo)
+        if not arquivos:
+            return 0, 0
+        with self._lock:
+            total = self._insert(grupos)
+            self._conn.executemany("INSERT INTO importados VALUES (?)", [(a,) for a in arquivos])
+            self._conn.commit()
+        return len(arquivos), total
+
+    def to_dataframe(self):
+        """Todas as respostas num DataFrame (uma consulta)"""
+        # pandas só é importado aqui: os scripts que apenas gravam não pagam a importação
+        import pandas as pd
+        with self._lock:
+            return pd.read_sql_query("SELECT * FROM respostas ORDER BY resultado, braco", self._conn)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM respostas").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
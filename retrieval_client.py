@@ -0,0 +1,122 @@
+import time
+import base64
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from tracing import Trace
+
+
+def decode_vectors(texto, dim):
+    """Vetores float32 enviados em base64 pelo servidor, com dim colunas"""
+    return np.frombuffer(base64.b64decode(texto), dtype=np.float32).reshape(-1, dim)
+
+
+class RemoteShards:
+    """Shards do índice servido por servidor_recuperacao.py (mesma interface
+    de vector_index.ShardSelector para listar categorias e validar filtros)
+    """
+
+    def __init__(self, manifest):
+        self.id_limit = manifest["next_id"]
+        self.updated_at = manifest.get("atualizado_em")
+        self.arquivos = manifest["arquivos"]
+
+    def categorias(self):
+        """Número de trechos de cada categoria indexada"""
+        contagem = {}
+        for entrada in self.arquivos:
+            contagem[entrada["categoria"]] = (contagem.get(entrada["categoria"], 0)
+                                              + entrada["fim"] - entrada["inicio"])
+        return dict(sorted(contagem.items()))
+
+    def mask(self, categoria=None, arquivo=None):
+        """Máscara booleana dos ids do shard (None sem filtro); ValueError se não houver obras"""
+        if categoria is None and arquivo is None:
+            return None
+        categorias = {categoria} if isinstance(categoria, str) else categoria and set(categoria)
+        arquivos = {arquivo} if isinstance(arquivo, str) else arquivo and set(arquivo)
+        mask = np.zeros(self.id_limit, dtype=bool)
+        for entrada in self.arquivos:
+            if ((categorias is None or entrada["categoria"] in categorias)
+                    and (arquivos is None or entrada["arquivo"] in arquivos)):
+                mask[entrada["inicio"]:entrada["fim"]] = True
+        if not mask.any():
+            raise ValueError(f"Nenhuma obra indexada corresponde a categoria={categoria!r}, "
+                             f"arquivo={arquivo!r}")
+        return mask
+
+
+class RemoteRetriever:
+    """Cliente do servidor de recuperação, com a interface de utils.Retriever.
+
+    O índice, os trechos e o modelo de embeddings ficam carregados no
+    servidor; o cliente só envia as perguntas e recebe os resultados, sem
+    importar torch, sentence_transformers ou faiss. Os tempos de cada etapa
+    medidos no servidor entram no trace, e o restante da ida e volta
+    (HTTP e JSON) fica na etapa "rede_recuperacao".
+    """
+
+    def __init__(self, url, connect_timeout=2, read_timeout=300, pool_size=4):
+        self.url = url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        info = self.info()
+        self.dimension = info["dimensao"]
+        self.embedding_model = info["modelo"]
+        self.shards = RemoteShards(info["manifesto"]) if info.get("manifesto") else None
+
+    def _post(self, rota, dados):
+        response = self.session.post(self.url + rota, json=dados, timeout=self.timeout)
+        if response.status_code == 400:
+            raise ValueError(response.json().get("error"))
+        if response.status_code == 500:
+            raise RuntimeError(f"Erro no servidor de recuperação: {response.json().get('error')}")
+        response.raise_for_status()
+        return response.json()
+
+    def info(self):
+        """Descrição do índice servido e estatísticas do servidor"""
+        response = self.session.get(self.url + "/info", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def warm_up(self):
+        """Nada a fazer: o modelo já está carregado no servidor"""
+
+    def embed_queries(self, queries):
+        """Embeddings das perguntas (com o cache de embeddings do servidor)"""
+        dados = self._post("/embeddings", {"perguntas": list(queries)})
+        return decode_vectors(dados["embeddings"], self.dimension)
+
+    def embed_query(self, query):
+        return self.embed_queries([query])[0]
+
+    def search(self, query, top_k, categoria=None, arquivo=None, trace=None):
+        """Retorna os top_k trechos mais similares à pergunta"""
+        return self.search_batch([query], top_k, categoria, arquivo, trace)[0]["trechos"]
+
+    def search_batch(self, queries, top_k, categoria=None, arquivo=None, trace=None,
+                     with_embeddings=False):
+        """Mesmo retorno de utils.Retriever.search_batch, calculado no servidor"""
+        if not queries:
+            return []
+        start_time = time.perf_counter()
+        dados = self._post("/buscar", {"perguntas": list(queries), "top_k": top_k, "categoria": categoria,
+                                       "arquivo": arquivo, "with_embeddings": with_embeddings})
+        ida_e_volta = time.perf_counter() - start_time
+        etapas = Trace(dados["etapas"])
+        if trace is not None:
+            trace.merge(etapas)
+            trace.add("rede_recuperacao", max(ida_e_volta - etapas.total, 0.0))
+        resultados = dados["resultados"]
+        if with_embeddings:
+            for resultado in resultados:
+                resultado["embeddings"] = decode_vectors(resultado["embeddings"], self.dimension)
+                resultado["embedding_pergunta"] = decode_vectors(resultado["embedding_pergunta"], self.dimension)[0]
+        return resultados
+
+    def cache_stats(self):
+        """Estatísticas do cache de embeddings de perguntas do servidor (todos os clientes)"""
+        return self.info()["cache"]
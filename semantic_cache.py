@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+import faiss
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS perguntas (
+    id INTEGER PRIMARY KEY,
+    pergunta TEXT NOT NULL,
+    filtros TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    valor TEXT NOT NULL,
+    criado_em REAL NOT NULL,
+    acessado_em REAL NOT NULL,
+    configuracao TEXT NOT NULL DEFAULT ''
+)
+"""
+
+
+def _unit(embedding):
+    vector = np.asarray(embedding, dtype=np.float32).reshape(1, -1).copy()
+    faiss.normalize_L2(vector)
+    return vector
+
+
+class SemanticCache:
+    """Cache de respostas por similaridade entre perguntas.
+
+    As perguntas já respondidas ficam num índice FAISS de produto interno
+    (vetores unitários, ou seja, similaridade de cosseno). Uma pergunta nova
+    com similaridade >= threshold a uma anterior, com os mesmos filtros,
+    recebe o valor guardado para ela (trechos recuperados e respostas).
+    As entradas expiram após ttl_seconds e, acima de max_entries, as menos
+    usadas recentemente são descartadas. Com path, as entradas são gravadas
+    em SQLite e recarregadas na próxima execução. config (serializável em
+    JSON) descreve o que produziu os valores (modelos, índice, parâmetros):
+    só entradas gravadas com a mesma config são reaproveitadas, e as
+    gravadas com outra são apagadas ao carregar.
+    """
+
+    def __init__(self, dim, threshold=0.9, max_entries=1000, ttl_seconds=86400, path=None, neighbors=5,
+                 config=None):
+        self.config = json.dumps(config or {}, sort_keys=True, ensure_ascii=False)
+        self.discarded = 0
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.neighbors = neighbors
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+        self._entries = OrderedDict()  # id -> {pergunta, filtros, valor, criado_em}, do menos ao mais usado
+        self._next_id = 0
+        self._conn = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(SCHEMA)
+            colunas = {linha[1] for linha in self._conn.execute("PRAGMA table_info(perguntas)")}
+            if "configuracao" not in colunas:
+                self._conn.execute("ALTER TABLE perguntas ADD COLUMN configuracao TEXT NOT NULL DEFAULT ''")
+            self._load()
+        self.evict()
+
+    def _load(self):
+        # Respostas de outra configuração (ou de um índice reconstruído) não valem mais
+        self.discarded = self._conn.execute("DELETE FROM perguntas WHERE configuracao != ?",
+                                            (self.config,)).rowcount
+        self._conn.commit()
+        linhas = self._conn.execute(
+            "SELECT id, pergunta, filtros, embedding, valor, criado_em FROM perguntas ORDER BY acessado_em").fetchall()
+        vetores = []
+        for id_, pergunta, filtros, embedding, valor, criado_em in linhas:
+            vetor = np.frombuffer(embedding, dtype=np.float32)
+            if vetor.shape[0] != self._index.d:
+                continue  # gravada com outro modelo de embeddings
+            self._entries[id_] = {"pergunta": pergunta, "filtros": json.loads(filtros),
+                                  "valor": json.loads(valor), "criado_em": criado_em,
+                                  "configuracao": self.config}
+            vetores.append(vetor)
+        if vetores:
+            self._index.add_with_ids(np.vstack(vetores), np.array(list(self._entries), dtype=np.int64))
+        self._next_id = max([id_ for id_, *_ in linhas], default=-1) + 1
+
+    def _remove(self, ids):
+        """Remove entradas do índice, da memória e do disco (com o lock)"""
+        if not ids:
+            return
+        self._index.remove_ids(np.array(ids, dtype=np.int64))
+        for id_ in ids:
+            del self._entries[id_]
+        if self._conn is not None:
+            self._conn.executemany("DELETE FROM perguntas WHERE id = ?", [(id_,) for id_ in ids])
+            self._conn.commit()
+
+    def lookup(self, embedding, filtros=None):
+        """Retorna (valor, similaridade, pergunta original) da pergunta mais parecida, ou None"""
+        filtros = filtros or {}
+        agora = time.time()
+        with self._lock:
+            if self._index.ntotal:
+                similaridades, ids = self._index.search(_unit(embedding), min(self.neighbors, self._index.ntotal))
+                expirados = []
+                for similaridade, id_ in zip(similaridades[0], ids[0]):
+                    if id_ < 0 or similaridade < self.threshold:
+                        break
+                    entrada = self._entries[int(id_)]
+                    if self.ttl and agora - entrada["criado_em"] > self.ttl:
+                        expirados.append(int(id_))
+                    elif entrada["filtros"] == filtros and entrada["configuracao"] == self.config:
+                        self._entries.move_to_end(int(id_))
+                        if self._conn is not None:
+                            self._conn.execute("UPDATE perguntas SET acessado_em = ? WHERE id = ?", (agora, int(id_)))
+                            self._conn.commit()
+                        self._remove(expirados)
+                        self.hits += 1
+                        return entrada["valor"], float(similaridade), entrada["pergunta"]
+                self._remove(expirados)
+            self.misses += 1
+        return None
+
+    def put(self, pergunta, embedding, valor, filtros=None):
+        """Guarda o valor (serializável em JSON) de uma pergunta respondida"""
+        filtros = filtros or {}
+        agora = time.time()
+        vetor = _unit(embedding)
+        with self._lock:
+            id_ = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(vetor, np.array([id_], dtype=np.int64))
+            self._entries[id_] = {"pergunta": pergunta, "filtros": filtros, "valor": valor, "criado_em": agora,
+                                  "configuracao": self.config}
+            if self._conn is not None:
+                self._conn.execute("INSERT INTO perguntas VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                   (id_, pergunta, json.dumps(filtros, ensure_ascii=False), vetor.tobytes(),
+                                    json.dumps(valor, ensure_ascii=False), agora, agora, self.config))
+                self._conn.commit()
+        self.evict()
+
+    def evict(self):
+        """Remove entradas expiradas e as menos usadas além de max_entries"""
+        with self._lock:
+            ids = []
+            if self.ttl:
+                limite = time.time() - self.ttl
+                ids = [id_ for id_, entrada in self._entries.items() if entrada["criado_em"] < limite]
+            if self.max_entries:
+                expirados = set(ids)
+                excesso = len(self._entries) - len(ids) - self.max_entries
+                restantes = (id_ for id_ in self._entries if id_ not in expirados)
+                ids += [id_ for _, id_ in zip(range(max(excesso, 0)), restantes)]
+            self._remove(ids)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Estatísticas de uso do cache nesta execução"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entradas": len(self),
+            "descartadas": self.discarded,
+            "taxa_acerto": self.hits / total if total else 0.0
+        }
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
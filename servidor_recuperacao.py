@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Servidor local de recuperação: mantém o índice FAISS, os trechos, o índice
+BM25 e o modelo de embeddings carregados e atende buscas em lote de vários
+clientes (machado_rag.py e avaliador_rag.py com RETRIEVAL_SERVICE_URL)
+"""
+
+import json
+import time
+import base64
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+
+inicio_importacao = time.perf_counter()
+from utils import Retriever
+from tracing import Trace
+import vector_index
+import lexical_index
+import binary_index
+tempo_importacao = time.perf_counter() - inicio_importacao
+
+# CONFIGURAÇÕES (as mesmas de machado_rag.py / avaliador_rag.py)
+HOST = "127.0.0.1"
+PORTA = 8765
+DATA_DIR = "/home/umbelito/rag_machado_de_assis/obras/raw/txt"
+CATEGORIAS = ["romance", "cronica"]  # None = todas as categorias de DATA_DIR
+INGESTION_WORKERS = None  # processos para ler/dividir o corpus (None = todos os núcleos)
+EMBEDDING_WORKERS = 1  # processos que geram embeddings ao construir o índice
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+INDEX_PATH = "index/faiss_index.bin"
+CHUNKS_PATH = "embeddings/chunks.bin"
+INDEX_CONFIG = {"factory": "Flat", "nprobe": 16, "ef_search": 64}
+QUERY_CACHE_SIZE = 100000  # embeddings de perguntas mantidos em cache (LRU), para todos os clientes
+HYBRID_SEARCH = True
+LEXICAL_PATH = "embeddings/bm25.bin"
+HYBRID_CANDIDATES = 20
+TWO_STAGE_SEARCH = False  # varredura binária (Hamming) + reordenação exata (binary_index.py)
+BINARY_INDEX_PATH = "index/faiss_index.binary.bin"
+RERANK_CANDIDATES = 256
+MAX_PERGUNTAS = 1024  # perguntas por requisição
+
+
+def codificar_vetores(vetores):
+    """float32 em base64: bem mais rápido de gerar e ler que listas de números em JSON"""
+    return base64.b64encode(np.ascontiguousarray(vetores, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def para_json(resultado):
+    """Resultado de Retriever.search_batch com os embeddings (arrays numpy) em base64"""
+    return {chave: codificar_vetores(valor) if isinstance(valor, np.ndarray) else valor
+            for chave, valor in resultado.items()}
+
+
+class ServidorRecuperacao(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Cabeçalho e corpo saem em escritas separadas: sem TCP_NODELAY, o Nagle
+    # segura o corpo até o ACK atrasado do cliente (~40ms por requisição)
+    disable_nagle_algorithm = True
+    retriever = None
+    info = {}
+    # O Retriever (cache LRU, BM25) não é thread-safe: uma busca por vez.
+    # Cada requisição já é um lote, e o FAISS usa todos os núcleos nela.
+    lock = threading.Lock()
+    requisicoes = 0
+    perguntas = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status, dados):
+        corpo = json.dumps(dados, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_GET(self):
+        if self.path != "/info":
+            return self._json(404, {"error": "not found"})
+        with self.lock:
+            cache = self.retriever.cache_stats()
+        self._json(200, {**self.info, "cache": cache, "requisicoes": ServidorRecuperacao.requisicoes,
+                         "perguntas": ServidorRecuperacao.perguntas})
+
+    def do_POST(self):
+        if self.path not in ("/buscar", "/embeddings"):
+            return self._json(404, {"error": "not found"})
+        try:
+            corpo = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except json.JSONDecodeError:
+            return self._json(400, {"error": "invalid JSON"})
+        perguntas = corpo.get("perguntas")
+        if not isinstance(perguntas, list) or not all(isinstance(p, str) for p in perguntas):
+            return self._json(400, {"error": "'perguntas' deve ser uma lista de textos"})
+        if len(perguntas) > MAX_PERGUNTAS:
+            return self._json(400, {"error": f"no máximo {MAX_PERGUNTAS} perguntas por requisição"})
+        top_k = corpo.get("top_k", 5)
+        if isinstance(top_k, bool) or not isinstance(top_k, int) or top_k <= 0:
+            return self._json(400, {"error": "'top_k' deve ser um inteiro positivo"})
+
+        trace = Trace()
+        try:
+            with self.lock:
+                ServidorRecuperacao.requisicoes += 1
+                ServidorRecuperacao.perguntas += len(perguntas)
+                if self.path == "/embeddings":
+                    embeddings = self.retriever.embed_queries(perguntas) if perguntas else np.zeros(0)
+                else:
+                    resultados = self.retriever.search_batch(
+                        perguntas, top_k, corpo.get("categoria"), corpo.get("arquivo"),
+                        trace=trace, with_embeddings=bool(corpo.get("with_embeddings")))
+        except ValueError as e:
+            return self._json(400, {"error": str(e)})
+        except Exception as e:
+            # Responde com o erro em vez de derrubar a conexão (o cliente veria só um reset)
+            print(f"❌ Erro em {self.path}: {e!r}")
+            return self._json(500, {"error": f"{type(e).__name__}: {e}"})
+        if self.path == "/embeddings":
+            return self._json(200, {"embeddings": codificar_vetores(embeddings)})
+        self._json(200, {"resultados": [para_json(r) for r in resultados], "etapas": trace.to_dict()})
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--porta", type=int, default=PORTA)
+    args = parser.parse_args()
+
+    print("🛰️  SERVIDOR DE RECUPERAÇÃO")
+    print("=" * 60)
+    print(f"📦 Importações: {tempo_importacao:.2f}s")
+
+    start_time = time.perf_counter()
+    index, chunks = vector_index.load_or_create_index(DATA_DIR, CATEGORIAS, EMBEDDING_MODEL, INDEX_PATH,
+                                                      CHUNKS_PATH, INDEX_CONFIG, INGESTION_WORKERS,
+                                                      EMBEDDING_WORKERS)
+    lexical = lexical_index.load_or_create_lexical_index(LEXICAL_PATH, chunks) if HYBRID_SEARCH else None
+    binario = (binary_index.load_or_create_binary_index(BINARY_INDEX_PATH, index, INDEX_PATH)
+               if TWO_STAGE_SEARCH else None)
+    manifesto = vector_index.load_manifest(INDEX_PATH)
+    shards = vector_index.ShardSelector(manifesto)
+    print(f"🗂️  Índice, trechos e BM25: {time.perf_counter() - start_time:.2f}s")
+
+    start_time = time.perf_counter()
+    retriever = Retriever(index, chunks, EMBEDDING_MODEL, cache_size=QUERY_CACHE_SIZE,
+                          lexical_index=lexical, candidates=HYBRID_CANDIDATES, shards=shards,
+                          binary_index=binario, rerank_candidates=RERANK_CANDIDATES)
+    retriever.warm_up()
+    print(f"🧠 Modelo de embeddings: {time.perf_counter() - start_time:.2f}s")
+
+    ServidorRecuperacao.retriever = retriever
+    ServidorRecuperacao.info = {
+        "modelo": EMBEDDING_MODEL,
+        "dimensao": retriever.dimension,
+        "total_vetores": int(index.ntotal),
+        "indice": INDEX_CONFIG,
+        "busca_hibrida": HYBRID_SEARCH,
+        "busca_dois_estagios": TWO_STAGE_SEARCH,
+        "manifesto": {"next_id": manifesto["next_id"], "atualizado_em": manifesto.get("atualizado_em"),
+                      "arquivos": [{chave: entrada[chave] for chave in ("arquivo", "categoria", "inicio", "fim")}
+                                   for entrada in manifesto["arquivos"].values()]},
+        "iniciado_em": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+    servidor = ThreadingHTTPServer((args.host, args.porta), ServidorRecuperacao)
+    servidor.daemon_threads = True
+    print(f"🛰️  Servindo {index.ntotal} trechos em http://{args.host}:{args.porta} "
+          f"(use RETRIEVAL_SERVICE_URL nos scripts)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        stats = retriever.cache_stats()
+        print(f"\n🧠 {ServidorRecuperacao.perguntas} perguntas em {ServidorRecuperacao.requisicoes} requisições; "
+              f"cache de embeddings {stats['taxa_acerto']*100:.1f}%")
+        print("👋 Servidor finalizado")
+
+
+if __name__ == "__main__":
+    main()
@@ -108,12 +108,14 @@ def main():
     if not check_ollama():
         print("\n❌ Ollama não está instalado.")
         print("📥 Instale o Ollama em: https://ollama.ai/")
+        print("🧪 Para medir desempenho sem modelos reais: python ollama_simulado.py")
         return False
     
     # Verificar servidor
     if not check_ollama_server():
         print("\n❌ Servidor Ollama não está rodando.")
         print("🚀 Inicie o servidor com: ollama serve")
+        print("🧪 Para medir desempenho sem modelos reais: python ollama_simulado.py")
         return False
     
     # Instalar modelos
@@ -0,0 +1,57 @@
+import os
+import sys
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import utils  # noqa: E402
+
+
+class ModeloContador:
+    """Modelo de embeddings determinístico que registra os textos codificados"""
+
+    def __init__(self):
+        self.codificados = []
+
+    def encode(self, textos, convert_to_numpy=True, **kwargs):
+        self.codificados.extend(textos)
+        return np.array([[len(t), sum(map(ord, t)) % 97, 1.0] for t in textos], dtype=np.float32)
+
+
+def criar_retriever(cache_size):
+    modelo = ModeloContador()
+    utils._EMBEDDING_MODELS["modelo-teste"] = modelo
+    return utils.Retriever(faiss.IndexFlatL2(3), None, "modelo-teste", cache_size=cache_size), modelo
+
+
+def test_lote_maior_que_o_cache():
+    retriever, modelo = criar_retriever(cache_size=2)
+    retriever.embed_queries(["a", "b"])
+    embeddings = retriever.embed_queries(["b", "c", "d"])
+
+    esperados = modelo.encode(["b", "c", "d"])
+    np.testing.assert_array_equal(embeddings, esperados)
+    assert list(retriever._cache) == ["c", "d"]
+    assert retriever.cache_stats()["hits"] == 1
+
+
+def test_remocao_lru():
+    retriever, modelo = criar_retriever(cache_size=2)
+    retriever.embed_query("a")
+    retriever.embed_query("b")
+    retriever.embed_query("a")  # "b" passa a ser o menos usado
+    retriever.embed_query("c")
+
+    assert list(retriever._cache) == ["a", "c"]
+    modelo.codificados.clear()
+    retriever.embed_queries(["a", "b"])
+    assert modelo.codificados == ["b"]
+
+
+def test_modelo_recebe_a_pergunta_original():
+    retriever, modelo = criar_retriever(cache_size=10)
+    retriever.embed_queries(["Quem é  Capitu?", "quem é capitu?"])
+    retriever.embed_query("QUEM É CAPITU?")
+
+    assert modelo.codificados == ["Quem é  Capitu?"]
@@ -0,0 +1,78 @@
+import time
+from contextlib import contextmanager, nullcontext
+
+# Etapas do pipeline, na ordem em que acontecem numa pergunta com RAG
+# ("rede_recuperacao" é a ida e volta ao servidor_recuperacao.py, quando usado)
+STAGES = ["embedding_pergunta", "busca_faiss", "busca_lexical", "leitura_trechos",
+          "rede_recuperacao", "montagem_prompt", "llm_prefill", "llm_decodificacao"]
+
+
+class Trace:
+    """Tempo (em segundos) gasto em cada etapa do processamento de uma pergunta.
+
+    Cada etapa custa só duas leituras de perf_counter, então o rastreamento
+    fica sempre ligado. Etapas repetidas acumulam.
+    """
+
+    def __init__(self, stages=None):
+        self.stages = dict(stages or {})
+
+    @contextmanager
+    def stage(self, name):
+        """Cronometra o bloco with como a etapa name"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start_time)
+
+    def add(self, name, seconds):
+        if seconds is not None:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_generation(self, metricas):
+        """Divide a geração da LLM em prefill e decodificação.
+
+        Com streaming, o prefill vai até o primeiro token no relógio do
+        cliente (inclui fila e rede). Sem streaming, a decodificação é o
+        eval_duration do Ollama e o prefill é o restante do tempo total.
+        """
+        tempo = metricas.get("tempo_total")
+        if tempo is None:
+            return
+        if metricas.get("ttft") is not None:
+            decodificacao = tempo - metricas["ttft"]
+        elif metricas.get("eval_duration"):
+            decodificacao = min(metricas["eval_duration"] / 1e9, tempo)
+        else:
+            decodificacao = 0.0
+        self.add("llm_prefill", tempo - decodificacao)
+        self.add("llm_decodificacao", decodificacao)
+
+    def scaled(self, fator):
+        """Cópia com os tempos multiplicados (ex.: 1/n para ratear uma busca em lote)"""
+        return Trace({name: seconds * fator for name, seconds in self.stages.items()})
+
+    def merge(self, other):
+        for name, seconds in other.stages.items():
+            self.add(name, seconds)
+        return self
+
+    @property
+    def total(self):
+        return sum(self.stages.values())
+
+    def to_dict(self):
+        """Etapas na ordem de STAGES (as demais ao final)"""
+        ordem = [s for s in STAGES if s in self.stages] + [s for s in self.stages if s not in STAGES]
+        return {name: self.stages[name] for name in ordem}
+
+
+def stage(trace, name):
+    """trace.stage(name), ou um contexto vazio quando não há rastreamento"""
+    return trace.stage(name) if trace is not None else nullcontext()
+
+
+def describe_trace(etapas):
+    """Resumo de uma linha dos tempos por etapa, em milissegundos"""
+    return " | ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in etapas.items()) or "sem etapas"
@@ -1,12 +1,27 @@
 import os
+import sys
 import json
+import time
+import inspect
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
+import faiss
 import numpy as np
 import re
+from lexical_index import reciprocal_rank_fusion
+from tracing import stage
 
+# Modelos de embeddings já carregados neste processo (nome -> modelo)
+_EMBEDDING_MODELS = {}
 
-def split_text(text, max_words=150):
+CHUNK_MAX_WORDS = 150  # tamanho máximo dos trechos, em palavras
+ENCODE_BATCH_SIZE = 64  # trechos por passada do modelo de embeddings
+
+
+def split_text(text, max_words=CHUNK_MAX_WORDS):
     sentences = re.split(r'(?<=[.!?]) +', text)
     chunks = []
     chunk = []
@@ -25,34 +40,439 @@ def split_text(text, max_words=150):
     return chunks
 
 
-def load_documents(base_dir, categorias):
-    docs = []
-    metadata = {}
+def list_corpus_files(base_dir, categorias=None):
+    """Lista (categoria, caminho) dos .txt do corpus em ordem determinística.
+
+    Com categorias=None, todas as subpastas de base_dir são lidas.
+    """
+    if categorias is None:
+        categorias = sorted(p.name for p in Path(base_dir).iterdir() if p.is_dir())
+    arquivos = []
     for categoria in categorias:
         cat_path = Path(base_dir) / categoria
-        for txt_file in cat_path.glob("*.txt"):
-            with open(txt_file, "r", encoding="utf-8", errors="ignore") as f:
-                content = f.read()
-                partes = split_text(content)
-                for i, trecho in enumerate(partes):
-                    docs.append(trecho)
-                    metadata[len(metadata)] = {
-                        "arquivo": str(txt_file.name),
-                        "categoria": categoria,
-                        "trecho": trecho[:200]  # para debug rápido
-                    }
+        arquivos.extend((categoria, txt_file) for txt_file in sorted(cat_path.glob("*.txt")))
+    return arquivos
+
+
+def chunk_file(txt_file, max_words=CHUNK_MAX_WORDS):
+    """Lê um arquivo do corpus e o divide em trechos"""
+    with open(txt_file, "r", encoding="utf-8", errors="ignore") as f:
+        return split_text(f.read(), max_words)
+
+
+def _chunk_file_timed(txt_file):
+    start_time = time.perf_counter()
+    trechos = chunk_file(txt_file)
+    return trechos, time.perf_counter() - start_time
+
+
+def iter_chunked_files(arquivos, workers=None):
+    """Divide os arquivos em trechos, em paralelo num pool de processos.
+
+    Gera (categoria, caminho, trechos, segundos) na mesma ordem de
+    `arquivos`, de modo que os ids dos trechos não dependem do paralelismo.
+    No máximo 2 arquivos por processo ficam em andamento, para que a
+    memória não cresça se o consumidor for mais lento que a leitura.
+    workers=None usa todos os núcleos; workers=1 processa em série.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(arquivos) <= 1:
+        for categoria, txt_file in arquivos:
+            yield (categoria, txt_file, *_chunk_file_timed(txt_file))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pendentes = deque()
+        proximos = iter(arquivos)
+        for categoria, txt_file in islice(proximos, 2 * workers):
+            pendentes.append((categoria, txt_file, pool.submit(_chunk_file_timed, txt_file)))
+        while pendentes:
+            categoria, txt_file, futuro = pendentes.popleft()
+            for proximo_cat, proximo_arquivo in islice(proximos, 1):
+                pendentes.append((proximo_cat, proximo_arquivo, pool.submit(_chunk_file_timed, proximo_arquivo)))
+            trechos, segundos = futuro.result()
+            yield categoria, txt_file, trechos, segundos
+
+
+def run_concurrently(funcoes, concorrente=True):
+    """Executa funções sem argumentos, em threads se concorrente, e retorna os resultados em ordem.
+
+    Indicado para trabalho que espera por E/S (ex.: chamadas HTTP ao Ollama),
+    em que o tempo total passa a ser o da função mais lenta, não a soma.
+    """
+    if not concorrente or len(funcoes) < 2:
+        return [funcao() for funcao in funcoes]
+    with ThreadPoolExecutor(max_workers=len(funcoes)) as pool:
+        futures = [pool.submit(funcao) for funcao in funcoes]
+        return [future.result() for future in futures]
+
+
+def run_in_background(funcao):
+    """Executa uma função sem argumentos numa thread e retorna um Future com o resultado.
+
+    A thread é daemon: não impede o processo de terminar se o usuário sair
+    antes de ela acabar.
+    """
+    future = Future()
+
+    def executar():
+        try:
+            future.set_result(funcao())
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=executar, daemon=True).start()
+    return future
+
+
+def peak_rss_mb():
+    """Pico de memória residente do processo em MB (None se indisponível)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    return pico / 1024**2 if sys.platform == "darwin" else pico / 1024
+
+
+def report_ingestion_times(tempos, wall_time=None, top=5):
+    """Mostra o tempo total de divisão em trechos e os arquivos mais lentos"""
+    total = sum(segundos for _, segundos, _ in tempos)
+    if wall_time is None:
+        print(f"📚 {len(tempos)} arquivos divididos (soma por arquivo: {total:.2f}s)")
+    else:
+        print(f"📚 {len(tempos)} arquivos divididos em {wall_time:.2f}s "
+              f"(soma por arquivo: {total:.2f}s, {total / max(wall_time, 1e-9):.1f}x paralelo)")
+    for nome, segundos, n_trechos in sorted(tempos, key=lambda t: t[1], reverse=True)[:top]:
+        print(f"   🐢 {nome}: {segundos:.3f}s ({n_trechos} trechos)")
+
+
+def load_documents(base_dir, categorias=None, workers=None):
+    docs = []
+    metadata = {}
+    tempos = []
+    start_time = time.perf_counter()
+    arquivos = list_corpus_files(base_dir, categorias)
+    for categoria, txt_file, trechos, segundos in iter_chunked_files(arquivos, workers):
+        tempos.append((f"{categoria}/{txt_file.name}", segundos, len(trechos)))
+        for trecho in trechos:
+            docs.append(trecho)
+            # o texto completo fica em docs (e depois no ChunkStore)
+            metadata[len(metadata)] = {
+                "arquivo": str(txt_file.name),
+                "categoria": categoria
+            }
+    report_ingestion_times(tempos, time.perf_counter() - start_time)
     return docs, metadata
 
 
-def create_embeddings(docs, model):
+class EmbeddingEncoder:
+    """Gera embeddings em lotes ordenados por tamanho, opcionalmente em vários processos.
+
+    Ordenar os trechos por tamanho faz cada lote ter textos parecidos e,
+    portanto, menos padding; a ordem original é restaurada no resultado.
+    Com workers > 1 os lotes são distribuídos num pool de processos do
+    sentence-transformers (cada processo com sua fatia dos núcleos).
+    """
+
+    def __init__(self, model, batch_size=ENCODE_BATCH_SIZE, workers=1):
+        self.model = model
+        self.batch_size = batch_size
+        self.workers = workers
+        self.total_textos = 0
+        self.total_segundos = 0.0
+        self._pool = None
+
+    def encode(self, textos, show_progress_bar=False):
+        """Embeddings float32 dos textos, na ordem recebida"""
+        start_time = time.perf_counter()
+        ordem = np.argsort([-len(t) for t in textos], kind="stable")
+        ordenados = [textos[i] for i in ordem]
+        if self.workers > 1:
+            embeddings = self._encode_pool(ordenados)
+        else:
+            embeddings = self.model.encode(ordenados, batch_size=self.batch_size, convert_to_numpy=True,
+                                           show_progress_bar=show_progress_bar)
+        resultado = np.empty((len(textos), embeddings.shape[1]), dtype=np.float32)
+        resultado[ordem] = embeddings
+        self.total_textos += len(textos)
+        self.total_segundos += time.perf_counter() - start_time
+        return resultado
+
+    def _encode_pool(self, textos):
+        if self._pool is None:
+            # Evita que cada processo use todos os núcleos (oversubscription)
+            anterior = os.environ.get("OMP_NUM_THREADS")
+            os.environ["OMP_NUM_THREADS"] = str(max(1, (os.cpu_count() or 1) // self.workers))
+            try:
+                self._pool = self.model.start_multi_process_pool(["cpu"] * self.workers)
+            finally:
+                if anterior is None:
+                    del os.environ["OMP_NUM_THREADS"]
+                else:
+                    os.environ["OMP_NUM_THREADS"] = anterior
+        if "pool" in inspect.signature(self.model.encode).parameters:
+            return self.model.encode(textos, pool=self._pool, batch_size=self.batch_size,
+                                     convert_to_numpy=True, show_progress_bar=False)
+        # sentence-transformers < 5
+        return self.model.encode_multi_process(textos, self._pool, batch_size=self.batch_size)
+
+    @property
+    def chunks_per_second(self):
+        return self.total_textos / self.total_segundos if self.total_segundos else 0.0
+
+    def close(self):
+        if self._pool is not None:
+            self.model.stop_multi_process_pool(self._pool)
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def create_embeddings(docs, model, batch_size=ENCODE_BATCH_SIZE, workers=1):
     print("\n🔍 Gerando embeddings...")
-    embeddings = model.encode(docs, show_progress_bar=True, convert_to_numpy=True)
-    return np.array(embeddings)
+    with EmbeddingEncoder(model, batch_size, workers) as encoder:
+        embeddings = encoder.encode(docs, show_progress_bar=workers == 1)
+    print(f"   ⚡ {encoder.chunks_per_second:.1f} trechos/s")
+    return embeddings
+
+
+def get_embedding_model(embedding_model_name):
+    """Carrega o modelo de embeddings uma única vez por processo"""
+    model = _EMBEDDING_MODELS.get(embedding_model_name)
+    if model is None:
+        # Importado só aqui: sentence_transformers (e com ele o torch) leva
+        # segundos para importar, e só quem gera embeddings precisa dele
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(embedding_model_name)
+        _EMBEDDING_MODELS[embedding_model_name] = model
+    return model
+
+
+def prepare_query_embeddings(index, embeddings):
+    """Ajusta embeddings de consulta à métrica do índice.
+
+    Índices de produto interno guardam vetores normalizados, então as
+    consultas também precisam ser normalizadas para equivaler ao cosseno.
+    """
+    embeddings = np.array(embeddings, dtype=np.float32).reshape(-1, index.d)
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        faiss.normalize_L2(embeddings)
+    return embeddings
+
+
+def normalize_query(query):
+    """Normaliza a pergunta para uso como chave de cache"""
+    return " ".join(query.split()).casefold()
+
+
+def reconstruct_vectors(index, ids):
+    """Vetores armazenados no índice para os ids (aproximados em índices quantizados).
+
+    Índices IVF ganham, na primeira chamada, um mapa direto em hashtable,
+    que continua válido após remoções e acréscimos por id.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    try:
+        return index.reconstruct_batch(ids)
+    except RuntimeError:
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is None or ivf.direct_map.type != faiss.DirectMap.NoMap:
+            raise
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+        return index.reconstruct_batch(ids)
+
+
+class Retriever:
+    """Busca trechos similares mantendo o modelo de embeddings residente.
+
+    Os embeddings das perguntas ficam num cache LRU limitado, indexado pelo
+    texto normalizado da pergunta. Com um índice lexical (BM25) a busca é
+    híbrida: os candidatos do FAISS e do BM25 são combinados por RRF. Com
+    shards (vector_index.ShardSelector) as buscas aceitam filtros por
+    categoria e arquivo. Com um índice binário (binary_index.BinaryIndex) a
+    busca densa é feita em dois estágios: varredura por Hamming e
+    reordenação exata dos rerank_candidates mais próximos.
+    """
+
+    def __init__(self, index, chunks, embedding_model_name, cache_size=1024,
+                 lexical_index=None, candidates=20, rrf_k=60, shards=None,
+                 binary_index=None, rerank_candidates=256):
+        self.index = index
+        self.chunks = chunks
+        self.model = get_embedding_model(embedding_model_name)
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache = OrderedDict()
+        self.lexical_index = lexical_index
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.shards = shards
+        self.binary_index = binary_index
+        self.rerank_candidates = rerank_candidates
 
+    def warm_up(self):
+        """Codifica um texto qualquer, para que a primeira pergunta não pague a inicialização do modelo"""
+        self.model.encode(["aquecimento"], convert_to_numpy=True)
 
-def search_similar_chunks(query, index, metadata, embedding_model_name, top_k):
-    model = SentenceTransformer(embedding_model_name)
-    query_embedding = model.encode([query], convert_to_numpy=True)
+    @property
+    def dimension(self):
+        """Dimensão dos embeddings do índice"""
+        return self.index.d
+
+    def embed_query(self, query):
+        """Retorna o embedding da pergunta, usando o cache quando possível.
+
+        O texto normalizado é só a chave do cache: o modelo recebe a pergunta
+        original, e a busca não muda com a normalização.
+        """
+        key = normalize_query(query)
+        embedding = self._cache.get(key)
+        if embedding is not None:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return embedding
+
+        self.cache_misses += 1
+        embedding = self.model.encode([query], convert_to_numpy=True)[0].astype(np.float32)
+        if self.cache_size > 0:
+            self._cache[key] = embedding
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return embedding
+
+    def embed_queries(self, queries):
+        """Embeddings de várias perguntas, codificando as ausentes do cache num único lote.
+
+        Perguntas com a mesma chave normalizada usam o embedding da primeira
+        delas (como em embed_query, o modelo recebe o texto original).
+        """
+        keys = [normalize_query(q) for q in queries]
+        # Acertos copiados antes de inserir os novos: com mais perguntas distintas
+        # que cache_size no lote, a remoção abaixo pode descartá-los do cache
+        encontrados = {}
+        faltantes = {}  # chave -> primeira pergunta original com essa chave
+        for key, query in zip(keys, queries):
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                encontrados[key] = self._cache[key]
+                self.cache_hits += 1
+            elif key not in faltantes:
+                faltantes[key] = query
+        self.cache_misses += len(faltantes)
+
+        novos = {}
+        if faltantes:
+            encoded = self.model.encode(list(faltantes.values()), convert_to_numpy=True).astype(np.float32)
+            novos = dict(zip(faltantes, encoded))
+            if self.cache_size > 0:
+                for key, embedding in novos.items():
+                    self._cache[key] = embedding
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        embeddings = [novos[key] if key in novos else encontrados[key] for key in keys]
+        return np.vstack(embeddings).astype(np.float32)
+
+    def chunk_embeddings(self, ids, textos):
+        """Embeddings dos trechos, lidos do índice (ou recalculados, se ele não os reconstrói)"""
+        try:
+            return reconstruct_vectors(self.index, ids)
+        except RuntimeError:
+            return self.model.encode(textos, convert_to_numpy=True).astype(np.float32)
+
+    def search(self, query, top_k, categoria=None, arquivo=None, trace=None):
+        """Retorna os top_k trechos mais similares à pergunta"""
+        return self.search_batch([query], top_k, categoria, arquivo, trace)[0]["trechos"]
+
+    def search_batch(self, queries, top_k, categoria=None, arquivo=None, trace=None,
+                     with_embeddings=False):
+        """Busca várias perguntas com um único encode e um único index.search.
+
+        Retorna, para cada pergunta, um dicionário com os ids, distâncias,
+        trechos e metadados dos top_k resultados. Em índices de produto
+        interno as "distâncias" são similaridades de cosseno (maior é melhor).
+        Na busca híbrida há também as pontuações RRF, e trechos achados só
+        pelo BM25 têm distância None. categoria/arquivo (nome ou lista)
+        restringem a busca aos shards correspondentes. Com um tracing.Trace,
+        o tempo de cada etapa (embedding, FAISS, BM25, leitura dos trechos)
+        é registrado nele, somado sobre o lote. Com with_embeddings=True cada
+        resultado traz também os embeddings dos trechos ("embeddings") e da
+        pergunta ("embedding_pergunta"), para montar o contexto sem recodificar.
+        """
+        if not queries:
+            return []
+        params = mask = None
+        if categoria is not None or arquivo is not None:
+            if self.shards is None:
+                raise ValueError("Filtros por categoria/arquivo exigem shards (vector_index.load_shards)")
+            params = self.shards.search_params(self.index, categoria, arquivo)
+            mask = self.shards.mask(categoria, arquivo)
+
+        profundidade = max(top_k, self.candidates) if self.lexical_index is not None else top_k
+        with stage(trace, "embedding_pergunta"):
+            embeddings_perguntas = self.embed_queries(queries)
+        with stage(trace, "busca_faiss"):
+            query_embeddings = prepare_query_embeddings(self.index, embeddings_perguntas)
+            if self.binary_index is not None:
+                distances, indices = self.binary_index.search(self.index, query_embeddings, profundidade,
+                                                              self.rerank_candidates, params)
+            else:
+                distances, indices = self.index.search(query_embeddings, profundidade, params=params)
+
+        resultados = []
+        for query, embedding_pergunta, dists, ids in zip(queries, embeddings_perguntas, distances, indices):
+            densos = {int(idx): float(d) for idx, d in zip(ids, dists) if idx >= 0}
+            pontuacoes = None
+            if self.lexical_index is None:
+                ids = list(densos)
+            else:
+                with stage(trace, "busca_lexical"):
+                    lexicos, _ = self.lexical_index.search(query, profundidade, mask)
+                    ids, pontuacoes = reciprocal_rank_fusion([list(densos), lexicos], top_k, self.rrf_k)
+            with stage(trace, "leitura_trechos"):
+                metadados = [self.chunks[idx] for idx in ids]
+            resultado = {
+                "ids": ids,
+                "distancias": [densos.get(idx) for idx in ids],
+                "trechos": [m["trecho"] for m in metadados],
+                "metadados": metadados
+            }
+            if pontuacoes is not None:
+                resultado["pontuacoes"] = pontuacoes
+            if with_embeddings:
+                with stage(trace, "leitura_trechos"):
+                    resultado["embeddings"] = self.chunk_embeddings(ids, resultado["trechos"])
+                resultado["embedding_pergunta"] = embedding_pergunta
+            resultados.append(resultado)
+        return resultados
+
+    def cache_stats(self):
+        """Estatísticas do cache de embeddings de perguntas"""
+        total = self.cache_hits + self.cache_misses
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "tamanho": len(self._cache),
+            "taxa_acerto": self.cache_hits / total if total else 0.0
+        }
+
+
+def search_similar_chunks(query, index, chunks, embedding_model_name, top_k):
+    model = get_embedding_model(embedding_model_name)
+    query_embedding = prepare_query_embeddings(index, model.encode([query], convert_to_numpy=True))
     distances, indices = index.search(query_embedding, top_k)
-    trechos = [metadata[idx]["trecho"] for idx in indices[0]]
+    trechos = [chunks[idx]["trecho"] for idx in indices[0] if idx >= 0]
     return trechos
+
+
+def search_similar_chunks_batch(queries, index, chunks, embedding_model_name, top_k):
+    """Versão em lote de search_similar_chunks (ver Retriever.search_batch)"""
+    retriever = Retriever(index, chunks, embedding_model_name, cache_size=0)
+    return retriever.search_batch(queries, top_k)
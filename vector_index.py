@@ -0,0 +1,697 @@
+import os
+import json
+import math
+import time
+import hashlib
+import faiss
+import numpy as np
+from chunk_store import ChunkStore, ChunkStoreWriter
+from utils import (CHUNK_MAX_WORDS, EmbeddingEncoder, get_embedding_model, iter_chunked_files, list_corpus_files,
+                   peak_rss_mb, prepare_query_embeddings, report_ingestion_times)
+
+# Presets de índice. "factory" é uma string do faiss.index_factory; {nlist}
+# é resolvido no momento da construção a partir do tamanho do corpus.
+INDEX_PRESETS = {
+    "flat": {"factory": "Flat"},
+    "ivf_flat": {"factory": "IVF{nlist},Flat", "nprobe": 16},
+    "ivf_pq": {"factory": "IVF{nlist},PQ48", "nprobe": 16},
+    "hnsw": {"factory": "HNSW32,Flat", "ef_search": 64},
+    # Vetores normalizados (cosseno via produto interno) em quantização escalar
+    "sq_fp16": {"factory": "SQfp16", "metric": "ip"},
+    "sq8": {"factory": "SQ8", "metric": "ip"},
+}
+
+DEFAULT_INDEX_CONFIG = {
+    "factory": "Flat",
+    "metric": "l2",
+    "train_size": 50000,  # vetores amostrados para treinar índices IVF/PQ
+    "nprobe": None,       # listas visitadas por consulta (IVF)
+    "ef_search": None,    # largura da busca no grafo (HNSW)
+}
+
+# Fração de ids removidos acima da qual o índice é reconstruído do zero
+MAX_REMOVED_FRACTION = 0.5
+
+# Construção em streaming: trechos por lote (ordenados por tamanho dentro do
+# lote antes de ir ao modelo) e lotes entre checkpoints
+EMBED_BATCH_SIZE = 1024
+CHECKPOINT_EVERY = 10
+
+METRICS = {
+    "l2": faiss.METRIC_L2,
+    "ip": faiss.METRIC_INNER_PRODUCT,
+}
+
+
+def make_index_config(config=None):
+    """Completa uma configuração de índice (dict ou nome de preset) com os padrões"""
+    if config is None:
+        config = {}
+    elif isinstance(config, str):
+        config = INDEX_PRESETS[config]
+    return {**DEFAULT_INDEX_CONFIG, **config}
+
+
+def config_path_for(index_path):
+    """Caminho do arquivo JSON que registra a configuração de um índice"""
+    return os.path.splitext(index_path)[0] + ".json"
+
+
+def resolve_factory(factory, n_vectors):
+    """Substitui {nlist} pela quantidade de listas adequada ao corpus"""
+    # ~4*sqrt(n) listas, com ao menos 39 vetores de treino por lista
+    nlist = int(4 * math.sqrt(max(n_vectors, 1)))
+    nlist = max(1, min(nlist, n_vectors // 39 or 1))
+    return factory.format(nlist=nlist)
+
+
+def apply_search_params(index, config):
+    """Aplica os parâmetros de busca (nprobe/efSearch) ao índice"""
+    params = faiss.ParameterSpace()
+    factory = config.get("factory_resolvida", config["factory"])
+    if config.get("nprobe") and "IVF" in factory:
+        params.set_index_parameter(index, "nprobe", int(config["nprobe"]))
+    if config.get("ef_search") and "HNSW" in factory:
+        params.set_index_parameter(index, "efSearch", int(config["ef_search"]))
+    return index
+
+
+def index_memory_bytes(index):
+    """Tamanho do índice serializado, aproximação da memória que ele ocupa"""
+    return int(faiss.serialize_index(index).size)
+
+
+def prepare_vectors(embeddings, config):
+    """Converte embeddings para o formato armazenado no índice"""
+    embeddings = np.array(embeddings, dtype=np.float32)
+    if config["metric"] == "ip":
+        # Com vetores unitários o produto interno é a similaridade de cosseno
+        faiss.normalize_L2(embeddings)
+    return embeddings
+
+
+def create_index(config, dim, n_vectors):
+    """Cria o índice vazio da configuração para um corpus de n_vectors.
+
+    Os vetores são adicionados com ids explícitos, para que possam ser
+    removidos ou acrescentados por id depois. Índices IVF aceitam ids
+    nativamente; os demais são envolvidos num IndexIDMap2.
+    """
+    factory = resolve_factory(config["factory"], n_vectors)
+    index = faiss.index_factory(dim, factory, METRICS[config["metric"]])
+    if "IVF" not in factory:
+        # O IndexIDMap2 só remove corretamente de índices que compactam em
+        # ordem (Flat, SQ); o IVF remove por id sem renumerar
+        index = faiss.IndexIDMap2(index)
+    return index, factory
+
+
+def train_index(index, vectors, config):
+    """Treina o índice, se necessário, com uma amostra dos vetores já preparados"""
+    if index.is_trained:
+        return
+    train_size = min(len(vectors), config["train_size"])
+    rng = np.random.default_rng(0)
+    amostra = vectors[rng.choice(len(vectors), train_size, replace=False)]
+    print(f"🏋️  Treinando índice com {train_size} vetores...")
+    index.train(amostra)
+
+
+def build_index(embeddings, config=None, ids=None):
+    """Constrói um índice FAISS em memória a partir dos embeddings.
+
+    Os ids padrão são 0..n-1. Retorna o índice e a configuração
+    efetivamente usada, que deve ser salva junto ao índice.
+    """
+    config = make_index_config(config)
+    embeddings = prepare_vectors(embeddings, config)
+    n_vectors, dim = embeddings.shape
+    if ids is None:
+        ids = np.arange(n_vectors, dtype=np.int64)
+
+    index, factory = create_index(config, dim, n_vectors)
+
+    start_time = time.time()
+    train_index(index, embeddings, config)
+    index.add_with_ids(embeddings, np.asarray(ids, dtype=np.int64))
+
+    config = {
+        **config,
+        "factory_resolvida": factory,
+        "dimensao": dim,
+        "total_vetores": int(index.ntotal),
+        "tempo_construcao": time.time() - start_time,
+        "memoria_bytes": index_memory_bytes(index),
+        "criado_em": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    apply_search_params(index, config)
+    return index, config
+
+
+def save_index(index, config, index_path):
+    """Salva o índice e o registro da configuração que o produziu"""
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    faiss.write_index(index, index_path)
+    with open(config_path_for(index_path), "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+
+
+def load_index(index_path):
+    """Carrega o índice e sua configuração (índices antigos são IndexFlatL2)"""
+    index = faiss.read_index(index_path)
+    config_file = config_path_for(index_path)
+    if os.path.exists(config_file):
+        with open(config_file, "r", encoding="utf-8") as f:
+            config = json.load(f)
+    else:
+        config = make_index_config({"factory_resolvida": "Flat"})
+    return index, config
+
+
+def same_structure(saved_config, config):
+    """Indica se o índice salvo foi construído com a mesma estrutura pedida"""
+    return (saved_config.get("factory") == config["factory"]
+            and saved_config.get("metric") == config["metric"])
+
+
+def manifest_path_for(index_path):
+    """Caminho do manifesto de arquivos do corpus de um índice"""
+    return os.path.splitext(index_path)[0] + ".manifest.json"
+
+
+def load_manifest(index_path):
+    """Carrega o manifesto do índice, ou None se ele não existir"""
+    path = manifest_path_for(index_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, index_path):
+    """Salva o manifesto (sem os caminhos absolutos dos arquivos).
+
+    atualizado_em muda a cada construção ou atualização do índice, o que
+    invalida o que foi calculado sobre o índice anterior (ex.: cache semântico).
+    """
+    arquivos = {chave: {k: v for k, v in entrada.items() if k != "caminho"}
+                for chave, entrada in manifest["arquivos"].items()}
+    with open(manifest_path_for(index_path), "w", encoding="utf-8") as f:
+        json.dump({**manifest, "arquivos": arquivos, "atualizado_em": time.time()}, f,
+                  ensure_ascii=False, indent=2)
+
+
+def file_sha256(path):
+    """Hash SHA-256 do conteúdo de um arquivo"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            digest.update(bloco)
+    return digest.hexdigest()
+
+
+def scan_corpus(data_dir, categorias, anteriores=None):
+    """Levanta os arquivos do corpus com tamanho, data e hash do conteúdo.
+
+    O hash só é recalculado quando tamanho ou data de modificação mudaram
+    em relação ao manifesto anterior.
+    """
+    anteriores = anteriores or {}
+    arquivos = {}
+    for categoria, txt_file in list_corpus_files(data_dir, categorias):
+        chave = f"{categoria}/{txt_file.name}"
+        stat = txt_file.stat()
+        anterior = anteriores.get(chave, {})
+        if anterior.get("tamanho") == stat.st_size and anterior.get("mtime") == stat.st_mtime:
+            sha256 = anterior["sha256"]
+        else:
+            sha256 = file_sha256(txt_file)
+        arquivos[chave] = {
+            "categoria": categoria,
+            "arquivo": txt_file.name,
+            "caminho": str(txt_file),
+            "tamanho": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": sha256,
+        }
+    return arquivos
+
+
+def diff_corpus(manifest, atuais):
+    """Compara o corpus atual com o manifesto: (novos, alterados, removidos)"""
+    anteriores = manifest["arquivos"]
+    novos = [chave for chave in atuais if chave not in anteriores]
+    alterados = [chave for chave in atuais
+                 if chave in anteriores and anteriores[chave]["sha256"] != atuais[chave]["sha256"]]
+    removidos = [chave for chave in anteriores if chave not in atuais]
+    return novos, alterados, removidos
+
+
+def _as_set(valor):
+    if valor is None:
+        return None
+    return frozenset([valor] if isinstance(valor, str) else valor)
+
+
+class ShardSelector:
+    """Shards lógicos do índice, por categoria e por obra.
+
+    Cada arquivo do manifesto ocupa um intervalo contíguo de ids [inicio, fim),
+    então um filtro como categoria="teatro" ou arquivo="domCasmurro.txt" é a
+    união dos intervalos dos arquivos correspondentes. Ela vai para o FAISS
+    como IDSelectorBitmap e só os vetores do shard são comparados à pergunta.
+    """
+
+    def __init__(self, manifest):
+        self.id_limit = manifest["next_id"]
+        self.updated_at = manifest.get("atualizado_em")
+        self.arquivos = list(manifest["arquivos"].values())
+        self._filtros = {}
+
+    def categorias(self):
+        """Número de trechos de cada categoria indexada"""
+        contagem = {}
+        for entrada in self.arquivos:
+            contagem[entrada["categoria"]] = (contagem.get(entrada["categoria"], 0)
+                                              + entrada["fim"] - entrada["inicio"])
+        return dict(sorted(contagem.items()))
+
+    def _filtro(self, categoria, arquivo):
+        categorias, arquivos = _as_set(categoria), _as_set(arquivo)
+        filtro = self._filtros.get((categorias, arquivos))
+        if filtro is None:
+            selecionados = [e for e in self.arquivos
+                            if (categorias is None or e["categoria"] in categorias)
+                            and (arquivos is None or e["arquivo"] in arquivos)]
+            if not selecionados:
+                raise ValueError(f"Nenhuma obra indexada corresponde a categoria={categoria!r}, "
+                                 f"arquivo={arquivo!r}")
+            mask = np.zeros(self.id_limit, dtype=bool)
+            for entrada in selecionados:
+                mask[entrada["inicio"]:entrada["fim"]] = True
+            bitmap = np.packbits(mask, bitorder="little")
+            # O seletor guarda só um ponteiro para o bitmap: ambos ficam no cache.
+            # n é o tamanho do bitmap em bytes: ids além dele são rejeitados
+            selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+            filtro = self._filtros[(categorias, arquivos)] = (mask, bitmap, selector)
+        return filtro
+
+    def mask(self, categoria=None, arquivo=None):
+        """Máscara booleana dos ids do shard (None sem filtro)"""
+        if categoria is None and arquivo is None:
+            return None
+        return self._filtro(categoria, arquivo)[0]
+
+    def search_params(self, index, categoria=None, arquivo=None):
+        """Parâmetros de busca do FAISS restritos ao shard (None sem filtro)"""
+        if categoria is None and arquivo is None:
+            return None
+        selector = self._filtro(categoria, arquivo)[2]
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            # Parâmetros explícitos substituem os do índice: mantém o nprobe atual
+            return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+        return faiss.SearchParameters(sel=selector)
+
+
+def load_shards(index_path):
+    """ShardSelector a partir do manifesto do índice"""
+    return ShardSelector(load_manifest(index_path))
+
+
+def iter_chunks(arquivos, chaves, primeiro_id, writer, workers=None):
+    """Divide os arquivos em trechos, gravando-os no chunk store.
+
+    Gera (id, trecho) um arquivo por vez. Registra em cada entrada o
+    intervalo [inicio, fim) de ids que seus trechos recebem e o tempo gasto
+    na divisão.
+    """
+    tempos = []
+    proximo_id = primeiro_id
+    lista = [(arquivos[chave]["categoria"], arquivos[chave]["caminho"]) for chave in chaves]
+    for chave, (_, _, trechos, segundos) in zip(chaves, iter_chunked_files(lista, workers)):
+        entrada = arquivos[chave]
+        entrada["inicio"] = proximo_id
+        for trecho in trechos:
+            writer.add(trecho, entrada["arquivo"], entrada["categoria"])
+            yield proximo_id, trecho
+            proximo_id += 1
+        entrada["fim"] = proximo_id
+        entrada["segundos_divisao"] = round(segundos, 4)
+        tempos.append((chave, segundos, len(trechos)))
+    if tempos:
+        # O tempo total inclui o consumidor (embeddings), então só a soma é informada
+        report_ingestion_times(tempos)
+
+
+def iter_batches(chunks, batch_size, pular=0):
+    """Agrupa (id, trecho) em lotes (ids, textos), ignorando ids < pular"""
+    ids, textos = [], []
+    for idx, trecho in chunks:
+        if idx < pular:
+            continue
+        ids.append(idx)
+        textos.append(trecho)
+        if len(ids) == batch_size:
+            yield np.array(ids, dtype=np.int64), textos
+            ids, textos = [], []
+    if ids:
+        yield np.array(ids, dtype=np.int64), textos
+
+
+class ExactNeighbors:
+    """Vizinhos exatos (L2, float32) de um conjunto fixo de consultas.
+
+    Atualizado lote a lote durante a construção em streaming, permite medir
+    o recall do índice sem manter todos os embeddings em memória.
+    """
+
+    def __init__(self, queries, k=10, distances=None, ids=None):
+        self.queries = np.ascontiguousarray(queries, dtype=np.float32)
+        self.k = k
+        self.distances = (np.full((len(queries), k), np.inf, dtype=np.float32)
+                          if distances is None else distances)
+        self.ids = np.full((len(queries), k), -1, dtype=np.int64) if ids is None else ids
+
+    def update(self, vectors, ids):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        dist = ((self.queries ** 2).sum(1)[:, None] - 2 * self.queries @ vectors.T
+                + (vectors ** 2).sum(1)[None, :])
+        todas_dist = np.hstack([self.distances, dist])
+        todos_ids = np.hstack([self.ids, np.broadcast_to(ids, dist.shape)])
+        melhores = np.argsort(todas_dist, axis=1)[:, :self.k]
+        self.distances = np.take_along_axis(todas_dist, melhores, axis=1)
+        self.ids = np.take_along_axis(todos_ids, melhores, axis=1)
+
+    def recall(self, index):
+        """Recall@k do índice em relação aos vizinhos exatos"""
+        _, encontrados = index.search(prepare_query_embeddings(index, self.queries), self.k)
+        acertos = [len(set(e) & set(v)) for e, v in zip(encontrados, self.ids)]
+        return float(np.mean(acertos)) / self.k
+
+
+class StreamingIndexBuilder:
+    """Acrescenta embeddings ao índice lote a lote.
+
+    Índices que precisam de treino (ou de {nlist}, ou de medição de recall)
+    acumulam os primeiros `train_size` vetores, criam o índice a partir
+    deles e só então passam a receber os lotes diretamente. A memória fica
+    limitada pelo lote e pela amostra de treino, não pelo tamanho do corpus.
+    """
+
+    def __init__(self, config, index=None, track_recall=False, neighbors=None):
+        self.config = config
+        self.index = index
+        self.track_recall = track_recall
+        self.neighbors = neighbors
+        self._pendentes = []
+        self._n_pendentes = 0
+
+    @property
+    def ready(self):
+        """Indica se todo vetor recebido já está no índice (pode salvar checkpoint)"""
+        return self.index is not None and not self._pendentes
+
+    def _needs_sample(self, dim):
+        if self.track_recall or "{nlist}" in self.config["factory"]:
+            return True
+        return not faiss.index_factory(dim, self.config["factory"], METRICS[self.config["metric"]]).is_trained
+
+    def add(self, embeddings, ids):
+        if self.index is not None:
+            self._add(embeddings, ids)
+            return
+        self._pendentes.append((embeddings, ids))
+        self._n_pendentes += len(ids)
+        if self._n_pendentes >= self.config["train_size"] or not self._needs_sample(embeddings.shape[1]):
+            self._start()
+
+    def finish(self):
+        """Cria o índice com o que estiver pendente (corpus menor que a amostra)"""
+        if self.index is None:
+            if not self._pendentes:
+                raise ValueError("Nenhum trecho encontrado para indexar")
+            self._start()
+        return self.index
+
+    def _start(self):
+        embeddings = np.vstack([e for e, _ in self._pendentes])
+        ids = np.concatenate([i for _, i in self._pendentes])
+        self._pendentes, self._n_pendentes = [], 0
+
+        self.index, factory = create_index(self.config, embeddings.shape[1], len(embeddings))
+        self.config.update(factory_resolvida=factory, dimensao=int(embeddings.shape[1]))
+        train_index(self.index, prepare_vectors(embeddings, self.config), self.config)
+        if self.track_recall and self.neighbors is None:
+            rng = np.random.default_rng(1)
+            consultas = embeddings[rng.choice(len(embeddings), min(200, len(embeddings)), replace=False)]
+            self.neighbors = ExactNeighbors(consultas)
+        self._add(embeddings, ids)
+
+    def _add(self, embeddings, ids):
+        self.index.add_with_ids(prepare_vectors(embeddings, self.config), ids)
+        if self.neighbors is not None:
+            self.neighbors.update(embeddings, ids)
+
+
+def checkpoint_path_for(index_path):
+    """Caminho do checkpoint de uma construção em andamento"""
+    return os.path.splitext(index_path)[0] + ".checkpoint"
+
+
+def build_fingerprint(arquivos, embedding_model, config):
+    """Identifica o corpus e a configuração de uma construção, para retomá-la"""
+    conteudo = {
+        "arquivos": [(chave, entrada["sha256"]) for chave, entrada in arquivos.items()],
+        "embedding_model": embedding_model,
+        "chunking": {"max_words": CHUNK_MAX_WORDS},
+        "estrutura": [config["factory"], config["metric"], config["train_size"]],
+    }
+    return hashlib.sha256(json.dumps(conteudo).encode("utf-8")).hexdigest()
+
+
+def save_checkpoint(index_path, builder, fingerprint, embedados):
+    """Salva o índice parcial e quantos trechos já foram embedados"""
+    base = checkpoint_path_for(index_path)
+    os.makedirs(os.path.dirname(base) or ".", exist_ok=True)
+    faiss.write_index(builder.index, base + ".bin.tmp")
+    os.replace(base + ".bin.tmp", base + ".bin")
+    if builder.neighbors is not None:
+        np.savez(base + ".tmp.npz", consultas=builder.neighbors.queries,
+                 distancias=builder.neighbors.distances, ids=builder.neighbors.ids)
+        os.replace(base + ".tmp.npz", base + ".npz")
+    with open(base + ".json.tmp", "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint, "embedados": embedados, "config": builder.config}, f)
+    os.replace(base + ".json.tmp", base + ".json")
+
+
+def load_checkpoint(index_path, fingerprint):
+    """Carrega o checkpoint da mesma construção, ou None"""
+    base = checkpoint_path_for(index_path)
+    if not (os.path.exists(base + ".json") and os.path.exists(base + ".bin")):
+        return None
+    with open(base + ".json", "r", encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if checkpoint["fingerprint"] != fingerprint:
+        print("⚠️  Checkpoint de outra construção (corpus ou configuração mudaram). Ignorando...")
+        clear_checkpoint(index_path)
+        return None
+    checkpoint["index"] = faiss.read_index(base + ".bin")
+    checkpoint["neighbors"] = None
+    if os.path.exists(base + ".npz"):
+        dados = np.load(base + ".npz")
+        checkpoint["neighbors"] = ExactNeighbors(dados["consultas"], distances=dados["distancias"],
+                                                 ids=dados["ids"])
+    return checkpoint
+
+
+def clear_checkpoint(index_path):
+    """Remove os arquivos de checkpoint"""
+    base = checkpoint_path_for(index_path)
+    for sufixo in (".json", ".bin", ".npz"):
+        if os.path.exists(base + sufixo):
+            os.remove(base + sufixo)
+
+
+def new_manifest(embedding_model, arquivos, next_id):
+    """Manifesto com os parâmetros que, se mudarem, exigem reconstrução total"""
+    return {
+        "embedding_model": embedding_model,
+        "chunking": {"max_words": CHUNK_MAX_WORDS},
+        "next_id": next_id,
+        "arquivos": arquivos,
+    }
+
+
+def build_full_index(data_dir, categorias, embedding_model, index_path, chunks_path, config,
+                     workers=None, embed_workers=1, batch_size=EMBED_BATCH_SIZE):
+    """Constrói o índice, o chunk store e o manifesto do zero, em streaming.
+
+    Os trechos são embedados em lotes de batch_size e acrescentados ao
+    índice à medida que são lidos. A cada CHECKPOINT_EVERY lotes o índice
+    parcial vai para o disco; se a construção for interrompida, a próxima
+    execução retoma a partir do último checkpoint (só a divisão em trechos,
+    que é barata, é refeita).
+    """
+    print("\n🔧 Construindo índice FAISS...")
+    config = make_index_config(config)
+    arquivos = scan_corpus(data_dir, categorias)
+    fingerprint = build_fingerprint(arquivos, embedding_model, config)
+    track_recall = config["factory"] != "Flat" or config["metric"] != "l2"
+
+    checkpoint = load_checkpoint(index_path, fingerprint)
+    if checkpoint:
+        print(f"⏩ Retomando construção a partir do trecho {checkpoint['embedados']}")
+        builder = StreamingIndexBuilder(checkpoint["config"], checkpoint["index"], track_recall,
+                                        checkpoint["neighbors"])
+        inicio = checkpoint["embedados"]
+    else:
+        builder = StreamingIndexBuilder(config, track_recall=track_recall)
+        inicio = 0
+
+    encoder = EmbeddingEncoder(get_embedding_model(embedding_model), workers=embed_workers)
+    start_time = time.time()
+    embedados = inicio
+    print(f"🔍 Gerando embeddings em lotes de {batch_size} ({embed_workers} processo(s))...")
+    with encoder, ChunkStoreWriter(chunks_path) as writer:
+        chunks = iter_chunks(arquivos, list(arquivos), 0, writer, workers)
+        for lote, (ids, textos) in enumerate(iter_batches(chunks, batch_size, pular=inicio), 1):
+            builder.add(encoder.encode(textos), ids)
+            embedados += len(ids)
+            if lote % CHECKPOINT_EVERY == 0 and builder.ready:
+                save_checkpoint(index_path, builder, fingerprint, embedados)
+                taxa = (embedados - inicio) / (time.time() - start_time)
+                print(f"   💾 Checkpoint: {embedados} trechos ({taxa:.0f} trechos/s)")
+        next_id = len(writer)
+
+    index = builder.finish()
+    config = builder.config
+    config.update(total_vetores=int(index.ntotal), tempo_construcao=time.time() - start_time,
+                  trechos_por_segundo=encoder.chunks_per_second,
+                  memoria_bytes=index_memory_bytes(index), pico_memoria_mb=peak_rss_mb(),
+                  criado_em=time.strftime("%Y-%m-%d %H:%M:%S"))
+    apply_search_params(index, config)
+
+    print(f"✅ Índice {config['factory_resolvida']} com {config['total_vetores']} vetores "
+          f"construído em {config['tempo_construcao']:.1f}s")
+    print(f"   💾 Memória: {config['memoria_bytes'] / 1024**2:.1f} MB "
+          f"({config['memoria_bytes'] / max(config['total_vetores'], 1):.0f} bytes/vetor, "
+          f"float32 plano: {config['total_vetores'] * config['dimensao'] * 4 / 1024**2:.1f} MB)")
+    print(f"   ⚡ Embeddings: {encoder.chunks_per_second:.1f} trechos/s")
+    if config["pico_memoria_mb"]:
+        print(f"   📈 Pico de memória do processo: {config['pico_memoria_mb']:.0f} MB")
+    if builder.neighbors is not None:
+        config["recall_vs_float32"] = builder.neighbors.recall(index)
+        print(f"   🎯 Recall@10 vs IndexFlatL2 float32: {config['recall_vs_float32']:.3f}")
+
+    save_index(index, config, index_path)
+    save_manifest(new_manifest(embedding_model, arquivos, next_id), index_path)
+    clear_checkpoint(index_path)
+    return index, ChunkStore(chunks_path)
+
+
+def update_index(index, config, manifest, arquivos, alteracoes, embedding_model,
+                 index_path, chunks_path, workers=None, embed_workers=1,
+                 batch_size=EMBED_BATCH_SIZE):
+    """Atualiza o índice só com os arquivos novos, alterados ou removidos.
+
+    Os vetores dos arquivos alterados/removidos saem do índice; os trechos
+    dos arquivos novos/alterados são re-embedados em lotes e recebem ids a
+    partir de next_id. O chunk store é regravado copiando o texto dos
+    demais arquivos.
+    """
+    novos, alterados, removidos = alteracoes
+    anteriores = manifest["arquivos"]
+    start_time = time.time()
+
+    for chave in alterados + removidos:
+        entrada = anteriores[chave]
+        index.remove_ids(faiss.IDSelectorRange(entrada["inicio"], entrada["fim"]))
+
+    # Arquivos inalterados mantêm seus ids
+    mantidos = {(anteriores[c]["arquivo"], anteriores[c]["categoria"])
+                for c in arquivos if c in anteriores and c not in alterados}
+    for chave in arquivos:
+        if chave in anteriores and chave not in alterados:
+            arquivos[chave].update(inicio=anteriores[chave]["inicio"], fim=anteriores[chave]["fim"])
+
+    antigo = ChunkStore(chunks_path)
+    next_id = manifest["next_id"]
+    builder = StreamingIndexBuilder(config, index)
+    encoder = EmbeddingEncoder(get_embedding_model(embedding_model), workers=embed_workers)
+    embedados = 0
+    with encoder, ChunkStoreWriter(chunks_path) as writer:
+        for idx in range(next_id):
+            try:
+                origem = antigo.source(idx)
+            except KeyError:
+                origem = None
+            if origem in mantidos:
+                writer.add(antigo.text(idx), *origem)
+            else:
+                writer.add_removed()
+        chunks = iter_chunks(arquivos, novos + alterados, next_id, writer, workers)
+        for ids, textos in iter_batches(chunks, batch_size):
+            builder.add(encoder.encode(textos), ids)
+            embedados += len(ids)
+    antigo.close()
+
+    config.update(total_vetores=int(index.ntotal), memoria_bytes=index_memory_bytes(index),
+                  atualizado_em=time.strftime("%Y-%m-%d %H:%M:%S"))
+    save_index(index, config, index_path)
+    save_manifest({**manifest, "next_id": next_id + embedados, "arquivos": arquivos}, index_path)
+
+    print(f"✅ Índice atualizado em {time.time() - start_time:.1f}s: "
+          f"{len(novos)} novos, {len(alterados)} alterados, {len(removidos)} removidos "
+          f"({embedados} trechos embedados)")
+    return index, ChunkStore(chunks_path)
+
+
+def load_or_create_index(data_dir, categorias, embedding_model, index_path,
+                         chunks_path, index_config=None, workers=None, embed_workers=1):
+    """Carrega, atualiza ou cria o índice FAISS para RAG.
+
+    Retorna o índice e o ChunkStore com o texto completo de cada trecho,
+    indexado pelo id do FAISS. Se só alguns arquivos do corpus mudaram,
+    apenas eles são re-embedados (ver update_index). categorias=None lê
+    todas as categorias do corpus; workers controla a leitura paralela e
+    embed_workers o número de processos que geram embeddings.
+    """
+    config = make_index_config(index_config)
+    manifest = load_manifest(index_path)
+
+    if os.path.exists(index_path) and os.path.exists(chunks_path) and manifest:
+        index, saved_config = load_index(index_path)
+        compativel = (manifest["embedding_model"] == embedding_model
+                      and manifest["chunking"] == {"max_words": CHUNK_MAX_WORDS})
+        if same_structure(saved_config, config) and compativel:
+            # Parâmetros de busca podem mudar sem reconstruir o índice
+            saved_config.update(nprobe=config["nprobe"], ef_search=config["ef_search"])
+            apply_search_params(index, saved_config)
+
+            arquivos = scan_corpus(data_dir, categorias, manifest["arquivos"])
+            novos, alterados, removidos = diff_corpus(manifest, arquivos)
+            if not (novos or alterados or removidos):
+                print(f"\n✅ Índice FAISS encontrado ({saved_config['factory_resolvida']}). Carregando...")
+                return index, ChunkStore(chunks_path)
+
+            # Muitos ids removidos: mais barato reconstruir do que acumular buracos
+            descartados = sum(manifest["arquivos"][c]["fim"] - manifest["arquivos"][c]["inicio"]
+                              for c in alterados + removidos)
+            if (manifest["next_id"] - index.ntotal + descartados) <= MAX_REMOVED_FRACTION * manifest["next_id"]:
+                print("\n🔄 Corpus alterado. Atualizando índice FAISS...")
+                try:
+                    return update_index(index, saved_config, manifest, arquivos,
+                                        (novos, alterados, removidos), embedding_model,
+                                        index_path, chunks_path, workers, embed_workers)
+                except RuntimeError as e:
+                    # Ex.: HNSW não permite remover vetores
+                    print(f"⚠️  Atualização incremental não suportada ({e}). Reconstruindo...")
+        elif not compativel:
+            print("\n♻️  Modelo de embeddings ou divisão em trechos mudou. Reconstruindo...")
+        else:
+            print(f"\n♻️  Índice salvo usa {saved_config.get('factory')}, "
+                  f"mas a configuração pede {config['factory']}. Reconstruindo...")
+
+    return build_full_index(data_dir, categorias, embedding_model, index_path, chunks_path, config,
+                            workers, embed_workers)